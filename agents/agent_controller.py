@@ -1,33 +1,160 @@
 from agents import (
     GuardAgent,
     ClassificationAgent,
+    GuardRoutingAgent,
     DetailsAgent,
     AgentProtocol,
     RecommendationAgent,
     OrderTakingAgent,
 )
-import pathlib
+from agents.metrics import count_route
+from agents.llm_clients import awarm_up
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import asyncio
+import contextvars
+import queue
+import threading
 import os
 
-folder_path = pathlib.Path(__file__).parent.resolve()
+# "sequential" runs guard -> classification -> agent one after another.
+# "parallel" fires guard and classification together and starts the routed
+# agent speculatively, discarding its work if the guard rejects the turn.
+# "fused" gets the guard verdict and the routing decision from one
+# structured call, then runs the agent.
+PIPELINE_MODE = os.getenv("AGENT_PIPELINE_MODE", "sequential")
+PIPELINE_WORKERS = int(os.getenv("AGENT_PIPELINE_WORKERS", 32))
+
+_STREAM_END = object()
 
 
 class AgentController:
-    def __init__(self):
-        self.guard_agent = GuardAgent()
-        self.classification_agent = ClassificationAgent()
-        self.recommendation_agent = RecommendationAgent(
-            os.path.join(folder_path, "data/apriori_recommendations.json"),
-            os.path.join(folder_path, "data/popularity_recommendation.csv"),
+    def __init__(
+        self, llm=None, pipeline_mode=None, embeddings=None, vector_index=None
+    ):
+        self.pipeline_mode = pipeline_mode or PIPELINE_MODE
+        self.executor = ThreadPoolExecutor(
+            max_workers=PIPELINE_WORKERS, thread_name_prefix="agent-pipeline"
+        )
+
+        self.guard_agent = GuardAgent(llm)
+        self.classification_agent = ClassificationAgent(llm)
+        self.guard_routing_agent = GuardRoutingAgent(
+            self.guard_agent, self.classification_agent, llm
         )
+        self.recommendation_agent = RecommendationAgent(llm=llm)
 
         self.agent_dict: dict[str, AgentProtocol] = {
-            "details_agent": DetailsAgent(),
+            "details_agent": DetailsAgent(llm, embeddings, vector_index),
             "recommendation_agent": self.recommendation_agent,
-            "order_taking_agent": OrderTakingAgent(self.recommendation_agent),
+            "order_taking_agent": OrderTakingAgent(
+                self.recommendation_agent,
+                llm,
+                catalog=self.recommendation_agent.catalog,
+            ),
         }
 
+    async def awarm_up(self):
+        """Open pooled model API connections before the first turn.
+
+        Every agent shares one connection pool, so warming the guard's
+        model warms them all.
+        """
+        return await awarm_up(self.guard_agent.llm)
+
     def get_response(self, messages):
+        response = self._get_response(messages)
+        count_route(response.get("memory"))
+        return response
+
+    def get_stream(self, messages):
+        for event in self._get_stream(messages):
+            if event["type"] == "memory":
+                count_route(event["content"])
+            yield event
+
+    async def aget_response(self, messages):
+        response = await self._aget_response(messages)
+        count_route(response.get("memory"))
+        return response
+
+    async def aget_stream(self, messages):
+        async for event in self._aget_stream(messages):
+            if event["type"] == "memory":
+                count_route(event["content"])
+            yield event
+
+    def cache_stats(self):
+        """Hits and misses of every cache and fast path, by name."""
+        stats = {}
+        for name, agent in (
+            ("guard_decisions", self.guard_agent),
+            ("routing_decisions", self.classification_agent),
+            ("guard_routing_decisions", self.guard_routing_agent),
+        ):
+            if agent.decision_cache is not None:
+                cache = agent.decision_cache.stats()
+                stats[name] = {"hits": cache["hits"], "misses": cache["misses"]}
+
+        prefilter = self.guard_agent.prefilter
+        if prefilter is not None:
+            stats["guard_prefilter"] = {
+                "hits": prefilter.hits,
+                "misses": prefilter.checks - prefilter.hits,
+            }
+        stats["local_router"] = {"hits": self.classification_agent.router_hits}
+        stats["sticky_routing"] = {"hits": self.classification_agent.sticky_hits}
+
+        embeddings = self.agent_dict["details_agent"].embeddings
+        if hasattr(embeddings, "stats"):
+            cache = embeddings.stats()
+            stats["embeddings"] = {
+                "hits": cache["hits"] + cache["disk_hits"],
+                "misses": cache["misses"],
+            }
+
+        summaries = {"hits": 0, "misses": 0}
+        policies = {}
+        for agent in (self.classification_agent, *self.agent_dict.values()):
+            policy = getattr(agent, "context_policy", None)
+            if policy is not None:
+                policies[id(policy)] = policy
+        for policy in policies.values():
+            policy_stats = policy.stats()
+            summaries["hits"] += policy_stats["summary_hits"]
+            summaries["misses"] += policy_stats["summaries_built"]
+        stats["context_summaries"] = summaries
+
+        responses = {"hits": 0, "misses": 0}
+        coalesced = {"hits": 0, "misses": 0}
+        flights = [
+            self.guard_agent.flights,
+            self.classification_agent.flights,
+            self.guard_routing_agent.flights,
+            self.recommendation_agent.classification_flights,
+        ]
+        for agent in self.agent_dict.values():
+            completions = getattr(agent, "completions", None)
+            if completions is None:
+                continue
+            flights.append(completions.flights)
+            if completions.cache is not None:
+                cache = completions.cache.stats()
+                responses["hits"] += cache["hits"]
+                responses["misses"] += cache["misses"]
+        for flight in flights:
+            # A hit is a call shared with a concurrent identical one.
+            coalesced["hits"] += flight.shared
+            coalesced["misses"] += flight.calls
+        stats["responses"] = responses
+        stats["coalesced_calls"] = coalesced
+        return stats
+
+    def _get_response(self, messages):
+        if self.pipeline_mode == "parallel":
+            return self._get_response_parallel(messages)
+        if self.pipeline_mode == "fused":
+            return self._get_response_fused(messages)
+
         # Get response from guard agent
         response = self.guard_agent.get_response(messages)
         if response["memory"]["decision"] == "not allowed":
@@ -42,12 +169,18 @@ class AgentController:
         agent_response = agent.get_response(messages)
         return agent_response
 
-    def get_stream(self, messages):
+    def _get_stream(self, messages):
+        if self.pipeline_mode == "parallel":
+            yield from self._get_stream_parallel(messages)
+            return
+        if self.pipeline_mode == "fused":
+            yield from self._get_stream_fused(messages)
+            return
+
         # Guard and classification run synchronously (structured output)
         response = self.guard_agent.get_response(messages)
         if response["memory"]["decision"] == "not allowed":
-            yield {"type": "token", "content": response["content"]}
-            yield {"type": "memory", "content": response["memory"]}
+            yield from self._guard_rejection_events(response)
             return
 
         classification_response = self.classification_agent.get_response(messages)
@@ -55,3 +188,309 @@ class AgentController:
 
         agent = self.agent_dict[chosen_agent]
         yield from agent.get_stream(messages)
+
+    async def _aget_response(self, messages):
+        if self.pipeline_mode == "parallel":
+            return await self._aget_response_parallel(messages)
+        if self.pipeline_mode == "fused":
+            return await self._aget_response_fused(messages)
+
+        response = await self.guard_agent.aget_response(messages)
+        if response["memory"]["decision"] == "not allowed":
+            return response
+
+        classification_response = await self.classification_agent.aget_response(
+            messages
+        )
+        chosen_agent = classification_response["memory"]["decision"]
+
+        agent = self.agent_dict[chosen_agent]
+        return await agent.aget_response(messages)
+
+    async def _aget_stream(self, messages):
+        if self.pipeline_mode == "parallel":
+            async for event in self._aget_stream_parallel(messages):
+                yield event
+            return
+        if self.pipeline_mode == "fused":
+            async for event in self._aget_stream_fused(messages):
+                yield event
+            return
+
+        response = await self.guard_agent.aget_response(messages)
+        if response["memory"]["decision"] == "not allowed":
+            for event in self._guard_rejection_events(response):
+                yield event
+            return
+
+        classification_response = await self.classification_agent.aget_response(
+            messages
+        )
+        chosen_agent = classification_response["memory"]["decision"]
+
+        agent = self.agent_dict[chosen_agent]
+        async for event in agent.aget_stream(messages):
+            yield event
+
+    def _guard_rejection_events(self, response):
+        yield {"type": "token", "content": response["content"]}
+        yield {"type": "memory", "content": response["memory"]}
+
+    def _get_response_fused(self, messages):
+        response, classification_response = self.guard_routing_agent.decide(messages)
+        if classification_response is None:
+            return response
+
+        chosen_agent = classification_response["memory"]["decision"]
+        agent = self.agent_dict[chosen_agent]
+        return agent.get_response(messages)
+
+    def _get_stream_fused(self, messages):
+        response, classification_response = self.guard_routing_agent.decide(messages)
+        if classification_response is None:
+            yield from self._guard_rejection_events(response)
+            return
+
+        chosen_agent = classification_response["memory"]["decision"]
+        agent = self.agent_dict[chosen_agent]
+        yield from agent.get_stream(messages)
+
+    async def _aget_response_fused(self, messages):
+        response, classification_response = await self.guard_routing_agent.adecide(
+            messages
+        )
+        if classification_response is None:
+            return response
+
+        chosen_agent = classification_response["memory"]["decision"]
+        agent = self.agent_dict[chosen_agent]
+        return await agent.aget_response(messages)
+
+    async def _aget_stream_fused(self, messages):
+        response, classification_response = await self.guard_routing_agent.adecide(
+            messages
+        )
+        if classification_response is None:
+            for event in self._guard_rejection_events(response):
+                yield event
+            return
+
+        chosen_agent = classification_response["memory"]["decision"]
+        agent = self.agent_dict[chosen_agent]
+        async for event in agent.aget_stream(messages):
+            yield event
+
+    def _start_guard_and_classification(self, messages):
+        guard_future = _submit(self.executor, self.guard_agent.get_response, messages)
+        classification_future = _submit(
+            self.executor, self.classification_agent.get_response, messages
+        )
+        return guard_future, classification_future
+
+    def _get_response_parallel(self, messages):
+        guard_future, classification_future = self._start_guard_and_classification(
+            messages
+        )
+
+        # Whichever finishes first decides what happens next: an early guard
+        # rejection skips routing entirely, an early routing decision starts
+        # the chosen agent while the guard is still thinking. The early start
+        # streams, so a rejection can stop the agent's model call midway.
+        wait([guard_future, classification_future], return_when=FIRST_COMPLETED)
+        speculative = None
+        if classification_future.done() and not guard_future.done():
+            speculative = self._start_routed_stream(classification_future, messages)
+
+        response = guard_future.result()
+        if response["memory"]["decision"] == "not allowed":
+            classification_future.cancel()
+            if speculative is not None:
+                speculative.cancel()
+            return response
+
+        if speculative is None:
+            return self._submit_routed_agent(classification_future, messages).result()
+        try:
+            return _collect_response(speculative)
+        finally:
+            speculative.cancel()
+
+    def _submit_routed_agent(self, classification_future, messages):
+        classification_response = classification_future.result()
+        chosen_agent = classification_response["memory"]["decision"]
+        agent = self.agent_dict[chosen_agent]
+        return _submit(self.executor, agent.get_response, messages)
+
+    def _get_stream_parallel(self, messages):
+        guard_future, classification_future = self._start_guard_and_classification(
+            messages
+        )
+
+        wait([guard_future, classification_future], return_when=FIRST_COMPLETED)
+        speculative = None
+        if classification_future.done() and not guard_future.done():
+            speculative = self._start_routed_stream(classification_future, messages)
+
+        response = guard_future.result()
+        if response["memory"]["decision"] == "not allowed":
+            classification_future.cancel()
+            if speculative is not None:
+                speculative.cancel()
+            yield from self._guard_rejection_events(response)
+            return
+
+        if speculative is None:
+            speculative = self._start_routed_stream(classification_future, messages)
+        try:
+            yield from speculative
+        finally:
+            speculative.cancel()
+
+    def _start_routed_stream(self, classification_future, messages):
+        classification_response = classification_future.result()
+        chosen_agent = classification_response["memory"]["decision"]
+        agent = self.agent_dict[chosen_agent]
+        return _BufferedStream(self.executor, agent.get_stream, messages)
+
+    async def _aget_response_parallel(self, messages):
+        guard_task = asyncio.create_task(self.guard_agent.aget_response(messages))
+        agent_task = asyncio.create_task(self._arun_routed_agent(messages))
+        try:
+            response = await guard_task
+            if response["memory"]["decision"] == "not allowed":
+                return response
+            return await agent_task
+        finally:
+            _cancel_tasks(guard_task, agent_task)
+
+    async def _arun_routed_agent(self, messages):
+        classification_response = await self.classification_agent.aget_response(
+            messages
+        )
+        chosen_agent = classification_response["memory"]["decision"]
+        agent = self.agent_dict[chosen_agent]
+        return await agent.aget_response(messages)
+
+    async def _aget_stream_parallel(self, messages):
+        guard_task = asyncio.create_task(self.guard_agent.aget_response(messages))
+        speculative = _AsyncBufferedStream(self._arouted_stream(messages))
+        try:
+            response = await guard_task
+            if response["memory"]["decision"] == "not allowed":
+                for event in self._guard_rejection_events(response):
+                    yield event
+                return
+            async for event in speculative:
+                yield event
+        finally:
+            _cancel_tasks(guard_task)
+            speculative.cancel()
+
+    async def _arouted_stream(self, messages):
+        classification_response = await self.classification_agent.aget_response(
+            messages
+        )
+        chosen_agent = classification_response["memory"]["decision"]
+        agent = self.agent_dict[chosen_agent]
+        async for event in agent.aget_stream(messages):
+            yield event
+
+
+def _submit(executor, fn, *args):
+    """``executor.submit`` running ``fn`` in a copy of the caller's context.
+
+    Per-request state such as token usage tracking then follows the work
+    into the pipeline thread.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _collect_response(events):
+    """The agent response a stream of token and memory events adds up to."""
+    content = []
+    memory = None
+    for event in events:
+        if event["type"] == "token":
+            content.append(event["content"])
+        elif event["type"] == "memory":
+            memory = event["content"]
+    return {"role": "assistant", "content": "".join(content), "memory": memory}
+
+
+def _cancel_tasks(*tasks):
+    """Cancel pipeline tasks whose result is no longer needed."""
+    for task in tasks:
+        task.cancel()
+        # Retrieve the outcome so discarded failures are not logged as
+        # "exception was never retrieved".
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+class _BufferedStream:
+    """Runs an agent stream on the pipeline executor, buffering its events.
+
+    Events produced before the guard verdict are held in the queue and only
+    replayed once the turn is allowed. ``cancel`` stops the producer at the
+    next event and closes the underlying generator, which also closes the
+    LLM's HTTP stream.
+    """
+
+    def __init__(self, executor, stream_fn, messages):
+        self._events = queue.Queue()
+        self._cancelled = threading.Event()
+        self._future = _submit(executor, self._produce, stream_fn, messages)
+
+    def _produce(self, stream_fn, messages):
+        stream = stream_fn(messages)
+        try:
+            for event in stream:
+                if self._cancelled.is_set():
+                    return
+                self._events.put(event)
+        except BaseException as e:
+            self._events.put(e)
+        finally:
+            stream.close()
+            self._events.put(_STREAM_END)
+
+    def cancel(self):
+        self._cancelled.set()
+        self._future.cancel()
+
+    def __iter__(self):
+        while True:
+            event = self._events.get()
+            if event is _STREAM_END:
+                return
+            if isinstance(event, BaseException):
+                raise event
+            yield event
+
+
+class _AsyncBufferedStream:
+    """Async counterpart of ``_BufferedStream`` built on an asyncio task."""
+
+    def __init__(self, stream):
+        self._events = asyncio.Queue()
+        self._task = asyncio.create_task(self._produce(stream))
+
+    async def _produce(self, stream):
+        try:
+            async for event in stream:
+                self._events.put_nowait(event)
+        except Exception as e:
+            self._events.put_nowait(e)
+        finally:
+            self._events.put_nowait(_STREAM_END)
+
+    def cancel(self):
+        _cancel_tasks(self._task)
+
+    async def __aiter__(self):
+        while True:
+            event = await self._events.get()
+            if event is _STREAM_END:
+                return
+            if isinstance(event, BaseException):
+                raise event
+            yield event
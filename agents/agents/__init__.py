@@ -1,6 +1,24 @@
-from .guard_agent import GuardAgent
-from .classification_agent import ClassificationAgent
-from .details_agent import DetailsAgent
-from .agent_protocol import AgentProtocol
-from .recommendation_agent import RecommendationAgent
-from .order_taking_agent import OrderTakingAgent
+import importlib
+
+# Agents are imported on first access, so importing a light module such as
+# ``agents.metrics`` does not pull in langchain, pymongo and numpy.
+_EXPORTS = {
+    "GuardAgent": ".guard_agent",
+    "ClassificationAgent": ".classification_agent",
+    "GuardRoutingAgent": ".guard_routing_agent",
+    "DetailsAgent": ".details_agent",
+    "AgentProtocol": ".agent_protocol",
+    "RecommendationAgent": ".recommendation_agent",
+    "OrderTakingAgent": ".order_taking_agent",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
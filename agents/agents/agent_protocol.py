@@ -1,6 +1,16 @@
-from typing import Protocol, List, Dict, Any
+from typing import Protocol, List, Dict, Any, AsyncGenerator, Generator
 from .types import AgentMessage
 
 
 class AgentProtocol(Protocol):
+    # Whether the answer is a function of the prompt sent to the model alone,
+    # so equal prompts may be served from the response cache.
+    cacheable: bool
+
     def get_response(self, messages: List[Dict[str, Any]]) -> AgentMessage: ...
+
+    def get_stream(self, messages: List[Dict[str, Any]]) -> Generator: ...
+
+    async def aget_response(self, messages: List[Dict[str, Any]]) -> AgentMessage: ...
+
+    def aget_stream(self, messages: List[Dict[str, Any]]) -> AsyncGenerator: ...
@@ -0,0 +1,449 @@
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Rows handed to the vectorized counter at a time.
+CHUNK_ROWS = 500_000
+# Files larger than this are split into byte ranges counted in parallel.
+SPLIT_BYTES = 64 * 1024 * 1024
+
+TRANSACTION_COLUMN = "transaction_id"
+PRODUCT_COLUMN = "product"
+CATEGORY_COLUMN = "product_category"
+
+
+def _dedupe_sorted(groups: np.ndarray, items: np.ndarray):
+    """Sort ``(group, item)`` pairs and drop repeats within a group."""
+    order = np.lexsort((items, groups))
+    groups = groups[order]
+    items = items[order]
+    keep = np.ones(len(items), dtype=bool)
+    keep[1:] = (groups[1:] != groups[:-1]) | (items[1:] != items[:-1])
+    return groups[keep], items[keep]
+
+
+def pair_counts(groups: np.ndarray, items: np.ndarray, size: int) -> np.ndarray:
+    """Symmetric ``size`` x ``size`` co-occurrence counts of items per group.
+
+    ``groups`` and ``items`` must be sorted by group with no repeated item
+    within a group (see ``_dedupe_sorted``). Every unordered pair inside a
+    group is enumerated with array arithmetic and tallied by ``bincount``,
+    so no basket-by-product matrix is ever materialized.
+    """
+    n = len(items)
+    counts = np.zeros((size, size), dtype=np.int64)
+    if n < 2:
+        return counts
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    lengths = np.diff(np.r_[starts, n])
+    # Rows after each row in its own group.
+    after = np.repeat(starts + lengths, lengths) - np.arange(n) - 1
+    total = int(after.sum())
+    if total == 0:
+        return counts
+    first = np.repeat(np.arange(n), after)
+    offsets = np.arange(total) - np.repeat(np.cumsum(after) - after, after)
+    second = first + 1 + offsets
+    upper = np.bincount(
+        items[first].astype(np.int64) * size + items[second], minlength=size * size
+    ).reshape(size, size)
+    return upper + upper.T
+
+
+class BasketCounts:
+    """Additive transaction statistics for association-rule mining.
+
+    Holds how many transactions contain each product and each category and
+    each pair of them. Support, confidence and lift are ratios of these
+    counts, so counts from separate files, processes or days are combined
+    by addition and rules never need a pass over old transactions.
+    """
+
+    def __init__(self):
+        self.products: List[str] = []
+        self.categories: List[str] = []
+        self.product_category: List[int] = []
+        self._product_ids: Dict[str, int] = {}
+        self._category_ids: Dict[str, int] = {}
+
+        self.transactions = 0
+        self.item_counts = np.zeros(0, dtype=np.int64)
+        self.pair_counts = np.zeros((0, 0), dtype=np.int64)
+        self.category_counts = np.zeros(0, dtype=np.int64)
+        self.category_pair_counts = np.zeros((0, 0), dtype=np.int64)
+        # Input files already counted, keyed by path, with their fingerprint.
+        self.sources: Dict[str, str] = {}
+
+    def product_id(self, product: str, category: Optional[str]) -> int:
+        product_id = self._product_ids.get(product)
+        if product_id is None:
+            product_id = self._product_ids[product] = len(self.products)
+            self.products.append(product)
+            self.product_category.append(self.category_id(category or "Other"))
+        return product_id
+
+    def category_id(self, category: str) -> int:
+        category_id = self._category_ids.get(category)
+        if category_id is None:
+            category_id = self._category_ids[category] = len(self.categories)
+            self.categories.append(category)
+        return category_id
+
+    def _grow(self):
+        self.item_counts = _resize(self.item_counts, len(self.products))
+        self.pair_counts = _resize(self.pair_counts, len(self.products))
+        self.category_counts = _resize(self.category_counts, len(self.categories))
+        self.category_pair_counts = _resize(
+            self.category_pair_counts, len(self.categories)
+        )
+
+    def add_baskets(self, transactions: np.ndarray, products: np.ndarray):
+        """Count baskets given as parallel arrays of transaction index and product id.
+
+        Transaction indexes only need to be unique within the call.
+        """
+        self._grow()
+        if len(products) == 0:
+            return
+        transactions, products = _dedupe_sorted(
+            np.asarray(transactions), np.asarray(products, dtype=np.int64)
+        )
+        self.transactions += int(
+            np.count_nonzero(np.r_[True, transactions[1:] != transactions[:-1]])
+        )
+        size = len(self.products)
+        self.item_counts += np.bincount(products, minlength=size)
+        self.pair_counts += pair_counts(transactions, products, size)
+
+        categories = np.asarray(self.product_category, dtype=np.int64)[products]
+        transactions, categories = _dedupe_sorted(transactions, categories)
+        size = len(self.categories)
+        self.category_counts += np.bincount(categories, minlength=size)
+        self.category_pair_counts += pair_counts(transactions, categories, size)
+
+    def merge(self, other: "BasketCounts"):
+        """Add ``other``'s counts, aligning products and categories by name."""
+        product_map = np.array(
+            [
+                self.product_id(product, other.categories[category])
+                for product, category in zip(other.products, other.product_category)
+            ],
+            dtype=np.int64,
+        )
+        category_map = np.array(
+            [self.category_id(category) for category in other.categories],
+            dtype=np.int64,
+        )
+        self._grow()
+        self.transactions += other.transactions
+        # The maps are injective, so plain fancy-index addition is safe.
+        if len(product_map):
+            self.item_counts[product_map] += other.item_counts
+            self.pair_counts[np.ix_(product_map, product_map)] += other.pair_counts
+        if len(category_map):
+            self.category_counts[category_map] += other.category_counts
+            self.category_pair_counts[
+                np.ix_(category_map, category_map)
+            ] += other.category_pair_counts
+        self.sources.update(other.sources)
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path + ".npz",
+            item_counts=self.item_counts,
+            pair_counts=self.pair_counts,
+            category_counts=self.category_counts,
+            category_pair_counts=self.category_pair_counts,
+        )
+        with open(path + ".json", "w") as f:
+            json.dump(
+                {
+                    "transactions": self.transactions,
+                    "products": self.products,
+                    "categories": self.categories,
+                    "product_category": self.product_category,
+                    "sources": self.sources,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "BasketCounts":
+        with open(path + ".json", "r") as f:
+            meta = json.load(f)
+        counts = cls()
+        for category in meta["categories"]:
+            counts.category_id(category)
+        for product, category in zip(meta["products"], meta["product_category"]):
+            counts.product_id(product, meta["categories"][category])
+        counts.transactions = meta["transactions"]
+        counts.sources = meta["sources"]
+        with np.load(path + ".npz") as arrays:
+            counts.item_counts = arrays["item_counts"]
+            counts.pair_counts = arrays["pair_counts"]
+            counts.category_counts = arrays["category_counts"]
+            counts.category_pair_counts = arrays["category_pair_counts"]
+        return counts
+
+    def rules(
+        self, level: str = "product", min_support: float = 0.0
+    ) -> Iterator[Tuple[str, str, float, float, float]]:
+        """``(antecedent, consequent, support, confidence, lift)`` for every pair.
+
+        ``level`` is "product" or "category". Pairs seen together in fewer
+        than ``min_support`` of all transactions are skipped.
+        """
+        if level == "product":
+            names, counts, pairs = self.products, self.item_counts, self.pair_counts
+        else:
+            names = self.categories
+            counts, pairs = self.category_counts, self.category_pair_counts
+        if self.transactions == 0:
+            return
+        total = self.transactions
+        for a, b in zip(*np.nonzero(pairs)):
+            support = pairs[a, b] / total
+            if support < min_support:
+                continue
+            confidence = pairs[a, b] / counts[a]
+            lift = confidence / (counts[b] / total)
+            yield names[a], names[b], float(support), float(confidence), float(lift)
+
+    def apriori_recommendations(
+        self,
+        min_support: float = 0.0,
+        min_confidence: float = 0.0,
+        min_lift: float = 0.0,
+    ) -> Dict[str, List[Dict]]:
+        """Rules in the ``data/apriori_recommendations.json`` layout."""
+        recommendations: Dict[str, List[Dict]] = {}
+        for antecedent, consequent, _, confidence, lift in self.rules(
+            "product", min_support
+        ):
+            if confidence < min_confidence or lift < min_lift:
+                continue
+            category = self.categories[
+                self.product_category[self._product_ids[consequent]]
+            ]
+            recommendations.setdefault(antecedent, []).append(
+                {
+                    "product": consequent,
+                    "product_category": category,
+                    "confidence": confidence,
+                }
+            )
+        for rules in recommendations.values():
+            rules.sort(key=lambda rule: (-rule["confidence"], rule["product"]))
+        return dict(sorted(recommendations.items()))
+
+    def write_apriori_recommendations(self, path: str, **thresholds):
+        with open(path, "w") as f:
+            json.dump(self.apriori_recommendations(**thresholds), f)
+
+    def write_popularity(self, path: str):
+        """Per-product transaction counts in the ``popularity_recommendation.csv`` layout."""
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["product", "product_category", "number_of_transactions"])
+            for product in sorted(self.products):
+                product_id = self._product_ids[product]
+                writer.writerow(
+                    [
+                        product,
+                        self.categories[self.product_category[product_id]],
+                        int(self.item_counts[product_id]),
+                    ]
+                )
+
+    def write_rules(self, path: str, min_support: float = 0.0):
+        """Every product and category rule with support, confidence and lift."""
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(
+                ["level", "antecedent", "consequent", "support", "confidence", "lift"]
+            )
+            for level in ("product", "category"):
+                for rule in self.rules(level, min_support):
+                    writer.writerow([level, *rule])
+
+
+def _resize(counts: np.ndarray, size: int) -> np.ndarray:
+    if counts.shape[0] == size:
+        return counts
+    grown = np.zeros((size,) * counts.ndim, dtype=np.int64)
+    grown[tuple(slice(0, n) for n in counts.shape)] = counts
+    return grown
+
+
+def file_fingerprint(path: str) -> str:
+    stat = os.stat(path)
+    return hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[
+        :16
+    ]
+
+
+def _line_txn(line: bytes, column: int) -> str:
+    return next(csv.reader([line.decode("utf-8")]))[column]
+
+
+def _header(path: str) -> List[str]:
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        return next(csv.reader(f))
+
+
+def _range_lines(path: str, start: int, end: int, txn_column: int) -> Iterator[bytes]:
+    """Lines of the transactions whose first row starts in ``[start, end)``.
+
+    Rows of one transaction must be contiguous. A range skips the rows that
+    continue a transaction begun before ``start`` and reads past ``end`` to
+    finish its last one, so adjacent ranges never share a transaction.
+    """
+    with open(path, "rb") as f:
+        if start == 0:
+            f.readline()
+            previous_txn = None
+        else:
+            f.seek(start - 1)
+            f.readline()
+            position = f.tell()
+            back = max(0, position - 65536)
+            f.seek(back)
+            previous = f.read(position - back).rstrip(b"\r\n").rsplit(b"\n", 1)[-1]
+            # The header when the range starts on the first data row.
+            previous_txn = _line_txn(previous, txn_column)
+            f.seek(position)
+
+        skipping = previous_txn is not None
+        last_line = None
+        while True:
+            position = f.tell()
+            line = f.readline()
+            if not line:
+                return
+            if not line.strip():
+                continue
+            # Transaction ids are only parsed around the range boundaries.
+            if skipping:
+                if _line_txn(line, txn_column) == previous_txn:
+                    continue
+                skipping = False
+            if position >= end:
+                txn = _line_txn(line, txn_column)
+                if last_line is None or txn != _line_txn(last_line, txn_column):
+                    return
+            last_line = line
+            yield line
+
+
+def count_range(
+    path: str,
+    start: int,
+    end: int,
+    chunk_rows: int = CHUNK_ROWS,
+    categories: Optional[Dict[str, str]] = None,
+) -> BasketCounts:
+    """Count one byte range of a line-item CSV in chunks of ``chunk_rows``."""
+    header = _header(path)
+    txn_column = header.index(TRANSACTION_COLUMN)
+    product_column = header.index(PRODUCT_COLUMN)
+    category_column = (
+        header.index(CATEGORY_COLUMN) if CATEGORY_COLUMN in header else None
+    )
+    categories = categories or {}
+
+    counts = BasketCounts()
+    txn_index: List[int] = []
+    product_ids: List[int] = []
+    last_txn = None
+    current = -1
+
+    def flush():
+        counts.add_baskets(
+            np.asarray(txn_index, dtype=np.int64),
+            np.asarray(product_ids, dtype=np.int64),
+        )
+        txn_index.clear()
+        product_ids.clear()
+
+    lines = (
+        line.decode("utf-8") for line in _range_lines(path, start, end, txn_column)
+    )
+    for row in csv.reader(lines):
+        txn = row[txn_column]
+        if txn != last_txn:
+            # Chunks end on transaction boundaries.
+            if len(product_ids) >= chunk_rows:
+                flush()
+            current += 1
+            last_txn = txn
+        product = row[product_column]
+        category = (
+            row[category_column]
+            if category_column is not None
+            else categories.get(product)
+        )
+        txn_index.append(current)
+        product_ids.append(counts.product_id(product, category))
+    flush()
+    return counts
+
+
+def _file_ranges(path: str, split_bytes: int) -> List[Tuple[str, int, int]]:
+    size = os.path.getsize(path)
+    bounds = list(range(0, size, split_bytes)) + [size]
+    return [(path, start, end) for start, end in zip(bounds, bounds[1:])] or [
+        (path, 0, 0)
+    ]
+
+
+def _count_task(task) -> BasketCounts:
+    path, start, end, chunk_rows, categories = task
+    return count_range(path, start, end, chunk_rows, categories)
+
+
+def count_files(
+    paths: Iterable[str],
+    counts: Optional[BasketCounts] = None,
+    workers: int = 1,
+    chunk_rows: int = CHUNK_ROWS,
+    split_bytes: int = SPLIT_BYTES,
+    categories: Optional[Dict[str, str]] = None,
+) -> BasketCounts:
+    """Add the transactions of ``paths`` to ``counts``.
+
+    Files already recorded in ``counts.sources`` with an unchanged size and
+    mtime are skipped, so pointing this at a growing directory of daily logs
+    only counts the new days. Large files are split into byte ranges and all
+    ranges are counted across ``workers`` processes.
+    """
+    counts = counts or BasketCounts()
+    new = {}
+    for path in paths:
+        fingerprint = file_fingerprint(path)
+        if counts.sources.get(path) != fingerprint:
+            new[path] = fingerprint
+    if any(path in counts.sources for path in new):
+        changed = [path for path in new if path in counts.sources]
+        raise ValueError(
+            f"Already counted files changed since: {changed}; rebuild from scratch"
+        )
+
+    tasks = [
+        (path, start, end, chunk_rows, categories)
+        for new_path in new
+        for path, start, end in _file_ranges(new_path, split_bytes)
+    ]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial in executor.map(_count_task, tasks):
+                counts.merge(partial)
+    else:
+        for task in tasks:
+            counts.merge(_count_task(task))
+    counts.sources.update(new)
+    return counts
@@ -0,0 +1,74 @@
+import difflib
+import json
+import pathlib
+import re
+from typing import Any, Dict, List, Optional
+
+CATALOG_PATH = pathlib.Path(__file__).parent.parent / "products" / "products.jsonl"
+
+# Similarity a misspelled name needs to be matched to a product.
+MATCH_CUTOFF = 0.8
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _match_key(name: str) -> str:
+    """Lowercase words without punctuation or a plural "s"."""
+    words = _WORD_RE.findall(name.lower().replace("’", "'").replace("'s", ""))
+    return " ".join(
+        word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words
+    )
+
+
+class Catalog:
+    """Read-only view of the product catalog in ``products/products.jsonl``.
+
+    ``products`` skips the file, for a catalog loaded from a data snapshot.
+    """
+
+    def __init__(self, path=CATALOG_PATH, products=None):
+        if products is None:
+            products = []
+            with open(path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    products.append(json.loads(line))
+        self.products: List[Dict[str, Any]] = products
+
+        self.names = [product["name"] for product in self.products]
+        self._by_lower_name = {
+            product["name"].lower(): product for product in self.products
+        }
+        self._by_match_key = {
+            _match_key(product["name"]): product for product in self.products
+        }
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Look up a product by name, ignoring case."""
+        return self._by_lower_name.get(name.strip().lower())
+
+    def display_name(self, name: str) -> str:
+        """Catalog spelling of ``name``, or ``name`` itself if unknown."""
+        product = self.get(name)
+        return product["name"] if product else name
+
+    def match(self, name: str) -> Optional[Dict[str, Any]]:
+        """Product best matching a free-form name ("lattes", "almond crossant").
+
+        Exact and plural-insensitive matches win; otherwise the closest name
+        above ``MATCH_CUTOFF`` is used. Returns ``None`` when nothing is close
+        enough, e.g. for items that are not on the menu.
+        """
+        product = self.get(name)
+        if product is not None:
+            return product
+        key = _match_key(name)
+        product = self._by_match_key.get(key)
+        if product is not None:
+            return product
+        close = difflib.get_close_matches(
+            key, self._by_match_key, n=1, cutoff=MATCH_CUTOFF
+        )
+        return self._by_match_key[close[0]] if close else None
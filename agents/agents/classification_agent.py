@@ -1,27 +1,69 @@
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
+import atexit
+import logging
+import logging.handlers
 import os
-from copy import deepcopy
+import queue
+import re
+import json
+import pathlib
+import threading
 import dotenv
 from typing import List, Dict, Any
 from .types import AgentMessage, ClassificationMemory
+from .prompt_assembly import assemble
+from .metrics import stage
+from .llm_clients import chat_model
+from .context_policy import ContextPolicy
+from .local_router import CONTEXT_TURNS, LocalRouter
+from .guard_prefilter import normalize
+from .order_state import FINAL_ORDER_STEP
+from .decision_cache import (
+    DECISION_CACHE_ENABLED,
+    DecisionCache,
+    fingerprint,
+    model_name,
+    recent_turns_key,
+    shared_backend,
+)
+from .response_cache import SingleFlight, prompt_key
 
 dotenv.load_dotenv()
 
+ROUTER_MODEL_PATH = os.getenv(
+    "ROUTER_MODEL_PATH",
+    str(pathlib.Path(__file__).parent.parent / "data" / "router_model.json"),
+)
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", 0.9))
+ROUTER_STICKY = os.getenv("ROUTER_STICKY", "on") == "on"
+# When set, every LLM routing decision is appended here as training data.
+ROUTER_LOG_PATH = os.getenv("ROUTER_LOG_PATH")
 
-class ClassificationDecision(BaseModel):
-    chain_of_thought: str
-    decision: str
-    message: str
+# Decisions are queued to one writer thread, so turns never wait on the
+# file and concurrent records cannot interleave.
+_decision_log = logging.getLogger(__name__ + ".decisions")
+_decision_log.propagate = False
+_decision_log_listener = None
+_decision_log_lock = threading.Lock()
 
 
-class ClassificationAgent:
-    def __init__(self):
-        self.llm = ChatOpenAI(model=os.getenv("MODEL_NAME", "gpt-4o-mini"))
+def decision_log() -> logging.Logger:
+    """Logger writing one JSON record per line to ``ROUTER_LOG_PATH``."""
+    global _decision_log_listener
+    with _decision_log_lock:
+        if _decision_log_listener is None:
+            handler = logging.FileHandler(ROUTER_LOG_PATH, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            records = queue.SimpleQueue()
+            _decision_log_listener = logging.handlers.QueueListener(records, handler)
+            _decision_log_listener.start()
+            atexit.register(_decision_log_listener.stop)
+            _decision_log.addHandler(logging.handlers.QueueHandler(records))
+            _decision_log.setLevel(logging.INFO)
+    return _decision_log
 
-    def get_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
-        messages = deepcopy(messages)
-        system_prompt = """
+
+CLASSIFICATION_SYSTEM_PROMPT = """
             You are a router for a coffee shop chatbot. Choose the right agent:
       
             1. details_agent: Questions about Version Coffee (general info, location, hours, delivery, menu details, about us)
@@ -36,16 +78,185 @@ class ClassificationAgent:
             }
         """
 
-        input_messages = [{"role": "system", "content": system_prompt}]
-        # Gives context by appending all messages including the current user message
-        input_messages += messages
 
-        structured_llm = self.llm.with_structured_output(ClassificationDecision)
-        result = structured_llm.invoke(input_messages)
+class ClassificationDecision(BaseModel):
+    chain_of_thought: str
+    decision: str
+    message: str
+
+
+class ClassificationAgent:
+    def __init__(self, llm=None, router=None, context_policy=None):
+        self.llm = llm or chat_model()
+        self.structured_llm = self.llm.with_structured_output(ClassificationDecision)
+        # Concurrent turns with the same prompt share one decision call.
+        self.flights = SingleFlight()
+        self.context_policy = context_policy or ContextPolicy.for_agent(
+            "classification", self.llm
+        )
+        self.router = router
+        if self.router is None and os.path.exists(ROUTER_MODEL_PATH):
+            self.router = LocalRouter.load(ROUTER_MODEL_PATH)
+
+        self.router_hits = 0
+        self.sticky_hits = 0
+        self.llm_calls = 0
+
+        # Routing depends on context, so decisions are keyed on a digest of
+        # the last few turns rather than the last message alone.
+        self.decision_cache = None
+        if DECISION_CACHE_ENABLED:
+            self.decision_cache = DecisionCache(
+                "classification",
+                fingerprint(
+                    model_name(self.llm),
+                    CLASSIFICATION_SYSTEM_PROMPT,
+                    json.dumps(ClassificationDecision.model_json_schema()),
+                ),
+                backend=shared_backend(),
+            )
+
+    def _mid_order(self, messages: List[Dict[str, Any]]) -> bool:
+        """Whether the last reply is an order taking step before checkout."""
+        for message in reversed(messages):
+            if message["role"] != "assistant":
+                continue
+            memory = message.get("memory") or {}
+            if memory.get("agent") != "order_taking_agent":
+                return False
+            step = re.search(r"\d+", str(memory.get("step_number", "")))
+            return not (step and int(step.group()) >= FINAL_ORDER_STEP)
+        return False
+
+    def _local_decision(self, messages: List[Dict[str, Any]]):
+        """Routing decision made without the LLM, or ``None`` to defer to it."""
+        if self.router is None:
+            return None
+        agent, confidence = self.router.predict(messages)
+        if confidence >= ROUTER_CONFIDENCE_THRESHOLD:
+            self.router_hits += 1
+            return ClassificationDecision(
+                chain_of_thought=f"Local router ({confidence:.2f}).",
+                decision=agent,
+                message="",
+            )
+        # Stickiness only breaks ties: a conversation mid-order stays with
+        # the order taking agent when the router leans that way too, so a
+        # question asked mid-order still goes to the LLM.
+        if (
+            ROUTER_STICKY
+            and agent == "order_taking_agent"
+            and self._mid_order(messages)
+        ):
+            self.sticky_hits += 1
+            return ClassificationDecision(
+                chain_of_thought="Conversation is mid-order.",
+                decision=agent,
+                message="",
+            )
+        return None
+
+    def _cached_decision(self, messages: List[Dict[str, Any]]):
+        if self.decision_cache is None:
+            return None, None
+        key = recent_turns_key(messages, CONTEXT_TURNS, normalize)
+        return key, self.decision_cache.get_model(key, ClassificationDecision)
+
+    def _cache_decision(self, key, result):
+        if self.decision_cache is not None:
+            self.decision_cache.set_model(key, result)
+
+    # The async paths reach a shared cache backend off the event loop.
+
+    async def _acached_decision(self, messages: List[Dict[str, Any]]):
+        if self.decision_cache is None:
+            return None, None
+        key = recent_turns_key(messages, CONTEXT_TURNS, normalize)
+        return key, await self.decision_cache.aget_model(key, ClassificationDecision)
+
+    async def _acache_decision(self, key, result):
+        if self.decision_cache is not None:
+            await self.decision_cache.aset_model(key, result)
+
+    def _log_decision(self, messages: List[Dict[str, Any]], result):
+        self.llm_calls += 1
+        if not ROUTER_LOG_PATH:
+            return
+        record = {
+            "messages": [
+                {key: message.get(key) for key in ("role", "content", "memory")}
+                for message in messages[-CONTEXT_TURNS:]
+            ],
+            "decision": result.decision,
+        }
+        decision_log().info(json.dumps(record))
+
+    def _build_input_messages(self, messages: List[Dict[str, Any]]):
+        # Gives context with the recent messages including the current user
+        # message, and a summary of older ones
+        return assemble(
+            CLASSIFICATION_SYSTEM_PROMPT, self.context_policy.window(messages)
+        )
+
+    def _fast_path(self, messages: List[Dict[str, Any]]):
+        """``(cache_key, decision)``; ``decision`` is ``None`` when the LLM has
+        to be asked, and ``cache_key`` is then passed on to
+        ``_record_llm_decision``."""
+        result = self._local_decision(messages)
+        if result is not None:
+            return None, result
+        return self._cached_decision(messages)
+
+    async def _afast_path(self, messages: List[Dict[str, Any]]):
+        result = self._local_decision(messages)
+        if result is not None:
+            return None, result
+        return await self._acached_decision(messages)
+
+    def _record_llm_decision(self, messages: List[Dict[str, Any]], cache_key, result):
+        self._log_decision(messages, result)
+        self._cache_decision(cache_key, result)
+
+    async def _arecord_llm_decision(
+        self, messages: List[Dict[str, Any]], cache_key, result
+    ):
+        self._log_decision(messages, result)
+        await self._acache_decision(cache_key, result)
+
+    def _llm_decision(self, messages: List[Dict[str, Any]]) -> ClassificationDecision:
+        input_messages = self._build_input_messages(messages)
+        return self.flights.do(
+            prompt_key(input_messages),
+            lambda: self.structured_llm.invoke(input_messages),
+        )
+
+    async def _allm_decision(
+        self, messages: List[Dict[str, Any]]
+    ) -> ClassificationDecision:
+        input_messages = self._build_input_messages(messages)
+        return await self.flights.ado(
+            prompt_key(input_messages),
+            lambda: self.structured_llm.ainvoke(input_messages),
+        )
+
+    def get_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
+        with stage("classification"):
+            cache_key, result = self._fast_path(messages)
+            if result is None:
+                result = self._llm_decision(messages)
+                self._record_llm_decision(messages, cache_key, result)
         output = self.postprocess(result)
 
         return output
 
+    async def aget_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
+        with stage("classification"):
+            cache_key, result = await self._afast_path(messages)
+            if result is None:
+                result = await self._allm_decision(messages)
+                await self._arecord_llm_decision(messages, cache_key, result)
+        return self.postprocess(result)
+
     def postprocess(self, result) -> AgentMessage:
         """Convert Pydantic model to message dict."""
         memory: ClassificationMemory = {
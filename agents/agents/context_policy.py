@@ -0,0 +1,265 @@
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "extractive" compresses turns that leave the window into one line each
+# with no model call, "llm" additionally has the model rewrite the summary
+# in the background, "off" drops them.
+CONTEXT_SUMMARY_MODE = os.getenv("CONTEXT_SUMMARY", "extractive")
+CONTEXT_SUMMARY_CACHE_SIZE = int(os.getenv("CONTEXT_SUMMARY_CACHE_SIZE", 10000))
+# Override every agent's budget / verbatim window when set.
+CONTEXT_TOKEN_BUDGET = os.getenv("CONTEXT_TOKEN_BUDGET")
+CONTEXT_RECENT_MESSAGES = os.getenv("CONTEXT_RECENT_MESSAGES")
+
+# Per-agent defaults: (token budget for the history, messages kept verbatim).
+AGENT_CONTEXT = {
+    "classification": (1000, 6),
+    "details_agent": (2000, 6),
+    "order_taking_agent": (2000, 8),
+}
+
+# Rough token estimate for budgeting; no tokenizer is loaded.
+CHARS_PER_TOKEN = 4
+# Longest line kept per message in an extractive summary.
+SUMMARY_LINE_CHARS = 200
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+LLM_SUMMARY_PROMPT = """
+        Summarize the earlier part of a conversation between a customer and
+        the Version Coffee chatbot in at most a few short sentences. Keep
+        names of products, preferences and questions that may come up again.
+        Do not include the current order; it is tracked separately.
+        """
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _message_tokens(message: Dict[str, Any]) -> int:
+    # A few tokens of per-message overhead, like the chat format adds.
+    return estimate_tokens(message["content"]) + 4
+
+
+def _digest(previous: bytes, message: Dict[str, Any]) -> bytes:
+    digest = hashlib.sha1(previous)
+    digest.update(message["role"].encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(message["content"].encode("utf-8"))
+    return digest.digest()
+
+
+def summary_line(message: Dict[str, Any]) -> str:
+    """One line for a message: its role and first sentence, truncated."""
+    content = " ".join(message["content"].split())
+    first = _SENTENCE_END.split(content, 1)[0]
+    if len(first) > SUMMARY_LINE_CHARS:
+        first = first[: SUMMARY_LINE_CHARS - 3].rstrip() + "..."
+    return f"- {message['role'].capitalize()}: {first}"
+
+
+class SummaryCache:
+    """LRU of conversation summaries keyed by a digest of the summarized prefix.
+
+    The digest is chained message by message, so the summary of any earlier
+    prefix of the same conversation can be found and extended instead of
+    summarizing from the start.
+    """
+
+    def __init__(self, max_entries: int = CONTEXT_SUMMARY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Tuple[Tuple[str, ...], bool]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: bytes, lines: Tuple[str, ...], final: bool):
+        """Store ``lines``; ``final`` marks summaries no refresh should replace."""
+        with self._lock:
+            self._entries[key] = (lines, final)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_shared_cache = None
+_summary_executor = None
+
+
+def shared_cache() -> SummaryCache:
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SummaryCache()
+    return _shared_cache
+
+
+class ContextPolicy:
+    """How much conversation history an agent sends to the model.
+
+    The last ``recent_messages`` messages are sent verbatim. Older ones are
+    evicted ``step`` messages at a time, so the prompt prefix only changes
+    every few turns and stays cacheable in between, and replaced by a
+    rolling summary message. The whole history, summary included, is kept
+    under ``token_budget`` by moving more messages into the summary and, if
+    needed, dropping its oldest lines. Structured state such as the current
+    order is not the policy's concern: agents read it from the full history.
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        recent_messages: int,
+        step: Optional[int] = None,
+        summary_mode: Optional[str] = None,
+        llm=None,
+        cache: Optional[SummaryCache] = None,
+    ):
+        self.token_budget = token_budget
+        self.recent_messages = max(recent_messages, 1)
+        self.step = step or max(self.recent_messages // 2, 1)
+        self.summary_mode = summary_mode or CONTEXT_SUMMARY_MODE
+        # A quarter of the budget at most goes to the summary.
+        self.summary_budget = token_budget // 4
+        self.llm = llm
+        self.cache = cache if cache is not None else shared_cache()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+        self.summaries_built = 0
+        self.summary_hits = 0
+
+    @classmethod
+    def for_agent(cls, agent: str, llm=None, **kwargs) -> "ContextPolicy":
+        token_budget, recent_messages = AGENT_CONTEXT[agent]
+        if CONTEXT_TOKEN_BUDGET:
+            token_budget = int(CONTEXT_TOKEN_BUDGET)
+        if CONTEXT_RECENT_MESSAGES:
+            recent_messages = int(CONTEXT_RECENT_MESSAGES)
+        return cls(token_budget, recent_messages, llm=llm, **kwargs)
+
+    def window(self, messages: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The history to send: an optional summary message, then recent turns."""
+        size = len(messages)
+        keep_from = 0
+        if size > self.recent_messages + self.step:
+            keep_from = (size - self.recent_messages) // self.step * self.step
+
+        # Room for the summary is only reserved once something is evicted.
+        reserve = self.summary_budget if self.summary_mode != "off" else 0
+        recent_tokens = sum(_message_tokens(m) for m in messages[keep_from:])
+        while keep_from < size - 1 and recent_tokens > self.token_budget - (
+            reserve if keep_from else 0
+        ):
+            recent_tokens -= _message_tokens(messages[keep_from])
+            keep_from += 1
+
+        history = list(messages[keep_from:])
+        if keep_from == 0 or self.summary_mode == "off":
+            return history
+        summary = self.summary(messages[:keep_from])
+        return [{"role": "system", "content": SUMMARY_PREFIX + summary}] + history
+
+    def summary(self, messages: Sequence[Dict[str, Any]]) -> str:
+        """Rolling summary of ``messages``.
+
+        Extends the cached summary of the longest prefix already seen, so
+        each message is summarized once per conversation.
+        """
+        digests = []
+        digest = b""
+        for message in messages:
+            digest = _digest(digest, message)
+            digests.append(digest)
+
+        entry = self.cache.get(digests[-1])
+        if entry is not None:
+            self.summary_hits += 1
+            lines, final = entry
+        else:
+            start, lines = 0, ()
+            for index in range(len(digests) - 2, -1, -1):
+                found = self.cache.get(digests[index])
+                if found is not None:
+                    start, lines = index + 1, found[0]
+                    break
+            lines = self._trim(lines + tuple(map(summary_line, messages[start:])))
+            # Extractive summaries are final unless the model rewrites them.
+            final = self.summary_mode != "llm"
+            self.cache.set(digests[-1], lines, final)
+            self.summaries_built += 1
+
+        if not final:
+            self._refresh(digests[-1], lines)
+        return "\n".join(lines)
+
+    def _trim(self, lines: Tuple[str, ...]) -> Tuple[str, ...]:
+        """Drop the oldest lines until the summary fits its budget."""
+        tokens = sum(estimate_tokens(line) + 1 for line in lines)
+        start = 0
+        while start < len(lines) - 1 and tokens > self.summary_budget:
+            tokens -= estimate_tokens(lines[start]) + 1
+            start += 1
+        return lines[start:]
+
+    def _refresh(self, key: bytes, lines: Tuple[str, ...]):
+        """Have the model rewrite an extractive summary, off the request path."""
+        if self.llm is None:
+            return
+        with self._pending_lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        _executor().submit(self._rewrite, key, lines)
+
+    def _rewrite(self, key: bytes, lines: Tuple[str, ...]):
+        try:
+            response = self.llm.invoke(
+                [
+                    {"role": "system", "content": LLM_SUMMARY_PROMPT},
+                    {"role": "user", "content": "\n".join(lines)},
+                ]
+            )
+            text = " ".join(response.content.split())
+            self.cache.set(key, self._trim((f"- {text}",)), True)
+        except Exception:
+            logger.exception("Conversation summary refresh failed")
+        finally:
+            with self._pending_lock:
+                self._pending.discard(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "summaries_built": self.summaries_built,
+            "summary_hits": self.summary_hits,
+            "cached_summaries": len(self.cache),
+        }
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _summary_executor
+    if _summary_executor is None:
+        _summary_executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="context-summary"
+        )
+    return _summary_executor
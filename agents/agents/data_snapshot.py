@@ -0,0 +1,152 @@
+import csv
+import hashlib
+import json
+import os
+import pathlib
+import threading
+from typing import Optional
+
+import numpy as np
+
+from .catalog import CATALOG_PATH, Catalog
+from .recommendation_index import AprioriIndex, PopularityIndex
+
+DATA_DIR = pathlib.Path(__file__).parent.parent / "data"
+APRIORI_PATH = DATA_DIR / "apriori_recommendations.json"
+POPULARITY_PATH = DATA_DIR / "popularity_recommendation.csv"
+SNAPSHOT_PATH = os.getenv("DATA_SNAPSHOT_PATH", str(DATA_DIR / "shared_data"))
+
+SOURCES = (APRIORI_PATH, POPULARITY_PATH, CATALOG_PATH)
+
+_shared: Optional["DataSnapshot"] = None
+_shared_lock = threading.Lock()
+
+
+def source_digest() -> str:
+    """Digest of the rule, popularity and catalog files a snapshot is built from."""
+    digest = hashlib.sha256()
+    for path in SOURCES:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _table_path(path: str, digest: str) -> str:
+    # The rule table is named after the digest it was built from, so the
+    # .json, written last, always points at a matching table.
+    return f"{path}.{digest}.npy"
+
+
+def _write_atomic(path: str, write):
+    # Workers started side by side may rebuild a stale snapshot at the same
+    # time; each writes its own file and the rename keeps readers whole.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class DataSnapshot:
+    """Read-only recommendation and catalog data, compiled for sharing.
+
+    The apriori rules are one ``RULE_DTYPE`` table saved as
+    ``<path>.<digest>.npy`` and memory-mapped on load, so every worker on a
+    host reads the same page cache pages instead of parsing the JSON into
+    its own objects. String tables, the popularity rows and the catalog go
+    in a ``<path>.json`` side-car with the digest of the source files, which
+    names the table to load with them.
+    """
+
+    def __init__(
+        self,
+        apriori: AprioriIndex,
+        popularity: PopularityIndex,
+        catalog: Catalog,
+        digest: str,
+    ):
+        self.apriori = apriori
+        self.popularity = popularity
+        self.catalog = catalog
+        self.digest = digest
+
+    @staticmethod
+    def build(path: str = SNAPSHOT_PATH, digest: Optional[str] = None):
+        """Compile the source files into a snapshot at ``path``."""
+        digest = digest or source_digest()
+        apriori = AprioriIndex.from_json(APRIORI_PATH)
+        with open(POPULARITY_PATH, "r", newline="") as f:
+            popularity = list(csv.DictReader(f))
+        catalog = Catalog()
+
+        meta = {
+            "digest": digest,
+            "names": apriori.names,
+            "categories": apriori.categories,
+            "product_category": apriori.product_category,
+            "rules": [[product, *span] for product, span in apriori.rules.items()],
+            "popularity": popularity,
+            "products": catalog.products,
+        }
+        table_path = _table_path(path, digest)
+        _write_atomic(table_path, lambda f: np.save(f, apriori.table))
+        _write_atomic(path + ".json", lambda f: f.write(json.dumps(meta).encode()))
+        # Tables of older sources. A worker that read the previous .json
+        # just before this fails to open its table and rebuilds.
+        prefix = os.path.basename(path) + "."
+        directory = os.path.dirname(path) or "."
+        for name in os.listdir(directory):
+            stale = os.path.join(directory, name)
+            if (
+                name.startswith(prefix)
+                and name.endswith(".npy")
+                and stale != table_path
+            ):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, path: str = SNAPSHOT_PATH) -> "DataSnapshot":
+        """Load a snapshot, memory-mapping the rule table."""
+        with open(path + ".json", "r") as f:
+            meta = json.load(f)
+        apriori = AprioriIndex(
+            meta["names"],
+            meta["categories"],
+            meta["product_category"],
+            np.load(_table_path(path, meta["digest"]), mmap_mode="r"),
+            {product: (start, end) for product, start, end in meta["rules"]},
+        )
+        return cls(
+            apriori,
+            PopularityIndex(meta["popularity"]),
+            Catalog(products=meta["products"]),
+            meta["digest"],
+        )
+
+    @classmethod
+    def load_or_build(cls, path: str = SNAPSHOT_PATH) -> "DataSnapshot":
+        """Use the snapshot when it matches the source files, else rebuild it."""
+        digest = source_digest()
+        try:
+            snapshot = cls.load(path)
+            if snapshot.digest == digest:
+                return snapshot
+        except FileNotFoundError:
+            pass
+        cls.build(path, digest)
+        return cls.load(path)
+
+
+def shared_snapshot() -> DataSnapshot:
+    """The process-wide snapshot, loaded on first use.
+
+    The multi-worker launcher loads it before forking, so the workers also
+    share the parsed string tables and catalog copy-on-write.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = DataSnapshot.load_or_build()
+    return _shared
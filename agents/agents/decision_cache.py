@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+DECISION_CACHE_ENABLED = os.getenv("DECISION_CACHE", "on") == "on"
+DECISION_CACHE_SIZE = int(os.getenv("DECISION_CACHE_SIZE", 10000))
+DECISION_CACHE_TTL = float(os.getenv("DECISION_CACHE_TTL", 3600))
+# Optional SQLite file shared by every worker on the host.
+DECISION_CACHE_PATH = os.getenv("DECISION_CACHE_PATH")
+
+
+def fingerprint(*parts: str) -> str:
+    """Stable digest of everything a cached decision depends on."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def model_name(llm) -> str:
+    return getattr(llm, "model_name", None) or type(llm).__name__
+
+
+def recent_turns_key(messages: List[Dict[str, Any]], turns: int, normalize) -> str:
+    """Compact digest of the last ``turns`` messages for conversation-level keys."""
+    parts = []
+    for message in messages[-turns:]:
+        agent = (message.get("memory") or {}).get("agent", "")
+        parts.append(f"{message['role']}|{agent}|{normalize(message['content'])}")
+    return fingerprint(*parts)
+
+
+class SqliteDecisionBackend:
+    """On-disk decision store that several worker processes can share."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Entries are keyed on their fingerprint, so a process still
+            # running an older prompt or model (mid-deploy) never serves or
+            # overwrites the entries of a newer one. Files from before the
+            # fingerprint was part of the key are only a cache: start over.
+            primary_key = [
+                row[1]
+                for row in self._conn.execute("PRAGMA table_info(decisions)")
+                if row[5]
+            ]
+            if primary_key and "fingerprint" not in primary_key:
+                self._conn.execute("DROP TABLE decisions")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS decisions ("
+                "namespace TEXT, fingerprint TEXT, key TEXT, value TEXT, "
+                "expires REAL, PRIMARY KEY (namespace, fingerprint, key))"
+            )
+
+    def invalidate(self, namespace: str, current_fingerprint: str):
+        """Drop entries written under an older prompt or model."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM decisions WHERE namespace = ? AND fingerprint != ?",
+                (namespace, current_fingerprint),
+            )
+
+    def get(
+        self, namespace: str, current_fingerprint: str, key: str
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """``(value, expires)`` of a live entry, else ``None``."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM decisions "
+                "WHERE namespace = ? AND fingerprint = ? AND key = ?",
+                (namespace, current_fingerprint, key),
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(
+        self,
+        namespace: str,
+        current_fingerprint: str,
+        key: str,
+        value: Dict[str, Any],
+        expires: float,
+    ):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?, ?)",
+                (namespace, current_fingerprint, key, json.dumps(value), expires),
+            )
+
+
+_shared_backend = None
+
+
+def shared_backend() -> Optional[SqliteDecisionBackend]:
+    global _shared_backend
+    if DECISION_CACHE_PATH and _shared_backend is None:
+        _shared_backend = SqliteDecisionBackend(DECISION_CACHE_PATH)
+    return _shared_backend
+
+
+class DecisionCache:
+    """Bounded LRU/TTL cache of structured LLM decisions.
+
+    Entries are scoped by ``namespace`` (e.g. "guard") and ``fingerprint``,
+    a digest of the prompt, schema and model that produced them, so changing
+    any of those invalidates the cache. An optional backend shares entries
+    between worker processes; the in-process LRU sits in front of it.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        fingerprint: str,
+        max_entries: int = DECISION_CACHE_SIZE,
+        ttl: float = DECISION_CACHE_TTL,
+        backend=None,
+    ):
+        self.namespace = namespace
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        if self.backend is not None:
+            self.backend.invalidate(namespace, fingerprint)
+
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get_local(key)
+        if value is None and self.backend is not None:
+            value = self._get_shared(key)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+        return value
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """Like ``get``, reading the shared backend off the event loop."""
+        value = self._get_local(key)
+        if value is None and self.backend is not None:
+            value = await asyncio.to_thread(self._get_shared, key)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        expires = time.time() + self.ttl
+        self._store(key, value, expires)
+        if self.backend is not None:
+            self.backend.set(self.namespace, self.fingerprint, key, value, expires)
+
+    async def aset(self, key: str, value: Dict[str, Any]):
+        """Like ``set``, writing the shared backend off the event loop."""
+        expires = time.time() + self.ttl
+        self._store(key, value, expires)
+        if self.backend is not None:
+            await asyncio.to_thread(
+                self.backend.set, self.namespace, self.fingerprint, key, value, expires
+            )
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _get_shared(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.backend.get(self.namespace, self.fingerprint, key)
+        if entry is None:
+            return None
+        # Keeps the expiry it was written with, so reads do not extend it.
+        value, expires = entry
+        self._store(key, value, expires)
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def get_model(self, key: str, schema):
+        """Cached decision rebuilt as an instance of the pydantic ``schema``."""
+        value = self.get(key)
+        return None if value is None else schema.model_validate(value)
+
+    def set_model(self, key: str, result):
+        self.set(key, result.model_dump())
+
+    async def aget_model(self, key: str, schema):
+        value = await self.aget(key)
+        return None if value is None else schema.model_validate(value)
+
+    async def aset_model(self, key: str, result):
+        await self.aset(key, result.model_dump())
+
+    def _store(self, key: str, value: Dict[str, Any], expires: float):
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,24 +1,125 @@
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 import os
-from copy import deepcopy
-from pymongo import MongoClient
+import time
+import asyncio
+import logging
+import threading
+from pymongo import AsyncMongoClient, MongoClient
 import dotenv
-from typing import List, Dict, Any, Generator
+from typing import List, Dict, Any, AsyncGenerator, Generator
 from .types import AgentMessage, DetailsMemory
+from .prompt_assembly import assemble
+from .metrics import stage
+from .llm_clients import chat_model, embeddings_model
+from .context_policy import ContextPolicy
+from .vector_index import VectorIndex, mongo_digest
+from .embedding_cache import EMBEDDING_CACHE_ENABLED, CachedEmbeddings
+from .response_cache import SharedCompletions
 
 dotenv.load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# "memory" answers retrieval from the in-process VectorIndex, "mongo" runs
+# Atlas $vectorSearch for every question.
+DETAILS_RETRIEVAL = os.getenv("DETAILS_RETRIEVAL", "memory")
+# How often to check MongoDB for re-seeded documents and refresh the index.
+VECTOR_INDEX_RELOAD_SECONDS = float(os.getenv("VECTOR_INDEX_RELOAD_SECONDS", 60))
+
+RETRIEVAL_LIMITS = {"products": 5, "about": 1}
+
+# Retrieved documents change with every question, so they go after the
+# user's message instead of into this shared prefix.
+DETAILS_SYSTEM_PROMPT = """
+        You are an assistant for Version Coffee coffee shop.
+        Answer the user's latest question based on the context that follows it.
+        """
+
 
 class DetailsAgent:
-    def __init__(self):
-        self.llm = ChatOpenAI(model=os.getenv("MODEL_NAME", "gpt-4o-mini"))
-        self.embeddings = OpenAIEmbeddings(model=os.getenv("EMBEDDING_MODEL"))
+    # The answer depends only on the prompt (history window and retrieved
+    # context), so equal prompts may share a cached answer.
+    cacheable = True
+
+    def __init__(
+        self, llm=None, embeddings=None, vector_index=None, context_policy=None
+    ):
+        self.llm = llm or chat_model()
+        self.completions = SharedCompletions(
+            self.llm,
+            "details_response",
+            DETAILS_SYSTEM_PROMPT,
+            self.cacheable,
+            data_version=self._index_digest,
+        )
+        self.context_policy = context_policy or ContextPolicy.for_agent(
+            "details_agent", self.llm
+        )
+        if embeddings is None:
+            embeddings = embeddings_model()
+            if EMBEDDING_CACHE_ENABLED:
+                embeddings = CachedEmbeddings(embeddings)
+        self.embeddings = embeddings
         self.client = MongoClient(os.getenv("MONGODB_URI"))
         self.db = self.client["test"]
-
-    def vector_search(self, collection_name, index_name, query_vector, k=5):
-        collection = self.db[collection_name]
-        pipeline = [
+        self.async_client = AsyncMongoClient(os.getenv("MONGODB_URI"))
+        self.async_db = self.async_client["test"]
+
+        self.vector_index = vector_index
+        # An index passed in is used as is; otherwise it is loaded, and kept
+        # in step with MongoDB, on a background thread. Loading may scan the
+        # collections, so it stays off the startup and request paths; turns
+        # use $vectorSearch until the index is in.
+        self._refreshes_index = vector_index is None and DETAILS_RETRIEVAL == "memory"
+        self._index_lock = threading.Lock()
+        self._index_refreshing = False
+        self._index_checked_at = time.monotonic()
+        if self._refreshes_index:
+            self._refresh_index_in_background()
+
+    def _index_digest(self) -> str:
+        """Digest of the documents answers are retrieved from right now."""
+        vector_index = self.vector_index
+        return "mongo" if vector_index is None else vector_index.digest
+
+    def _current_index(self):
+        """The in-memory index, or None to search MongoDB.
+
+        Starts a refresh when the last check is older than
+        ``VECTOR_INDEX_RELOAD_SECONDS``, without waiting for it.
+        """
+        if (
+            self._refreshes_index
+            and time.monotonic() - self._index_checked_at >= VECTOR_INDEX_RELOAD_SECONDS
+        ):
+            self._refresh_index_in_background()
+        return self.vector_index
+
+    def _refresh_index_in_background(self):
+        with self._index_lock:
+            if self._index_refreshing:
+                return
+            self._index_refreshing = True
+            self._index_checked_at = time.monotonic()
+        threading.Thread(
+            target=self._refresh_index, name="vector-index", daemon=True
+        ).start()
+
+    def _refresh_index(self):
+        try:
+            digest = mongo_digest(self.db)
+            if self.vector_index is None or self.vector_index.digest != digest:
+                self.vector_index = VectorIndex.load_or_build(self.db, digest=digest)
+        except Exception:
+            if self.vector_index is None:
+                logger.exception("Vector index unavailable, using MongoDB search")
+            else:
+                logger.exception("Failed to refresh vector index")
+        finally:
+            with self._index_lock:
+                self._index_refreshing = False
+
+    def _vector_search_pipeline(self, index_name, query_vector, k):
+        return [
             {
                 "$vectorSearch": {
                     "index": index_name,
@@ -36,20 +137,55 @@ class DetailsAgent:
                 }
             },
         ]
-        return list(collection.aggregate(pipeline))
 
-    def _build_input_messages(self, messages: List[Dict[str, Any]]):
-        messages = deepcopy(messages)
-
-        user_message = messages[-1]["content"]
-        query_vector = self.embeddings.embed_query(user_message)
-
-        # Search both collections
-        product_results = self.vector_search(
-            "products", "ProductsIndex", query_vector, k=5
-        )
-        about_results = self.vector_search("about", "AboutIndex", query_vector, k=1)
+    def vector_search(self, collection_name, index_name, query_vector, k=5):
+        collection = self.db[collection_name]
+        pipeline = self._vector_search_pipeline(index_name, query_vector, k)
+        return list(collection.aggregate(pipeline))
 
+    async def avector_search(self, collection_name, index_name, query_vector, k=5):
+        collection = self.async_db[collection_name]
+        pipeline = self._vector_search_pipeline(index_name, query_vector, k)
+        cursor = await collection.aggregate(pipeline)
+        return await cursor.to_list()
+
+    def _retrieve(self, user_message):
+        with stage("embed_query"):
+            query_vector = self.embeddings.embed_query(user_message)
+
+        with stage("vector_search"):
+            vector_index = self._current_index()
+            if vector_index is not None:
+                results = vector_index.search(query_vector, RETRIEVAL_LIMITS)
+                return results["products"], results["about"]
+
+            # Search both collections
+            product_results = self.vector_search(
+                "products", "ProductsIndex", query_vector, k=5
+            )
+            about_results = self.vector_search("about", "AboutIndex", query_vector, k=1)
+            return product_results, about_results
+
+    async def _aretrieve(self, user_message):
+        with stage("embed_query"):
+            query_vector = await self.embeddings.aembed_query(user_message)
+
+        with stage("vector_search"):
+            vector_index = self._current_index()
+            if vector_index is not None:
+                results = vector_index.search(query_vector, RETRIEVAL_LIMITS)
+                return results["products"], results["about"]
+
+            # Search both collections concurrently
+            product_results, about_results = await asyncio.gather(
+                self.avector_search("products", "ProductsIndex", query_vector, k=5),
+                self.avector_search("about", "AboutIndex", query_vector, k=1),
+            )
+            return product_results, about_results
+
+    def _build_input_messages(
+        self, messages: List[Dict[str, Any]], product_results, about_results
+    ):
         # Build context from product results
         product_texts = []
         for doc in product_results:
@@ -62,30 +198,40 @@ class DetailsAgent:
 
         source_knowledge = "\n".join(product_texts + about_texts)
 
-        system_prompt = f"""
-        You are an assistant for Version Coffee coffee shop.
-        Answer based on this context:
-        
-        Context: {source_knowledge}
-        Question: {user_message}
-        """
-
-        messages[-1]["content"] = system_prompt
-
-        input_messages = [{"role": "system", "content": system_prompt}]
-        input_messages += messages[1:]
-        return input_messages
+        return assemble(
+            DETAILS_SYSTEM_PROMPT,
+            self.context_policy.window(messages),
+            f"Context:\n{source_knowledge}",
+        )
 
     def get_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
-        input_messages = self._build_input_messages(messages)
-        response = self.llm.invoke(input_messages)
-        return self.postprocess(response.content)
+        results = self._retrieve(messages[-1]["content"])
+        input_messages = self._build_input_messages(messages, *results)
+        with stage("details_llm"):
+            content = self.completions.invoke(input_messages)
+        return self.postprocess(content)
 
     def get_stream(self, messages: List[Dict[str, Any]]) -> Generator:
-        input_messages = self._build_input_messages(messages)
-        for chunk in self.llm.stream(input_messages):
-            if chunk.content:
-                yield {"type": "token", "content": chunk.content}
+        results = self._retrieve(messages[-1]["content"])
+        input_messages = self._build_input_messages(messages, *results)
+        with stage("details_llm"):
+            for token in self.completions.stream(input_messages):
+                yield {"type": "token", "content": token}
+        yield {"type": "memory", "content": {"agent": "details_agent"}}
+
+    async def aget_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
+        results = await self._aretrieve(messages[-1]["content"])
+        input_messages = self._build_input_messages(messages, *results)
+        with stage("details_llm"):
+            content = await self.completions.ainvoke(input_messages)
+        return self.postprocess(content)
+
+    async def aget_stream(self, messages: List[Dict[str, Any]]) -> AsyncGenerator:
+        results = await self._aretrieve(messages[-1]["content"])
+        input_messages = self._build_input_messages(messages, *results)
+        with stage("details_llm"):
+            async for token in self.completions.astream(input_messages):
+                yield {"type": "token", "content": token}
         yield {"type": "memory", "content": {"agent": "details_agent"}}
 
     def postprocess(self, output: str) -> AgentMessage:
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "on") == "on"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 2048))
+# Optional SQLite file so cached vectors survive restarts.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+
+
+def normalize_query(text: str) -> str:
+    """Casefold and collapse whitespace and trailing punctuation.
+
+    "What are your hours?" and "what are your  hours" share one embedding.
+    """
+    text = " ".join(text.casefold().split())
+    return re.sub(r"[\s?!.]+$", "", text)
+
+
+class CachedEmbeddings:
+    """Caching wrapper around a LangChain embeddings model.
+
+    Queries are keyed on their normalized text, documents on their exact
+    text, both scoped by the model name. Hits are served from an in-process
+    LRU, then from the optional SQLite file; only misses reach the model.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        model: Optional[str] = None,
+        max_entries: int = EMBEDDING_CACHE_SIZE,
+        path: Optional[str] = EMBEDDING_CACHE_PATH,
+    ):
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", None) or "default"
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict[str, List[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+            with self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "model TEXT, key TEXT, vector BLOB, PRIMARY KEY (model, key))"
+                )
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        vector = self._lookup_memory(key)
+        if vector is None and self._conn is not None:
+            vector = self._lookup_disk(key)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+        return vector
+
+    async def _alookup(self, key: str) -> Optional[List[float]]:
+        """Like ``_lookup``, reading the SQLite file off the event loop."""
+        vector = self._lookup_memory(key)
+        if vector is None and self._conn is not None:
+            vector = await asyncio.to_thread(self._lookup_disk, key)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+        return vector
+
+    def _lookup_memory(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return vector
+
+    def _lookup_disk(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND key = ?",
+                (self.model, key),
+            ).fetchone()
+        if row is None:
+            return None
+        vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+        self._remember(key, vector)
+        with self._lock:
+            self.disk_hits += 1
+        return vector
+
+    def _remember(self, key: str, vector: List[float]):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _store(self, keys: List[str], vectors: List[List[float]]):
+        for key, vector in zip(keys, vectors):
+            self._remember(key, vector)
+        if self._conn is not None:
+            self._persist(keys, vectors)
+
+    async def _astore(self, keys: List[str], vectors: List[List[float]]):
+        """Like ``_store``, writing the SQLite file off the event loop."""
+        for key, vector in zip(keys, vectors):
+            self._remember(key, vector)
+        if self._conn is not None:
+            await asyncio.to_thread(self._persist, keys, vectors)
+
+    def _persist(self, keys: List[str], vectors: List[List[float]]):
+        rows = [
+            (self.model, key, np.asarray(vector, dtype=np.float32).tobytes())
+            for key, vector in zip(keys, vectors)
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows
+            )
+
+    def _document_misses(self, texts: List[str]):
+        keys = ["d:" + text for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        return keys, vectors, missing
+
+    def embed_query(self, text: str) -> List[float]:
+        key = "q:" + normalize_query(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._store([key], [vector])
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = "q:" + normalize_query(text)
+        vector = await self._alookup(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            await self._astore([key], [vector])
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._document_misses(texts)
+        if missing:
+            fresh = self.embeddings.embed_documents([texts[i] for i in missing])
+            self._store([keys[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self._conn is None:
+            keys, vectors, missing = self._document_misses(texts)
+        else:
+            keys, vectors, missing = await asyncio.to_thread(
+                self._document_misses, texts
+            )
+        if missing:
+            fresh = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            await self._astore([keys[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        return vectors
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
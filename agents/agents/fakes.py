@@ -0,0 +1,304 @@
+"""
+Local stand-ins for the OpenAI chat and embedding models.
+
+The fakes follow the small slice of the LangChain chat model interface the
+agents use (``invoke``/``ainvoke``, ``stream``/``astream`` and
+``with_structured_output``) and add configurable delays, so the controller
+pipeline can be exercised and timed without network access or an API key.
+Every call reports token usage like the OpenAI API does, including cached
+prompt tokens from a simulated prefix cache.
+"""
+
+import asyncio
+import copy
+import hashlib
+import math
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from pydantic import BaseModel
+
+from .token_usage import record_usage
+
+Responder = Callable[[List[Any]], Any]
+
+DEFAULT_TEXT = "Thanks for visiting Version Coffee!"
+
+# Token counts are estimated at four characters per token. Like OpenAI's
+# prompt caching, prefixes of at least 1024 tokens that were sent before are
+# cached, in steps of 128 tokens.
+CHARS_PER_TOKEN = 4
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+
+DEFAULT_STRUCTURED_RESPONSES: Dict[str, Dict[str, Any]] = {
+    "GuardDecision": {
+        "chain_of_thought": "",
+        "decision": "allowed",
+        "message": "",
+    },
+    "ClassificationDecision": {
+        "chain_of_thought": "",
+        "decision": "details_agent",
+        "message": "",
+    },
+    "GuardRoutingDecision": {
+        "chain_of_thought": "",
+        "allowed": True,
+        "rejection_message": "",
+        "route": "details_agent",
+    },
+    "RecommendationClassification": {
+        "chain_of_thought": "",
+        "recommendation_type": "popular",
+        "parameters": [],
+    },
+    "OrderTakingDecision": {
+        "step_number": "1",
+        "response": "What would you like to order?",
+        "operations": [],
+    },
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def prompt_text(messages) -> str:
+    """The prompt as one string, in the order the provider would see it."""
+    parts = []
+    for message in messages:
+        if isinstance(message, dict):
+            parts.append(f"{message['role']}\n{message['content']}\n")
+        else:
+            parts.append(f"{message.type}\n{message.content}\n")
+    return "".join(parts)
+
+
+class FakePrefixCache:
+    """Remembers prompt prefixes and reports how much of a prompt was cached."""
+
+    def __init__(self):
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, text: str) -> int:
+        """Cached tokens of ``text``; its prefixes are remembered afterwards."""
+        step = CACHE_STEP_TOKENS * CHARS_PER_TOKEN
+        digest = hashlib.sha1()
+        prefixes = []
+        for end in range(step, len(text) + 1, step):
+            digest.update(text[end - step : end].encode("utf-8"))
+            prefixes.append((end, digest.digest()))
+
+        cached = 0
+        with self._lock:
+            for end, prefix in prefixes:
+                if prefix in self._seen:
+                    cached = end
+            self._seen.update(prefix for _, prefix in prefixes)
+        cached_tokens = cached // CHARS_PER_TOKEN
+        return cached_tokens if cached_tokens >= CACHE_MIN_TOKENS else 0
+
+    def clear(self):
+        with self._lock:
+            self._seen.clear()
+
+
+class FakeChatModel:
+    """Deterministic chat model with configurable latency.
+
+    ``latency`` is paid once per call before the first token, plus
+    ``prompt_token_latency`` for every prompt token not served from the
+    prefix cache (prefill), and ``token_latency`` once per streamed chunk.
+    ``text`` is either a fixed string or a callable receiving the input
+    messages. ``structured`` maps a schema class name to a
+    dict (or a callable returning one) used to build structured outputs.
+    A LangChain ``rate_limiter`` is honoured before every call, like
+    ``ChatOpenAI`` does.
+    """
+
+    def __init__(
+        self,
+        text: str | Responder = DEFAULT_TEXT,
+        structured: Optional[Dict[str, Dict[str, Any] | Responder]] = None,
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+        chunk_size: int = 4,
+        prompt_token_latency: float = 0.0,
+        rate_limiter=None,
+    ):
+        self.text = text
+        self.structured = {**DEFAULT_STRUCTURED_RESPONSES, **(structured or {})}
+        self.latency = latency
+        self.token_latency = token_latency
+        self.chunk_size = chunk_size
+        self.prompt_token_latency = prompt_token_latency
+        self.rate_limiter = rate_limiter
+        self.calls: List[Dict[str, Any]] = []
+        self.prefix_cache = FakePrefixCache()
+
+    def _acquire(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    async def _aacquire(self):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.aacquire()
+
+    def _record(self, kind: str, messages, schema=None):
+        self.calls.append(
+            {
+                "kind": kind,
+                "schema": schema.__name__ if schema else None,
+                "messages": messages,
+                "time": time.perf_counter(),
+            }
+        )
+
+    def _usage(self, messages, output: str) -> Dict[str, Any]:
+        """Usage metadata of one call, also counted for the current request."""
+        prompt = prompt_text(messages)
+        input_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(output)
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": self.prefix_cache.lookup(prompt)},
+        }
+        record_usage(usage)
+        return usage
+
+    def _first_token_delay(self, usage: Dict[str, Any]) -> float:
+        uncached = usage["input_tokens"] - usage["input_token_details"]["cache_read"]
+        return self.latency + self.prompt_token_latency * uncached
+
+    def _text_for(self, messages) -> str:
+        return self.text(messages) if callable(self.text) else self.text
+
+    def _structured_for(self, schema, messages) -> BaseModel:
+        response = self.structured.get(schema.__name__, {})
+        if callable(response):
+            response = response(messages)
+        return schema.model_validate(response)
+
+    def invoke(self, messages, **kwargs) -> AIMessage:
+        self._acquire()
+        self._record("invoke", messages)
+        text = self._text_for(messages)
+        usage = self._usage(messages, text)
+        time.sleep(self._first_token_delay(usage))
+        return AIMessage(content=text, usage_metadata=usage)
+
+    def stream(self, messages, **kwargs) -> Iterator[AIMessageChunk]:
+        self._acquire()
+        self._record("stream", messages)
+        text = self._text_for(messages)
+        usage = self._usage(messages, text)
+        time.sleep(self._first_token_delay(usage))
+        for i in range(0, len(text), self.chunk_size):
+            time.sleep(self.token_latency)
+            yield AIMessageChunk(content=text[i : i + self.chunk_size])
+        yield AIMessageChunk(content="", usage_metadata=usage)
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        await self._aacquire()
+        self._record("invoke", messages)
+        text = self._text_for(messages)
+        usage = self._usage(messages, text)
+        await asyncio.sleep(self._first_token_delay(usage))
+        return AIMessage(content=text, usage_metadata=usage)
+
+    async def astream(self, messages, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        await self._aacquire()
+        self._record("stream", messages)
+        text = self._text_for(messages)
+        usage = self._usage(messages, text)
+        await asyncio.sleep(self._first_token_delay(usage))
+        for i in range(0, len(text), self.chunk_size):
+            await asyncio.sleep(self.token_latency)
+            yield AIMessageChunk(content=text[i : i + self.chunk_size])
+        yield AIMessageChunk(content="", usage_metadata=usage)
+
+    def with_structured_output(self, schema, **kwargs) -> "FakeStructuredModel":
+        return FakeStructuredModel(self, schema)
+
+    def bind(self, response_format=None, **kwargs) -> "FakeChatModel":
+        """Bound copy; a pydantic ``response_format`` makes it emit raw JSON."""
+        if response_format is None:
+            return self
+        bound = copy.copy(self)
+        bound.text = lambda messages: self._structured_for(
+            response_format, messages
+        ).model_dump_json()
+        return bound
+
+
+class FakeStructuredModel:
+    """Result of ``FakeChatModel.with_structured_output``."""
+
+    def __init__(self, model: FakeChatModel, schema):
+        self.model = model
+        self.schema = schema
+
+    def invoke(self, messages, **kwargs) -> BaseModel:
+        self.model._acquire()
+        self.model._record("structured", messages, self.schema)
+        result = self.model._structured_for(self.schema, messages)
+        usage = self.model._usage(messages, result.model_dump_json())
+        time.sleep(self.model._first_token_delay(usage))
+        return result
+
+    async def ainvoke(self, messages, **kwargs) -> BaseModel:
+        await self.model._aacquire()
+        self.model._record("structured", messages, self.schema)
+        result = self.model._structured_for(self.schema, messages)
+        usage = self.model._usage(messages, result.model_dump_json())
+        await asyncio.sleep(self.model._first_token_delay(usage))
+        return result
+
+
+class FakeEmbeddings:
+    """Deterministic bag-of-words embeddings with configurable latency.
+
+    Words are hashed into ``dimensions`` buckets, so texts sharing words get
+    similar vectors and retrieval behaves plausibly without a remote model.
+    """
+
+    def __init__(self, dimensions: int = 256, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            bucket = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16)
+            vector[bucket % self.dimensions] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
@@ -1,27 +1,53 @@
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
 import os
-from copy import deepcopy
+import json
 import dotenv
 from typing import List, Dict, Any
 from .types import AgentMessage, GuardMemory
+from .metrics import stage
+from .llm_clients import chat_model
+from .guard_prefilter import DENY_MESSAGE, NOT_ALLOWED, GuardPrefilter, normalize
+from .decision_cache import (
+    DECISION_CACHE_ENABLED,
+    DecisionCache,
+    fingerprint,
+    model_name,
+    shared_backend,
+)
+from .response_cache import SingleFlight, prompt_key
 
 dotenv.load_dotenv()
 
+# "on" answers obvious turns locally, "shadow" still asks the LLM but records
+# how often the pre-filter would have agreed, "off" disables it.
+GUARD_PREFILTER_MODE = os.getenv("GUARD_PREFILTER", "on")
 
-class GuardDecision(BaseModel):
-    chain_of_thought: str
-    decision: str
-    message: str
 
+# Menu items listed in the guard prompt, also used by the local pre-filter.
+MENU_ITEMS = [
+    "Cappuccino",
+    "Jumbo Savory Scone",
+    "Latte",
+    "Chocolate Chip Biscotti",
+    "Espresso Shot",
+    "Hazelnut Biscotti",
+    "Chocolate Croissant",
+    "Cranberry Scone",
+    "Croissant",
+    "Almond Croissant",
+    "Ginger Biscotti",
+    "Oatmeal Scone",
+    "Ginger Scone",
+    "Chocolate Syrup",
+    "Hazelnut Syrup",
+    "Caramel Syrup",
+    "Sugar Free Vanilla Syrup",
+    "Dark Chocolate",
+]
+MENU_ITEMS_PROMPT = "\n".join(f"            - {item}" for item in MENU_ITEMS)
 
-class GuardAgent:
-    def __init__(self):
-        self.llm = ChatOpenAI(model=os.getenv("MODEL_NAME", "gpt-4o-mini"))
-
-    def get_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
-        messages = deepcopy(messages)
-        system_prompt = """
+# Built once so every guard prompt starts with the same bytes.
+GUARD_SYSTEM_PROMPT = f"""
         You are a guard agent for a coffee shop application.
         
         The coffee shop is called "Version Coffee".
@@ -29,24 +55,7 @@ class GuardAgent:
         The user is allowed to ask for:
         - General questions about Version Coffee (the shop)
         - Menu items, prices, ingredients. The items are:
-            - Cappuccino
-            - Jumbo Savory Scone
-            - Latte
-            - Chocolate Chip Biscotti
-            - Espresso Shot
-            - Hazelnut Biscotti
-            - Chocolate Croissant
-            - Cranberry Scone
-            - Croissant
-            - Almond Croissant
-            - Ginger Biscotti
-            - Oatmeal Scone
-            - Ginger Scone
-            - Chocolate Syrup
-            - Hazelnut Syrup
-            - Caramel Syrup
-            - Sugar Free Vanilla Syrup
-            - Dark Chocolate
+{MENU_ITEMS_PROMPT}
         - Recommendations
         - Shop info (location, hours, delivery, about us)
         - Placing/completing orders
@@ -57,24 +66,147 @@ class GuardAgent:
         - Staff questions or recipes
 
         Output JSON:
-        {
+        {{
             "chain of thought": your reasoning,
             "decision": "allowed" or "not allowed",
             "message": "" if allowed, else rejection message
-        }
+        }}
         """
 
+
+class GuardDecision(BaseModel):
+    chain_of_thought: str
+    decision: str
+    message: str
+
+
+class GuardAgent:
+    def __init__(self, llm=None, prefilter_mode=None):
+        self.llm = llm or chat_model()
+        self.structured_llm = self.llm.with_structured_output(GuardDecision)
+        # Concurrent turns with the same prompt share one decision call.
+        self.flights = SingleFlight()
+        self.prefilter_mode = prefilter_mode or GUARD_PREFILTER_MODE
+        self.prefilter = None
+        if self.prefilter_mode != "off":
+            self.prefilter = GuardPrefilter.from_catalog(MENU_ITEMS)
+
+        # The guard only looks at the last message, so verdicts are cached on
+        # its normalized text and shared across every conversation.
+        self.decision_cache = None
+        if DECISION_CACHE_ENABLED:
+            self.decision_cache = DecisionCache(
+                "guard",
+                fingerprint(
+                    model_name(self.llm),
+                    GUARD_SYSTEM_PROMPT,
+                    json.dumps(GuardDecision.model_json_schema()),
+                ),
+                backend=shared_backend(),
+            )
+
+    def _prefilter_decision(self, messages: List[Dict[str, Any]]):
+        """Fast-path ``GuardDecision`` for obvious turns, else ``None``."""
+        if self.prefilter is None:
+            return None, None
+        verdict = self.prefilter.check(messages[-1]["content"])
+        if verdict is None or self.prefilter_mode == "shadow":
+            return verdict, None
+        return verdict, GuardDecision(
+            chain_of_thought="Matched by the local guard pre-filter.",
+            decision=verdict,
+            message=DENY_MESSAGE if verdict == NOT_ALLOWED else "",
+        )
+
+    def _record_shadow(self, verdict, result):
+        if self.prefilter is not None:
+            self.prefilter.record_agreement(verdict, result.decision)
+
+    def _cached_decision(self, messages: List[Dict[str, Any]]):
+        if self.decision_cache is None:
+            return None, None
+        key = normalize(messages[-1]["content"])
+        return key, self.decision_cache.get_model(key, GuardDecision)
+
+    def _cache_decision(self, key, result):
+        if self.decision_cache is not None:
+            self.decision_cache.set_model(key, result)
+
+    # The async paths reach a shared cache backend off the event loop.
+
+    async def _acached_decision(self, messages: List[Dict[str, Any]]):
+        if self.decision_cache is None:
+            return None, None
+        key = normalize(messages[-1]["content"])
+        return key, await self.decision_cache.aget_model(key, GuardDecision)
+
+    async def _acache_decision(self, key, result):
+        if self.decision_cache is not None:
+            await self.decision_cache.aset_model(key, result)
+
+    def _build_input_messages(self, messages: List[Dict[str, Any]]):
         input_message = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": GUARD_SYSTEM_PROMPT},
             {"role": "user", "content": messages[-1]["content"]},
         ]
+        return input_message
 
-        structured_llm = self.llm.with_structured_output(GuardDecision)
-        result = structured_llm.invoke(input_message)
+    def _fast_path(self, messages: List[Dict[str, Any]]):
+        """``(verdict, cache_key, decision)``; ``decision`` is ``None`` when
+        the LLM has to be asked, and the other two are then passed on to
+        ``_record_llm_decision``."""
+        verdict, decision = self._prefilter_decision(messages)
+        if decision is not None:
+            return verdict, None, decision
+        cache_key, cached = self._cached_decision(messages)
+        return verdict, cache_key, cached
+
+    async def _afast_path(self, messages: List[Dict[str, Any]]):
+        verdict, decision = self._prefilter_decision(messages)
+        if decision is not None:
+            return verdict, None, decision
+        cache_key, cached = await self._acached_decision(messages)
+        return verdict, cache_key, cached
+
+    def _record_llm_decision(self, verdict, cache_key, result):
+        self._record_shadow(verdict, result)
+        self._cache_decision(cache_key, result)
+
+    async def _arecord_llm_decision(self, verdict, cache_key, result):
+        self._record_shadow(verdict, result)
+        await self._acache_decision(cache_key, result)
+
+    def _llm_decision(self, messages: List[Dict[str, Any]]) -> GuardDecision:
+        input_message = self._build_input_messages(messages)
+        return self.flights.do(
+            prompt_key(input_message), lambda: self.structured_llm.invoke(input_message)
+        )
+
+    async def _allm_decision(self, messages: List[Dict[str, Any]]) -> GuardDecision:
+        input_message = self._build_input_messages(messages)
+        return await self.flights.ado(
+            prompt_key(input_message),
+            lambda: self.structured_llm.ainvoke(input_message),
+        )
+
+    def get_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
+        with stage("guard"):
+            verdict, cache_key, result = self._fast_path(messages)
+            if result is None:
+                result = self._llm_decision(messages)
+                self._record_llm_decision(verdict, cache_key, result)
         output = self.postprocess(result)
 
         return output
 
+    async def aget_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
+        with stage("guard"):
+            verdict, cache_key, result = await self._afast_path(messages)
+            if result is None:
+                result = await self._allm_decision(messages)
+                await self._arecord_llm_decision(verdict, cache_key, result)
+        return self.postprocess(result)
+
     def postprocess(self, result) -> AgentMessage:
         """Convert Pydantic model to message dict."""
         memory: GuardMemory = {"agent": "guard", "decision": result.decision}
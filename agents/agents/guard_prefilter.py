@@ -0,0 +1,241 @@
+import os
+import re
+from typing import Dict, Iterable, List, Optional
+
+from .catalog import Catalog
+
+ALLOWED = "allowed"
+NOT_ALLOWED = "not allowed"
+
+DENY_MESSAGE = (
+    "Sorry, I can only help with Version Coffee's menu, orders and shop information."
+)
+
+# Short replies the guard prompt explicitly allows ("that's all", "yes please").
+CONFIRMATION_PHRASES = {
+    "yes",
+    "yes please",
+    "yeah",
+    "yep",
+    "sure",
+    "ok",
+    "okay",
+    "no",
+    "no thanks",
+    "no thank you",
+    "nope",
+    "that's all",
+    "that's all thanks",
+    "that's all thank you",
+    "that's it",
+    "that is all",
+    "that will be all",
+    "nothing else",
+    "done",
+    "i'm done",
+    "sounds good",
+    "perfect",
+    "great",
+    "thanks",
+    "thank you",
+    "check out",
+    "checkout",
+}
+
+# Words that may surround menu items in a plain order ("can I get two lattes
+# please"). A message is only fast-path allowed when every word is either one
+# of these, a number or part of a menu item name.
+ORDER_WORDS = {
+    "a",
+    "an",
+    "and",
+    "another",
+    "add",
+    "also",
+    "any",
+    "can",
+    "could",
+    "for",
+    "get",
+    "give",
+    "have",
+    "i",
+    "i'd",
+    "i'll",
+    "i'm",
+    "id",
+    "im",
+    "in",
+    "it",
+    "just",
+    "like",
+    "make",
+    "me",
+    "more",
+    "my",
+    "of",
+    "on",
+    "one",
+    "order",
+    "please",
+    "plus",
+    "some",
+    "take",
+    "thanks",
+    "thank",
+    "that",
+    "the",
+    "to",
+    "too",
+    "want",
+    "with",
+    "would",
+    "you",
+    "x",
+}
+
+NUMBER_WORDS = {
+    "two",
+    "three",
+    "four",
+    "five",
+    "six",
+    "seven",
+    "eight",
+    "nine",
+    "ten",
+    "couple",
+    "few",
+}
+
+# Topics the guard prompt rejects outright ("Staff questions or recipes").
+DEFAULT_DENY_LIST = [
+    "recipe",
+    "recipes",
+    "how do you make",
+    "how to make",
+    "staff",
+    "employee",
+    "employees",
+    "salary",
+]
+
+MAX_FAST_PATH_WORDS = 12
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, unify apostrophes and collapse whitespace and punctuation."""
+    text = text.lower().replace("’", "'")
+    return " ".join(_WORD_RE.findall(text))
+
+
+def load_deny_list() -> List[str]:
+    """Deny-list from ``GUARD_DENY_LIST`` (comma separated) or
+    ``GUARD_DENY_LIST_PATH`` (one phrase per line), else the defaults."""
+    path = os.getenv("GUARD_DENY_LIST_PATH")
+    if path:
+        with open(path, "r") as f:
+            return [line.strip() for line in f if line.strip()]
+    terms = os.getenv("GUARD_DENY_LIST")
+    if terms is not None:
+        return [term.strip() for term in terms.split(",") if term.strip()]
+    return DEFAULT_DENY_LIST
+
+
+class GuardPrefilter:
+    """Deterministic fast path in front of the guard LLM call.
+
+    ``check`` returns ``"allowed"`` or ``"not allowed"`` for messages it is
+    sure about and ``None`` for everything else, which must go to the LLM.
+    """
+
+    def __init__(
+        self,
+        menu_items: Iterable[str],
+        deny_list: Optional[Iterable[str]] = None,
+        max_words: int = MAX_FAST_PATH_WORDS,
+    ):
+        self.menu_words = set()
+        for item in menu_items:
+            words = normalize(item).split()
+            self.menu_words.update(words)
+            # Plural of the last word: "two lattes", "croissants".
+            self.menu_words.add(words[-1] + "s")
+
+        deny_list = load_deny_list() if deny_list is None else deny_list
+        self.deny_patterns = [
+            re.compile(r"\b" + re.escape(normalize(term)) + r"\b")
+            for term in deny_list
+            if normalize(term)
+        ]
+        self.max_words = max_words
+
+        self.checks = 0
+        self.allowed_hits = 0
+        self.denied_hits = 0
+        self.agreements = 0
+        self.disagreements = 0
+
+    @classmethod
+    def from_catalog(cls, menu_items: Iterable[str], catalog=None, **kwargs):
+        """Build a pre-filter from the guard prompt's menu and the catalog."""
+        catalog = catalog or Catalog()
+        return cls(list(menu_items) + catalog.names, **kwargs)
+
+    def check(self, content: str) -> Optional[str]:
+        self.checks += 1
+        verdict = self._verdict(normalize(content))
+        if verdict == ALLOWED:
+            self.allowed_hits += 1
+        elif verdict == NOT_ALLOWED:
+            self.denied_hits += 1
+        return verdict
+
+    def _verdict(self, text: str) -> Optional[str]:
+        if not text:
+            return None
+
+        for pattern in self.deny_patterns:
+            if pattern.search(text):
+                return NOT_ALLOWED
+
+        if text in CONFIRMATION_PHRASES:
+            return ALLOWED
+
+        words = text.split()
+        if len(words) > self.max_words:
+            return None
+
+        mentions_menu = False
+        for word in words:
+            if word in self.menu_words:
+                mentions_menu = True
+            elif word not in ORDER_WORDS and word not in NUMBER_WORDS:
+                if not word.isdigit():
+                    return None
+        return ALLOWED if mentions_menu else None
+
+    def record_agreement(self, verdict: Optional[str], llm_decision: str):
+        """Compare a fast-path verdict with the LLM's decision for the same turn."""
+        if verdict is None:
+            return
+        if verdict == llm_decision:
+            self.agreements += 1
+        else:
+            self.disagreements += 1
+
+    @property
+    def hits(self) -> int:
+        return self.allowed_hits + self.denied_hits
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "checks": self.checks,
+            "allowed_hits": self.allowed_hits,
+            "denied_hits": self.denied_hits,
+            "hit_rate": self.hits / self.checks if self.checks else 0.0,
+            "agreements": self.agreements,
+            "disagreements": self.disagreements,
+        }
@@ -0,0 +1,256 @@
+import json
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel
+
+from .types import AgentMessage
+from .prompt_assembly import assemble
+from .metrics import stage
+from .guard_agent import MENU_ITEMS_PROMPT, GuardAgent, GuardDecision
+from .classification_agent import ClassificationAgent, ClassificationDecision
+from .local_router import CONTEXT_TURNS
+from .guard_prefilter import ALLOWED, DENY_MESSAGE, NOT_ALLOWED, normalize
+from .decision_cache import (
+    DECISION_CACHE_ENABLED,
+    DecisionCache,
+    fingerprint,
+    model_name,
+    recent_turns_key,
+    shared_backend,
+)
+from .response_cache import SingleFlight, prompt_key
+
+# The guard's and the router's instructions in one prompt, built once so it
+# is sent byte-for-byte identical.
+GUARD_ROUTING_SYSTEM_PROMPT = f"""
+        You are the gatekeeper and router for the chatbot of a coffee shop
+        called "Version Coffee". Judge only the latest user message, using
+        the earlier conversation as context.
+
+        First decide whether the latest message is allowed. The user is
+        allowed to ask for:
+        - General questions about Version Coffee (the shop)
+        - Menu items, prices, ingredients. The items are:
+{MENU_ITEMS_PROMPT}
+        - Recommendations
+        - Shop info (location, hours, delivery, about us)
+        - Placing/completing orders
+        - Confirming items ("that's all", "yes please")
+
+        NOT allowed:
+        - Unrelated content
+        - Staff questions or recipes
+
+        Then choose the agent that should answer it:
+        1. details_agent: Questions about Version Coffee (general info, location, hours, delivery, menu details, about us)
+        2. order_taking_agent: Taking and managing orders
+        3. recommendation_agent: Product recommendations
+
+        Output JSON:
+        {{
+            "chain of thought": brief reasoning about both decisions,
+            "allowed": true or false,
+            "rejection_message": "" if allowed, else a short polite rejection,
+            "route": "details_agent" or "order_taking_agent" or "recommendation_agent"
+        }}
+        """
+
+
+class GuardRoutingDecision(BaseModel):
+    chain_of_thought: str
+    allowed: bool
+    rejection_message: str
+    route: Literal["details_agent", "order_taking_agent", "recommendation_agent"]
+
+
+class GuardRoutingAgent:
+    """Guard verdict and routing decision from one structured LLM call.
+
+    Wraps the guard and classification agents and keeps their fast paths:
+    the guard pre-filter and decision cache, and the local router, sticky
+    routing and routing cache. The fused call is only made when neither
+    decision can be made without the LLM; when one of them can, the other
+    agent's own call is made instead.
+    """
+
+    def __init__(
+        self,
+        guard_agent: GuardAgent,
+        classification_agent: ClassificationAgent,
+        llm=None,
+    ):
+        self.guard_agent = guard_agent
+        self.classification_agent = classification_agent
+        self.llm = llm or classification_agent.llm
+        self.structured_llm = self.llm.with_structured_output(GuardRoutingDecision)
+        # Concurrent turns with the same prompt share one decision call.
+        self.flights = SingleFlight()
+        # Same history window as the router, so the fused prompt is no longer
+        # than the routing prompt it replaces.
+        self.context_policy = classification_agent.context_policy
+
+        self.fused_calls = 0
+        self.guard_calls = 0
+        self.routing_calls = 0
+
+        self.decision_cache = None
+        if DECISION_CACHE_ENABLED:
+            self.decision_cache = DecisionCache(
+                "guard_routing",
+                fingerprint(
+                    model_name(self.llm),
+                    GUARD_ROUTING_SYSTEM_PROMPT,
+                    json.dumps(GuardRoutingDecision.model_json_schema()),
+                ),
+                backend=shared_backend(),
+            )
+
+    def _cached_decision(self, messages: List[Dict[str, Any]]):
+        if self.decision_cache is None:
+            return None, None
+        key = recent_turns_key(messages, CONTEXT_TURNS, normalize)
+        return key, self.decision_cache.get_model(key, GuardRoutingDecision)
+
+    def _cache_decision(self, key, result):
+        if self.decision_cache is not None:
+            self.decision_cache.set_model(key, result)
+
+    async def _acached_decision(self, messages: List[Dict[str, Any]]):
+        if self.decision_cache is None:
+            return None, None
+        key = recent_turns_key(messages, CONTEXT_TURNS, normalize)
+        return key, await self.decision_cache.aget_model(key, GuardRoutingDecision)
+
+    async def _acache_decision(self, key, result):
+        if self.decision_cache is not None:
+            await self.decision_cache.aset_model(key, result)
+
+    def _build_input_messages(self, messages: List[Dict[str, Any]]):
+        return assemble(
+            GUARD_ROUTING_SYSTEM_PROMPT, self.context_policy.window(messages)
+        )
+
+    def _llm_decision(self, messages: List[Dict[str, Any]]) -> GuardRoutingDecision:
+        input_messages = self._build_input_messages(messages)
+        return self.flights.do(
+            prompt_key(input_messages),
+            lambda: self.structured_llm.invoke(input_messages),
+        )
+
+    async def _allm_decision(
+        self, messages: List[Dict[str, Any]]
+    ) -> GuardRoutingDecision:
+        input_messages = self._build_input_messages(messages)
+        return await self.flights.ado(
+            prompt_key(input_messages),
+            lambda: self.structured_llm.ainvoke(input_messages),
+        )
+
+    def _split(self, result: GuardRoutingDecision):
+        """The fused decision as the guard's and the router's decisions."""
+        guard = GuardDecision(
+            chain_of_thought=result.chain_of_thought,
+            decision=ALLOWED if result.allowed else NOT_ALLOWED,
+            message="" if result.allowed else result.rejection_message or DENY_MESSAGE,
+        )
+        route = ClassificationDecision(
+            chain_of_thought=result.chain_of_thought,
+            decision=result.route,
+            message="",
+        )
+        return guard, route
+
+    def _record_fused_decision(self, messages, verdict, result):
+        self.fused_calls += 1
+        guard, route = self._split(result)
+        # Shadow pre-filter agreement and router training data are recorded
+        # as for the separate calls; their caches are keyed on other prompts
+        # and are left alone.
+        self.guard_agent._record_shadow(verdict, guard)
+        if result.allowed:
+            self.classification_agent._log_decision(messages, route)
+        return guard, route
+
+    def _output(self, guard, route) -> Tuple[AgentMessage, Optional[AgentMessage]]:
+        guard_response = self.guard_agent.postprocess(guard)
+        if guard.decision == NOT_ALLOWED:
+            return guard_response, None
+        return guard_response, self.classification_agent.postprocess(route)
+
+    def decide(
+        self, messages: List[Dict[str, Any]]
+    ) -> Tuple[AgentMessage, Optional[AgentMessage]]:
+        """``(guard_response, classification_response)``.
+
+        Both are the messages the separate agents would return; the
+        classification response is ``None`` when the turn is rejected.
+        """
+        with stage("guard_routing"):
+            return self._decide(messages)
+
+    async def adecide(
+        self, messages: List[Dict[str, Any]]
+    ) -> Tuple[AgentMessage, Optional[AgentMessage]]:
+        with stage("guard_routing"):
+            return await self._adecide(messages)
+
+    def _decide(self, messages: List[Dict[str, Any]]):
+        verdict, guard_key, guard = self.guard_agent._fast_path(messages)
+        if guard is not None and guard.decision == NOT_ALLOWED:
+            return self._output(guard, None)
+        route_key, route = self.classification_agent._fast_path(messages)
+
+        if guard is None and route is None:
+            fused_key, result = self._cached_decision(messages)
+            if result is None:
+                result = self._llm_decision(messages)
+                self._cache_decision(fused_key, result)
+                guard, route = self._record_fused_decision(messages, verdict, result)
+            else:
+                guard, route = self._split(result)
+            return self._output(guard, route)
+
+        if guard is None:
+            self.guard_calls += 1
+            guard = self.guard_agent._llm_decision(messages)
+            self.guard_agent._record_llm_decision(verdict, guard_key, guard)
+        elif route is None:
+            self.routing_calls += 1
+            route = self.classification_agent._llm_decision(messages)
+            self.classification_agent._record_llm_decision(messages, route_key, route)
+        return self._output(guard, route)
+
+    async def _adecide(self, messages: List[Dict[str, Any]]):
+        verdict, guard_key, guard = await self.guard_agent._afast_path(messages)
+        if guard is not None and guard.decision == NOT_ALLOWED:
+            return self._output(guard, None)
+        route_key, route = await self.classification_agent._afast_path(messages)
+
+        if guard is None and route is None:
+            fused_key, result = await self._acached_decision(messages)
+            if result is None:
+                result = await self._allm_decision(messages)
+                await self._acache_decision(fused_key, result)
+                guard, route = self._record_fused_decision(messages, verdict, result)
+            else:
+                guard, route = self._split(result)
+            return self._output(guard, route)
+
+        if guard is None:
+            self.guard_calls += 1
+            guard = await self.guard_agent._allm_decision(messages)
+            await self.guard_agent._arecord_llm_decision(verdict, guard_key, guard)
+        elif route is None:
+            self.routing_calls += 1
+            route = await self.classification_agent._allm_decision(messages)
+            await self.classification_agent._arecord_llm_decision(
+                messages, route_key, route
+            )
+        return self._output(guard, route)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "fused_calls": self.fused_calls,
+            "guard_calls": self.guard_calls,
+            "routing_calls": self.routing_calls,
+        }
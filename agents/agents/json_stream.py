@@ -0,0 +1,99 @@
+import json
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class JsonStringFieldStreamer:
+    """Incrementally extracts one top-level string field from streamed JSON.
+
+    Feed raw chunks of a JSON object as they arrive from the model; ``feed``
+    returns the newly decoded characters of ``field``'s value, so the text
+    can be forwarded to the user before the object is complete. Keys and
+    values of nested objects are tracked but never emitted.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.depth = 0
+        self.in_string = False
+        self.string_is_key = False
+        self.expecting_key = False
+        self.capturing = False
+        self.done = False
+        self.last_key = None
+        self._key = []
+        self._escape = None
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        for char in chunk:
+            if self.in_string:
+                self._string_char(char, out)
+            elif char == '"':
+                self.in_string = True
+                self.string_is_key = self.depth == 1 and self.expecting_key
+                self.capturing = (
+                    not self.string_is_key
+                    and self.depth == 1
+                    and not self.done
+                    and self.last_key == self.field
+                )
+                self._key = []
+            elif char in "{[":
+                self.depth += 1
+                self.expecting_key = char == "{"
+            elif char in "}]":
+                self.depth -= 1
+            elif char == ":":
+                self.expecting_key = False
+            elif char == "," and self.depth == 1:
+                self.expecting_key = True
+                self.last_key = None
+        return "".join(out)
+
+    def _string_char(self, char: str, out):
+        if self._escape is not None:
+            self._escape += char
+            decoded = self._decode_escape()
+            if decoded is not None:
+                self._escape = None
+                self._emit(decoded, out)
+            return
+        if char == "\\":
+            self._escape = "\\"
+        elif char == '"':
+            self.in_string = False
+            if self.string_is_key:
+                self.last_key = "".join(self._key)
+            elif self.capturing:
+                self.capturing = False
+                self.done = True
+        else:
+            self._emit(char, out)
+
+    def _decode_escape(self):
+        """Decoded text of the pending escape, or ``None`` if incomplete."""
+        escape = self._escape
+        if escape[1] != "u":
+            return _SIMPLE_ESCAPES.get(escape[1], escape[1])
+        if len(escape) < 6:
+            return None
+        # A high surrogate needs its low surrogate before it can be decoded.
+        if 0xD800 <= int(escape[2:6], 16) <= 0xDBFF and len(escape) < 12:
+            return None
+        return json.loads('"' + escape + '"')
+
+    def _emit(self, text: str, out):
+        if self.string_is_key:
+            self._key.append(text)
+        elif self.capturing:
+            out.append(text)
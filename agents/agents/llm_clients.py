@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import dotenv
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+dotenv.load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# One keep-alive pool for every model and embedding call in the process.
+# httpx drops idle connections after 5s by default, so a quiet minute would
+# otherwise cost a fresh TCP and TLS handshake on the next turn.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 50))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 90))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+# Connections opened at startup; 0 skips the warm-up.
+LLM_WARMUP_CONNECTIONS = int(os.getenv("LLM_WARMUP_CONNECTIONS", 4))
+
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_chat_model: Optional[ChatOpenAI] = None
+_embeddings: Optional[OpenAIEmbeddings] = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(limits=_limits(), timeout=_timeout())
+    return _http_client
+
+
+def async_http_client() -> httpx.AsyncClient:
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+    return _async_http_client
+
+
+def chat_model() -> ChatOpenAI:
+    """The process-wide chat model, shared by every agent.
+
+    ``ChatOpenAI`` is immutable once built, so one instance serves all
+    agents; ``bind`` and ``with_structured_output`` wrap it without
+    copying the client.
+    """
+    global _chat_model
+    if _chat_model is None:
+        _chat_model = ChatOpenAI(
+            model=os.getenv("MODEL_NAME", "gpt-4o-mini"),
+            stream_usage=True,
+            http_client=http_client(),
+            http_async_client=async_http_client(),
+        )
+    return _chat_model
+
+
+def embeddings_model() -> OpenAIEmbeddings:
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = OpenAIEmbeddings(
+            model=os.getenv("EMBEDDING_MODEL"),
+            http_client=http_client(),
+            http_async_client=async_http_client(),
+        )
+    return _embeddings
+
+
+async def awarm_up(llm, connections: int = LLM_WARMUP_CONNECTIONS) -> int:
+    """Open ``connections`` pooled connections to the model's API.
+
+    Lists the models over that many concurrent requests, which resolves DNS
+    and completes the TLS handshakes before the first user turn. Models
+    without an OpenAI client, such as the fakes, are skipped. Returns the
+    number of requests that got a response; failures are logged, since the
+    service can still start without a warm pool.
+    """
+    client = getattr(llm, "root_async_client", None)
+    if client is None or connections <= 0:
+        return 0
+
+    async def ping():
+        try:
+            await client.with_options(max_retries=0).models.list()
+        except Exception as e:
+            # An error status still leaves a warm connection in the pool.
+            if getattr(e, "status_code", None) is None:
+                raise
+
+    results = await asyncio.gather(
+        *(ping() for _ in range(connections)), return_exceptions=True
+    )
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        logger.warning("LLM warm-up failed: %s", failures[0])
+    return len(results) - len(failures)
@@ -0,0 +1,149 @@
+import json
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# How many trailing messages the router looks at.
+CONTEXT_TURNS = 3
+
+# Share of the user message's words that must have been seen in training.
+# Naive Bayes is confidently wrong on unseen vocabulary, so below this the
+# router reports zero confidence and the caller defers to the LLM.
+MIN_KNOWN_RATIO = 0.75
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower().replace("’", "'"))
+
+
+def last_agent(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """Agent that produced the most recent assistant message, if any."""
+    for message in reversed(messages):
+        if message["role"] == "assistant":
+            return (message.get("memory") or {}).get("agent")
+    return None
+
+
+def extract_features(
+    messages: List[Dict[str, Any]], turns: int = CONTEXT_TURNS
+) -> List[str]:
+    """Bag of words and bigrams over the last ``turns`` messages.
+
+    Features of the current user message are kept apart from the earlier
+    context, and the agent that answered last is added as its own feature.
+    """
+    features = []
+    words = _words(messages[-1]["content"])
+    features += ["u:" + word for word in words]
+    features += ["u2:" + a + "_" + b for a, b in zip(words, words[1:])]
+
+    for message in messages[-turns:-1]:
+        prefix = "a:" if message["role"] == "assistant" else "c:"
+        features += [prefix + word for word in _words(message["content"])]
+
+    features.append("agent:" + (last_agent(messages) or "none"))
+    return features
+
+
+class LocalRouter:
+    """Multinomial naive Bayes router trained on logged LLM routing decisions.
+
+    Runs on CPU in microseconds; ``predict`` returns the most likely agent and
+    its posterior probability so callers can fall back to the LLM when the
+    router is unsure.
+    """
+
+    def __init__(
+        self,
+        class_counts: Dict[str, int],
+        feature_counts: Dict[str, Dict[str, int]],
+        alpha: float = 1.0,
+        turns: int = CONTEXT_TURNS,
+    ):
+        self.class_counts = class_counts
+        self.feature_counts = feature_counts
+        self.alpha = alpha
+        self.turns = turns
+
+        self.vocabulary = set()
+        for counts in feature_counts.values():
+            self.vocabulary.update(counts)
+        self.vocabulary_size = len(self.vocabulary)
+
+        total = sum(class_counts.values())
+        self._log_priors = {
+            label: math.log(count / total) for label, count in class_counts.items()
+        }
+        self._totals = {
+            label: sum(counts.values()) for label, counts in feature_counts.items()
+        }
+
+    @classmethod
+    def train(
+        cls,
+        records: Iterable[Dict[str, Any]],
+        alpha: float = 1.0,
+        turns: int = CONTEXT_TURNS,
+    ) -> "LocalRouter":
+        """Fit from records of ``{"messages": [...], "decision": agent}``."""
+        class_counts: Counter = Counter()
+        feature_counts: Dict[str, Counter] = {}
+        for record in records:
+            label = record["decision"]
+            class_counts[label] += 1
+            feature_counts.setdefault(label, Counter()).update(
+                extract_features(record["messages"], turns)
+            )
+        return cls(
+            dict(class_counts),
+            {label: dict(counts) for label, counts in feature_counts.items()},
+            alpha,
+            turns,
+        )
+
+    def predict(self, messages: List[Dict[str, Any]]) -> Tuple[str, float]:
+        features = extract_features(messages, self.turns)
+        user_words = [feature for feature in features if feature.startswith("u:")]
+        known = sum(feature in self.vocabulary for feature in user_words)
+
+        scores = {}
+        for label, log_prior in self._log_priors.items():
+            counts = self.feature_counts[label]
+            denominator = self._totals[label] + self.alpha * (self.vocabulary_size + 1)
+            score = log_prior
+            for feature in features:
+                score += math.log((counts.get(feature, 0) + self.alpha) / denominator)
+            scores[label] = score
+
+        best = max(scores, key=scores.get)
+        if not user_words or known / len(user_words) < MIN_KNOWN_RATIO:
+            return best, 0.0
+        # Softmax over the log scores gives the posterior of the best label.
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / normalizer
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "alpha": self.alpha,
+                    "turns": self.turns,
+                    "class_counts": self.class_counts,
+                    "feature_counts": self.feature_counts,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path) -> "LocalRouter":
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(
+            data["class_counts"],
+            data["feature_counts"],
+            data["alpha"],
+            data["turns"],
+        )
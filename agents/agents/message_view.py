@@ -0,0 +1,59 @@
+from collections.abc import Sequence
+from itertools import islice
+from typing import Any, Dict, Optional
+
+
+class MessageView(Sequence):
+    """Read-only view of a conversation with an overlaid last message.
+
+    Agents only ever rewrite the content of the newest message, so instead
+    of deep-copying the whole history they share the caller's message dicts
+    and replace just the tail. Building a view is O(1); slicing copies only
+    the references in the slice. Agents must treat the messages they receive
+    as read-only.
+    """
+
+    __slots__ = ("_messages", "_last")
+
+    def __init__(
+        self,
+        messages: Sequence[Dict[str, Any]],
+        last: Optional[Dict[str, Any]] = None,
+    ):
+        if isinstance(messages, MessageView):
+            last = last if last is not None else messages._last
+            messages = messages._messages
+        self._messages = messages
+        self._last = last
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __getitem__(self, index):
+        if self._last is None:
+            return self._messages[index]
+        size = len(self._messages)
+        if isinstance(index, slice):
+            items = list(self._messages[index])
+            positions = range(*index.indices(size))
+            if size - 1 in positions:
+                items[positions.index(size - 1)] = self._last
+            return items
+        if index == -1 or index == size - 1:
+            return self._last
+        return self._messages[index]
+
+    def __iter__(self):
+        if self._last is None:
+            yield from self._messages
+            return
+        yield from islice(self._messages, len(self._messages) - 1)
+        yield self._last
+
+    def __repr__(self) -> str:
+        return f"MessageView({list(self)!r})"
+
+
+def with_last_content(messages: Sequence[Dict[str, Any]], content: str) -> MessageView:
+    """``messages`` with the newest message's content replaced by ``content``."""
+    return MessageView(messages, {**messages[-1], "content": content})
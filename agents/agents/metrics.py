@@ -0,0 +1,232 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Latency histogram buckets in seconds, from a local fast path to a slow
+# streamed completion.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# (metric name, type, help, labels, value) as produced by collectors.
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def _label_text(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[label]) for label in self.labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                labels = _label_text(dict(zip(self.labels, key)))
+                lines.append(f"{self.name}{labels} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Iterable[str] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(tuple(str(labels[label]) for label in self.labels))
+        return entry[2] if entry else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                labels = dict(zip(self.labels, key))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = _label_text({**labels, "le": f"{bound:g}"})
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = _label_text({**labels, "le": "+Inf"})
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                lines.append(f"{self.name}_sum{_label_text(labels)} {total:g}")
+                lines.append(f"{self.name}_count{_label_text(labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Process-wide metrics, rendered in the Prometheus text format.
+
+    Counters and histograms are updated on the request path. Figures the
+    agents already keep, such as cache hit counts and token totals, are read
+    by collectors when ``/metrics`` is scraped instead.
+    """
+
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = ()) -> Histogram:
+        metric = Histogram(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        collected: Dict[str, list] = {}
+        for collector in self.collectors:
+            for name, kind, help, labels, value in collector():
+                collected.setdefault(name, [kind, help, []])[2].append((labels, value))
+        for name, (kind, help, samples) in collected.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_label_text(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "agents_stage_seconds", "Latency of each pipeline stage", ("stage",)
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "agents_request_seconds", "Latency of each request", ("endpoint",)
+)
+TIME_TO_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "agents_time_to_first_token_seconds", "Time to the first streamed token"
+)
+ROUTES = REGISTRY.counter(
+    "agents_routes_total", "Turns by the agent that answered them", ("route",)
+)
+ERRORS = REGISTRY.counter(
+    "agents_errors_total", "Exceptions by stage or endpoint", ("stage",)
+)
+
+
+class StageTimings:
+    """Time spent in each stage of one request.
+
+    A stage entered more than once is summed. In the parallel pipeline
+    stages overlap, so they need not add up to the total.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def as_dict(self, **extra: float) -> Dict[str, float]:
+        """Milliseconds per stage, plus ``extra`` ones given in seconds."""
+        with self._lock:
+            stages = {**self.stages, **extra}
+        return {name: round(seconds * 1000, 1) for name, seconds in stages.items()}
+
+    def server_timing(self, **extra: float) -> str:
+        """Value for a ``Server-Timing`` header."""
+        return ", ".join(
+            f"{name};dur={ms}" for name, ms in self.as_dict(**extra).items()
+        )
+
+
+_current_timings: ContextVar[Optional[StageTimings]] = ContextVar(
+    "stage_timings", default=None
+)
+
+
+@contextmanager
+def track_stages() -> Iterator[StageTimings]:
+    """Collect the stage timings of everything run inside the block."""
+    timings = StageTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage for the histogram and the current request.
+
+    Exceptions are counted against the stage. Cancellation and closed
+    streams are not failures and are not counted.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(name, elapsed)
+
+
+def count_route(memory: Optional[Dict]):
+    """Count a finished turn by the agent in its memory ("guard" if rejected)."""
+    ROUTES.inc(route=(memory or {}).get("agent", "unknown"))
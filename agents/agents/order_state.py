@@ -0,0 +1,109 @@
+from typing import Dict, Iterable, List, Literal
+
+from pydantic import BaseModel
+
+from .catalog import Catalog
+from .types import OrderItem
+
+# Step 4 of the order flow is the final summary and checkout.
+FINAL_ORDER_STEP = 4
+
+
+class OrderOperation(BaseModel):
+    """One change to the order. "add" adds quantity items, "remove" takes
+    quantity items away (0 removes the item) and "set_quantity" replaces the
+    quantity (0 removes the item)."""
+
+    # The docstring above is the schema description the model is given.
+
+    action: Literal["add", "remove", "set_quantity"]
+    item: str
+    quantity: int
+
+
+class OrderState:
+    """The current order, priced from the catalog.
+
+    Lines are kept as catalog name -> quantity in the order they were first
+    added. Item names coming from the model are matched to catalog products
+    with ``Catalog.match``; names that match nothing are reported back by
+    ``apply`` instead of being added.
+    """
+
+    def __init__(self, catalog: Catalog):
+        self.catalog = catalog
+        self.quantities: Dict[str, int] = {}
+
+    @classmethod
+    def from_order(cls, catalog: Catalog, order: Iterable[OrderItem]) -> "OrderState":
+        """State from an earlier turn's ``memory["order"]``; prices are ignored."""
+        state = cls(catalog)
+        for line in order or ():
+            product = catalog.match(line["item"])
+            if product is not None and line["quantity"] > 0:
+                name = product["name"]
+                state.quantities[name] = state.quantities.get(name, 0) + int(
+                    line["quantity"]
+                )
+        return state
+
+    def apply(self, operations: Iterable[OrderOperation]) -> List[str]:
+        """Apply ``operations`` in order; returns the item names not on the menu."""
+        unknown = []
+        for operation in operations:
+            product = self.catalog.match(operation.item)
+            if product is None:
+                unknown.append(operation.item)
+                continue
+            name = product["name"]
+            current = self.quantities.get(name, 0)
+            if operation.action == "add":
+                quantity = current + max(operation.quantity, 1)
+            elif operation.action == "remove":
+                removed = operation.quantity if operation.quantity > 0 else current
+                quantity = current - removed
+            else:
+                quantity = operation.quantity
+            if quantity > 0:
+                self.quantities[name] = quantity
+            else:
+                self.quantities.pop(name, None)
+        return unknown
+
+    def _unit_cents(self, name: str) -> int:
+        return round(self.catalog.get(name)["price"] * 100)
+
+    def lines(self) -> List[OrderItem]:
+        """Order lines with the catalog unit price."""
+        return [
+            {
+                "item": name,
+                "quantity": quantity,
+                "price": self._unit_cents(name) / 100,
+            }
+            for name, quantity in self.quantities.items()
+        ]
+
+    def total(self) -> float:
+        # Summed in cents so the total is exact.
+        cents = sum(
+            self._unit_cents(name) * quantity
+            for name, quantity in self.quantities.items()
+        )
+        return cents / 100
+
+    def describe(self) -> str:
+        """Compact state for the prompt: "2 x Latte, 1 x Croissant"."""
+        if not self.quantities:
+            return "empty"
+        return ", ".join(
+            f"{quantity} x {name}" for name, quantity in self.quantities.items()
+        )
+
+    def summary(self) -> str:
+        """Itemised order with line prices and the total, for the user."""
+        lines = [
+            f"- {quantity} x {name}: ${self._unit_cents(name) * quantity / 100:.2f}"
+            for name, quantity in self.quantities.items()
+        ]
+        return "\n".join(["Your order:"] + lines + [f"Total: ${self.total():.2f}"])
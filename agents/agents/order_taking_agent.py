@@ -1,120 +1,198 @@
-import os
-from langchain_openai import ChatOpenAI
-from copy import deepcopy
+import logging
+import re
 from pydantic import BaseModel
-from typing import List, Dict, Any, Generator
+from typing import List, Dict, Any, AsyncGenerator, Generator
 import dotenv
-from .types import AgentMessage, OrderTakingMemory, OrderItem as OrderItemType
+from .types import AgentMessage, OrderTakingMemory
+from .catalog import Catalog
+from .order_state import FINAL_ORDER_STEP, OrderOperation, OrderState
+from .json_stream import JsonStringFieldStreamer
+from .prompt_assembly import assemble
+from .metrics import stage
+from .llm_clients import chat_model
+from .context_policy import ContextPolicy
 
 dotenv.load_dotenv()
 
-
-class OrderItem(BaseModel):
-    item: str
-    quantity: int
-    price: float
+logger = logging.getLogger(__name__)
 
 
+# Field order matters: the model generates fields in schema order, and
+# "response" must come before "operations" so it can be streamed to the user
+# while the rest of the object is still being generated.
 class OrderTakingDecision(BaseModel):
-    chain_of_thought: str
     step_number: str
-    order: List[OrderItem]
     response: str
+    operations: List[OrderOperation]
 
 
-class OrderTakingAgent:
-    def __init__(self, recommendation_agent):
-        self.llm = ChatOpenAI(model=os.getenv("MODEL_NAME", "gpt-4o-mini"))
-        self.recommendation_agent = recommendation_agent
+def _is_final_step(step_number: str) -> bool:
+    step = re.search(r"\d+", str(step_number))
+    return bool(step) and int(step.group()) >= FINAL_ORDER_STEP
 
-    def get_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
-        messages = deepcopy(messages)
 
-        system_prompt = """
+def order_taking_system_prompt(catalog: Catalog) -> str:
+    """The static prompt, with the menu listed in catalog order."""
+    menu = "\n".join(
+        f"            - {product['name']} - ${product['price']:.2f}"
+        for product in catalog.products
+    )
+    return f"""
             You are a customer support bot for Version Coffee coffee shop.
 
             Menu:
-            - Cappuccino - $4.50
-            - Jumbo Savory Scone - $3.25
-            - Latte - $4.75
-            - Chocolate Chip Biscotti - $2.50
-            - Espresso Shot - $2.00
-            - Hazelnut Biscotti - $2.75
-            - Chocolate Croissant - $3.75
-            - Cranberry Scone - $3.50
-            - Croissant - $3.25
-            - Almond Croissant - $4.00
-            - Ginger Biscotti - $2.50
-            - Oatmeal Scone - $3.25
-            - Ginger Scone - $3.50
-            - Chocolate Syrup - $1.50
-            - Hazelnut Syrup - $1.50
-            - Caramel Syrup - $1.50
-            - Sugar Free Vanilla Syrup - $1.50
-            - Dark Chocolate - $3.00
+{menu}
+
+            The current order state, if there is one, follows the user's latest message.
 
             Process:
             1. Take the order
             2. Validate items are on menu
             3. Ask if they need anything else
-            4. When done, list items, calculate total, tell the user to press the 'Check Out' button to finalise the order, and thank them
+            4. When done, tell the user to press the 'Check Out' button to finalise the order, and thank them
+
+            The itemised order with prices and the total is added to your response automatically, so never list prices or totals yourself.
 
             Output JSON:
-            {
-                "chain of thought": your reasoning,
+            {{
                 "step_number": current step,
-                "order": [{"item": "name", "quantity": 1, "price": 4.50}],
-                "response": message to user
-            }
+                "response": message to user,
+                "operations": changes the user's latest message makes to the order, [] if none
+            }}
         """
 
-        # Find previous order state from conversation history
-        last_order_taking_status = ""
-        asked_recommendation_before = False
-        for message_index in range(len(messages) - 1, 0, -1):
+
+class OrderTakingAgent:
+    # Replies carry the order state of their own conversation.
+    cacheable = False
+
+    def __init__(
+        self, recommendation_agent, llm=None, catalog=None, context_policy=None
+    ):
+        self.llm = llm or chat_model()
+        self.context_policy = context_policy or ContextPolicy.for_agent(
+            "order_taking_agent", self.llm
+        )
+        self.recommendation_agent = recommendation_agent
+        self.catalog = catalog or Catalog()
+        self.system_prompt = order_taking_system_prompt(self.catalog)
+        # Built once: the same schema parsed by a structured-output wrapper,
+        # and as raw JSON output for incremental streaming.
+        self.structured_llm = self.llm.with_structured_output(OrderTakingDecision)
+        self.json_llm = self.llm.bind(response_format=OrderTakingDecision)
+
+    def _build_input_messages(self, messages: List[Dict[str, Any]]):
+        # Find previous order state from the full conversation history; only
+        # the prompt's view of the history is windowed.
+        previous: OrderTakingMemory = {}
+        for message_index in range(len(messages) - 1, -1, -1):
             message = messages[message_index]
             agent_name = (message.get("memory") or {}).get("agent", "")
             if message["role"] == "assistant" and agent_name == "order_taking_agent":
-                step_number = message["memory"]["step_number"]
-                order = message["memory"]["order"]
-                asked_recommendation_before = message["memory"].get(
-                    "asked_recommendation_before", False
-                )
-                last_order_taking_status = f"""
-                step number: {step_number}
-                order: {order}
-                """
+                previous = message["memory"]
                 break
 
-        # Prepend order context to user message
-        if last_order_taking_status:
-            messages[-1]["content"] = (
-                last_order_taking_status + "\n" + messages[-1]["content"]
+        status = ""
+        if previous:
+            state = OrderState.from_order(self.catalog, previous.get("order"))
+            status = (
+                f"Current order state:\nstep number: {previous.get('step_number')}\n"
+                f"order: {state.describe()}"
             )
 
-        input_messages = [{"role": "system", "content": system_prompt}] + messages
+        input_messages = assemble(
+            self.system_prompt, self.context_policy.window(messages), status
+        )
+        return input_messages, messages, previous
 
-        structured_llm = self.llm.with_structured_output(OrderTakingDecision)
-        result = structured_llm.invoke(input_messages)
-        output = self.postprocess(result, messages, asked_recommendation_before)
+    def get_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
+        input_messages, messages, previous = self._build_input_messages(messages)
+        with stage("order_llm"):
+            result = self.structured_llm.invoke(input_messages)
+        output = self.postprocess(result, messages, previous)
 
         return output
 
+    async def aget_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
+        input_messages, messages, previous = self._build_input_messages(messages)
+        with stage("order_llm"):
+            result = await self.structured_llm.ainvoke(input_messages)
+        return await self.apostprocess(result, messages, previous)
+
+    def _apply_operations(self, result, previous: OrderTakingMemory):
+        """The order after this turn's operations, and the items not on the menu."""
+        state = OrderState.from_order(self.catalog, previous.get("order"))
+        before = dict(state.quantities)
+        unknown = state.apply(result.operations)
+        return state, unknown, state.quantities != before
+
     def postprocess(
-        self, result, messages: List[Dict[str, Any]], asked_recommendation_before: bool
+        self, result, messages: List[Dict[str, Any]], previous: OrderTakingMemory
     ) -> AgentMessage:
-        """Convert Pydantic model to message dict."""
-        # Convert OrderItem objects to dicts
-        order_list: List[OrderItemType] = [item.model_dump() for item in result.order]
+        """Apply the model's operations and convert the turn to a message dict."""
+        state, unknown, changed = self._apply_operations(result, previous)
+        order_list = state.lines()
+        asked_recommendation_before = previous.get("asked_recommendation_before", False)
 
+        recommendation_output = None
         if not asked_recommendation_before and len(order_list) > 0:
             recommendation_output = (
                 self.recommendation_agent.get_recommendations_from_order(
                     messages, order_list
                 )
             )
-            result.response = (
-                result.response
+        return self._build_output(
+            result,
+            state,
+            unknown,
+            changed,
+            recommendation_output,
+            asked_recommendation_before,
+        )
+
+    async def apostprocess(
+        self, result, messages: List[Dict[str, Any]], previous: OrderTakingMemory
+    ) -> AgentMessage:
+        """Async variant of ``postprocess``."""
+        state, unknown, changed = self._apply_operations(result, previous)
+        order_list = state.lines()
+        asked_recommendation_before = previous.get("asked_recommendation_before", False)
+
+        recommendation_output = None
+        if not asked_recommendation_before and len(order_list) > 0:
+            recommendation_output = (
+                await self.recommendation_agent.aget_recommendations_from_order(
+                    messages, order_list
+                )
+            )
+        return self._build_output(
+            result,
+            state,
+            unknown,
+            changed,
+            recommendation_output,
+            asked_recommendation_before,
+        )
+
+    def _build_output(
+        self,
+        result,
+        state: OrderState,
+        unknown: List[str],
+        changed: bool,
+        recommendation_output,
+        asked_recommendation_before: bool,
+    ) -> AgentMessage:
+        response = result.response
+        if unknown:
+            verb = "is" if len(unknown) == 1 else "are"
+            response += f"\nSorry, {', '.join(unknown)} {verb} not on our menu."
+        # Prices and the total always come from the catalog, never the model.
+        if state.quantities and (changed or _is_final_step(result.step_number)):
+            response += "\n" + state.summary()
+        if recommendation_output is not None:
+            response = (
+                response
                 + "\nHere's my recommendation based on your order:\n"
                 + recommendation_output["content"]
             )
@@ -123,21 +201,75 @@ class OrderTakingAgent:
         memory: OrderTakingMemory = {
             "agent": "order_taking_agent",
             "step_number": result.step_number,
-            "order": order_list,
+            "order": state.lines(),
+            "total": state.total(),
             "asked_recommendation_before": asked_recommendation_before,
         }
         return {
             "role": "assistant",
-            "content": result.response,
+            "content": response,
             "memory": memory,
         }
 
+    def _final_events(
+        self, streamed: str, result: OrderTakingDecision, output: AgentMessage
+    ) -> Generator:
+        # Whatever the incremental parse has not emitted yet, e.g. the
+        # recommendation follow-up appended in postprocessing.
+        content = output["content"]
+        if content.startswith(streamed):
+            remainder = content[len(streamed) :]
+        else:
+            # The streamed tokens are already with the client; send only what
+            # postprocessing appended to the model's reply, never the reply
+            # a second time.
+            logger.warning(
+                "Streamed order reply differs from the parsed one (%d vs %d chars)",
+                len(streamed),
+                len(result.response),
+            )
+            remainder = content[len(result.response) :]
+        if remainder:
+            yield {"type": "token", "content": remainder}
+        yield {"type": "memory", "content": output["memory"]}
+
     def get_stream(self, messages: List[Dict[str, Any]]) -> Generator:
-        # Structured output can't stream from LLM, so run synchronously
-        response = self.get_response(messages)
-        # Stream the response text in chunks
-        text = response["content"]
-        chunk_size = 4
-        for i in range(0, len(text), chunk_size):
-            yield {"type": "token", "content": text[i : i + chunk_size]}
-        yield {"type": "memory", "content": response["memory"]}
+        input_messages, messages, previous = self._build_input_messages(messages)
+
+        streamer = JsonStringFieldStreamer("response")
+        raw = []
+        streamed = []
+        with stage("order_llm"):
+            for chunk in self.json_llm.stream(input_messages):
+                if not chunk.content:
+                    continue
+                raw.append(chunk.content)
+                text = streamer.feed(chunk.content)
+                if text:
+                    streamed.append(text)
+                    yield {"type": "token", "content": text}
+
+        result = OrderTakingDecision.model_validate_json("".join(raw))
+        output = self.postprocess(result, messages, previous)
+        yield from self._final_events("".join(streamed), result, output)
+
+    async def aget_stream(self, messages: List[Dict[str, Any]]) -> AsyncGenerator:
+        input_messages, messages, previous = self._build_input_messages(messages)
+
+        streamer = JsonStringFieldStreamer("response")
+        raw = []
+        streamed = []
+        with stage("order_llm"):
+            async for chunk in self.json_llm.astream(input_messages):
+                if not chunk.content:
+                    continue
+                raw.append(chunk.content)
+                text = streamer.feed(chunk.content)
+                if text:
+                    streamed.append(text)
+                    yield {"type": "token", "content": text}
+
+        result = OrderTakingDecision.model_validate_json("".join(raw))
+        output = await self.apostprocess(result, messages, previous)
+        for event in self._final_events("".join(streamed), result, output):
+            yield event
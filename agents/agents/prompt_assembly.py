@@ -0,0 +1,27 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+from .message_view import with_last_content
+
+
+def assemble(
+    system_prompt: str,
+    messages: Sequence[Dict[str, Any]],
+    context: str = "",
+    window: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Lay out a prompt so its prefix is identical from turn to turn.
+
+    Providers reuse the longest prompt prefix they have already seen, so the
+    agent's static ``system_prompt`` (built once at import or construction)
+    comes first, followed by the history exactly as earlier turns sent it.
+    Per-request ``context`` such as retrieved documents or order state is
+    appended to the newest message only, where it cannot invalidate the
+    cached part. ``window`` keeps only the last messages of the history.
+    """
+    history = messages if window is None else messages[-window:]
+    if context:
+        history = with_last_content(history, f"{history[-1]['content']}\n\n{context}")
+
+    input_messages = [{"role": "system", "content": system_prompt}]
+    input_messages += history
+    return input_messages
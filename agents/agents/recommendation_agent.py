@@ -1,15 +1,39 @@
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
-from typing import List, Dict, Any, Generator
-import pandas as pd
+from typing import List, Dict, Any, AsyncGenerator, Generator
 import os
-import json
-from copy import deepcopy
 import dotenv
 from .types import AgentMessage, RecommendationMemory
+from .prompt_assembly import assemble
+from .recommendation_index import AprioriIndex, PopularityIndex
+from .catalog import Catalog
+from .data_snapshot import shared_snapshot
+from .metrics import stage
+from .llm_clients import chat_model
+from .response_cache import SharedCompletions, SingleFlight, prompt_key
 
 dotenv.load_dotenv()
 
+NO_RECOMMENDATION_MESSAGE = "Sorry, I couldn't find any recommendations for you."
+
+# "template" renders the order follow-up as a bullet list of catalog names
+# with no LLM call; "llm" asks the model to phrase it.
+ORDER_RECOMMENDATION_MODE = os.getenv("ORDER_RECOMMENDATION_MODE", "template")
+
+ORDER_RECOMMENDATION_SYSTEM_PROMPT = """
+        You are a recommendation assistant for Version Coffee coffee shop.
+        
+        Your recommendation is a follow up from the order taking agent, so just recommend the items without any description.
+        The order taking agent will conclude the message, so there is no need to thank the user.
+        Format each product name as a separate markdown bullet point (- item).
+        """
+
+RECOMMENDATION_SYSTEM_PROMPT = """
+        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
+        your task is to recommend items to the user based on their input message. And respond in a friendly but concise way. And put it an unordered list with a very small description.
+
+        I will provide you with a list of items to recommend to the user based on their input message.
+        """
+
 
 class RecommendationClassification(BaseModel):
     chain_of_thought: str
@@ -18,78 +42,51 @@ class RecommendationClassification(BaseModel):
 
 
 class RecommendationAgent:
-    def __init__(self, apriori_recommendations_path, popular_recommendations_path):
-        self.llm = ChatOpenAI(model=os.getenv("MODEL_NAME", "gpt-4o-mini"))
-
-        with open(apriori_recommendations_path, "r") as f:
-            raw = json.load(f)
-        self.apriori_recommendations = raw
-        self._apriori_lower = {k.lower(): v for k, v in raw.items()}
-
-        self.popular_recommendations = pd.read_csv(popular_recommendations_path)
-        self.products = self.popular_recommendations["product"].tolist()
-        self.product_categories = list(
-            set(self.popular_recommendations["product_category"].tolist())
+    # Recommendations come from the shared rules and rankings, not from the
+    # user, so equal prompts may share a cached answer.
+    cacheable = True
+
+    def __init__(
+        self,
+        apriori_recommendations_path=None,
+        popular_recommendations_path=None,
+        llm=None,
+        order_recommendation_mode=None,
+    ):
+        self.llm = llm or chat_model()
+        self.classification_llm = self.llm.with_structured_output(
+            RecommendationClassification
         )
-
-    def get_apriori_recommendation(self, products, k=5):
-        recommendation_list = []
-
-        for product in products:
-            key = product.lower()
-            if key in self._apriori_lower:
-                recommendation_list.extend(self._apriori_lower[key])
-
-        # Sort recommendation list by 'confidence' column
-        recommendation_list.sort(key=lambda x: x["confidence"], reverse=True)
-
-        recommendations = []
-        recommendation_per_category = {}
-        for recommendation in recommendation_list:
-            if recommendation in recommendations:
-                continue
-
-            # Limit 2 recommendation per category
-            product_category = recommendation["product_category"]
-            if product_category not in recommendation_per_category:
-                recommendation_per_category[product_category] = []
-            if len(recommendation_per_category[product_category]) >= 2:
-                continue
-
-            # Add recommendation to the list
-            recommendations.append(recommendation["product"])
-            recommendation_per_category[product_category].append(
-                recommendation["product"]
-            )
-
-            if len(recommendations) >= k:
-                break
-
-        return recommendations[:k]
-
-    def get_popular_recommendations(self, product_categories=None, k=5):
-        recommendation_df = self.popular_recommendations
-
-        if isinstance(product_categories, str):
-            product_categories = [product_categories]
-
-        if product_categories:
-            recommendation_df = recommendation_df[
-                recommendation_df["product_category"].isin(product_categories)
-            ]
-
-        recommendation_df = recommendation_df.sort_values(
-            "number_of_transactions", ascending=False
+        self.classification_flights = SingleFlight()
+        self.completions = SharedCompletions(
+            self.llm,
+            "recommendation_response",
+            RECOMMENDATION_SYSTEM_PROMPT,
+            self.cacheable,
         )
-
-        if recommendation_df.shape[0] == 0:
-            return []
-
-        return recommendation_df["product"].tolist()[:k]
-
-    def recommendation_classification(self, messages):
-        """Classify what type of recommendation to provide."""
-        system_prompt = f"""
+        self.order_recommendation_mode = (
+            order_recommendation_mode or ORDER_RECOMMENDATION_MODE
+        )
+        if (
+            apriori_recommendations_path is None
+            and popular_recommendations_path is None
+        ):
+            # The compiled data shared by every agent and worker process.
+            snapshot = shared_snapshot()
+            self.catalog = snapshot.catalog
+            self.apriori_index = snapshot.apriori
+            self.popularity_index = snapshot.popularity
+        else:
+            self.catalog = Catalog()
+            self.apriori_index = AprioriIndex.from_json(apriori_recommendations_path)
+            self.popularity_index = PopularityIndex.from_csv(
+                popular_recommendations_path
+            )
+        self.products = list(self.popularity_index.products)
+        self.product_categories = list(self.popularity_index.categories)
+        # Items and categories are listed in file order, so the prompt is
+        # the same bytes in every process and on every call.
+        self.classification_prompt = f"""
         Determine recommendation type:
         1. apriori: Based on items user mentioned
         2. popular: General popular items
@@ -106,146 +103,195 @@ class RecommendationAgent:
         }}
         """
 
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+    def get_apriori_recommendation(self, products, k=5):
+        return self.apriori_index.recommend(products, k)
 
-        structured_llm = self.llm.with_structured_output(RecommendationClassification)
-        result = structured_llm.invoke(input_messages)
+    def get_popular_recommendations(self, product_categories=None, k=5):
+        if isinstance(product_categories, str):
+            product_categories = [product_categories]
+        return self.popularity_index.top(product_categories, k)
+
+    def _classification_input_messages(self, messages):
+        return assemble(self.classification_prompt, messages, window=3)
+
+    def recommendation_classification(self, messages):
+        """Classify what type of recommendation to provide."""
+        input_messages = self._classification_input_messages(messages)
+
+        with stage("recommendation_classification"):
+            result = self.classification_flights.do(
+                prompt_key(input_messages),
+                lambda: self.classification_llm.invoke(input_messages),
+            )
         return {
             "recommendation_type": result.recommendation_type,
             "parameters": result.parameters,
         }
 
-    def get_recommendations_from_order(self, messages, order):
-        messages = deepcopy(messages)
+    async def arecommendation_classification(self, messages):
+        """Async variant of ``recommendation_classification``."""
+        input_messages = self._classification_input_messages(messages)
+
+        with stage("recommendation_classification"):
+            result = await self.classification_flights.ado(
+                prompt_key(input_messages),
+                lambda: self.classification_llm.ainvoke(input_messages),
+            )
+        return {
+            "recommendation_type": result.recommendation_type,
+            "parameters": result.parameters,
+        }
+
+    def _order_recommendation_input_messages(self, messages, recommendation):
+        return assemble(
+            ORDER_RECOMMENDATION_SYSTEM_PROMPT,
+            messages,
+            f"Please recommend these items: {', '.join(recommendation)}",
+            window=3,
+        )
+
+    def render_order_recommendation(self, recommendation):
+        """The follow-up the LLM path asks for: one bullet per product."""
+        return "\n".join(
+            f"- {self.catalog.display_name(product)}" for product in recommendation
+        )
+
+    def _get_order_recommendation(self, order):
         products = []
         for product in order:
             products.append(product["item"])
 
-        recommendation = self.get_apriori_recommendation(products)
+        return self.get_apriori_recommendation(products)
+
+    def get_recommendations_from_order(self, messages, order):
+        with stage("order_recommendation"):
+            return self._recommendations_from_order(messages, order)
+
+    async def aget_recommendations_from_order(self, messages, order):
+        """Async variant of ``get_recommendations_from_order``."""
+        with stage("order_recommendation"):
+            return await self._arecommendations_from_order(messages, order)
+
+    def _recommendations_from_order(self, messages, order):
+        recommendation = self._get_order_recommendation(order)
 
         if not recommendation:
             return self.postprocess_recommendation(
                 "Based on your order, I don't have specific recommendations at the moment."
             )
 
-        recommendation_str = ", ".join(recommendation)
-
-        system_prompt = """
-        You are a recommendation assistant for Version Coffee coffee shop.
-        
-        Your recommendation is a follow up from the order taking agent, so just recommend the items without any description.
-        The order taking agent will conclude the message, so there is no need to thank the user.
-        Format each product name as a separate markdown bullet point (- item).
-        """
-
-        prompt = f"""
-        {messages[-1]["content"]}
-
-        Please recommend these items: {recommendation_str}
-        """
-
-        messages[-1]["content"] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        if self.order_recommendation_mode == "template":
+            return self.postprocess_recommendation(
+                self.render_order_recommendation(recommendation)
+            )
 
+        input_messages = self._order_recommendation_input_messages(
+            messages, recommendation
+        )
         response = self.llm.invoke(input_messages)
         output = self.postprocess_recommendation(response.content)
 
         return output
 
-    def get_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
-        messages = deepcopy(messages)
+    async def _arecommendations_from_order(self, messages, order):
+        recommendation = self._get_order_recommendation(order)
 
-        recommendation_classification = self.recommendation_classification(messages)
+        if not recommendation:
+            return self.postprocess_recommendation(
+                "Based on your order, I don't have specific recommendations at the moment."
+            )
+
+        if self.order_recommendation_mode == "template":
+            return self.postprocess_recommendation(
+                self.render_order_recommendation(recommendation)
+            )
+
+        input_messages = self._order_recommendation_input_messages(
+            messages, recommendation
+        )
+        response = await self.llm.ainvoke(input_messages)
+        return self.postprocess_recommendation(response.content)
+
+    def _get_recommendation(self, recommendation_classification):
         recommendation_type = recommendation_classification["recommendation_type"]
 
+        recommendation = []
         if recommendation_type == "apriori":
             recommendation = self.get_apriori_recommendation(
                 recommendation_classification["parameters"]
             )
-
         elif recommendation_type == "popular":
             recommendation = self.get_popular_recommendations()
         elif recommendation_type == "popular by category":
             recommendation = self.get_popular_recommendations(
                 recommendation_classification["parameters"]
             )
+        return recommendation
+
+    def _response_input_messages(self, messages, recommendation):
+        return assemble(
+            RECOMMENDATION_SYSTEM_PROMPT,
+            messages,
+            f"Please recommend these items: {', '.join(recommendation)}",
+            window=3,
+        )
 
-        if recommendation == []:
-            return {
-                "role": "assistant",
-                "content": "Sorry, I couldn't find any recommendations for you.",
-            }
-
-        # Respond to user
-        recommendation_str = ", ".join(recommendation)
-
-        system_prompt = """
-        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
-        your task is to recommend items to the user based on their input message. And respond in a friendly but concise way. And put it an unordered list with a very small description.
-
-        I will provide you with a list of items to recommend to the user based on their input message.
-        """
-
-        prompt = f"""
-        {messages[-1]["content"]}
-
-        Please recommend these items: {recommendation_str}
-        """
-
-        messages[-1]["content"] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+    def get_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
+        recommendation_classification = self.recommendation_classification(messages)
+        recommendation = self._get_recommendation(recommendation_classification)
 
-        response = self.llm.invoke(input_messages)
-        output = self.postprocess_recommendation(response.content)
+        if recommendation == []:
+            return self.postprocess_recommendation(NO_RECOMMENDATION_MESSAGE)
 
-        return output
+        input_messages = self._response_input_messages(messages, recommendation)
+        with stage("recommendation_llm"):
+            content = self.completions.invoke(input_messages)
+        return self.postprocess_recommendation(content)
 
     def get_stream(self, messages: List[Dict[str, Any]]) -> Generator:
-        messages = deepcopy(messages)
-
         recommendation_classification = self.recommendation_classification(messages)
-        recommendation_type = recommendation_classification["recommendation_type"]
-
-        if recommendation_type == "apriori":
-            recommendation = self.get_apriori_recommendation(
-                recommendation_classification["parameters"]
-            )
-        elif recommendation_type == "popular":
-            recommendation = self.get_popular_recommendations()
-        elif recommendation_type == "popular by category":
-            recommendation = self.get_popular_recommendations(
-                recommendation_classification["parameters"]
-            )
+        recommendation = self._get_recommendation(recommendation_classification)
 
         if recommendation == []:
-            yield {
-                "type": "token",
-                "content": "Sorry, I couldn't find any recommendations for you.",
-            }
+            yield {"type": "token", "content": NO_RECOMMENDATION_MESSAGE}
             yield {"type": "memory", "content": {"agent": "recommendation_agent"}}
             return
 
-        recommendation_str = ", ".join(recommendation)
+        input_messages = self._response_input_messages(messages, recommendation)
+        with stage("recommendation_llm"):
+            for token in self.completions.stream(input_messages):
+                yield {"type": "token", "content": token}
+        yield {"type": "memory", "content": {"agent": "recommendation_agent"}}
 
-        system_prompt = """
-        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
-        your task is to recommend items to the user based on their input message. And respond in a friendly but concise way. And put it an unordered list with a very small description.
+    async def aget_response(self, messages: List[Dict[str, Any]]) -> AgentMessage:
+        recommendation_classification = await self.arecommendation_classification(
+            messages
+        )
+        recommendation = self._get_recommendation(recommendation_classification)
 
-        I will provide you with a list of items to recommend to the user based on their input message.
-        """
+        if recommendation == []:
+            return self.postprocess_recommendation(NO_RECOMMENDATION_MESSAGE)
 
-        prompt = f"""
-        {messages[-1]["content"]}
+        input_messages = self._response_input_messages(messages, recommendation)
+        with stage("recommendation_llm"):
+            content = await self.completions.ainvoke(input_messages)
+        return self.postprocess_recommendation(content)
 
-        Please recommend these items: {recommendation_str}
-        """
+    async def aget_stream(self, messages: List[Dict[str, Any]]) -> AsyncGenerator:
+        recommendation_classification = await self.arecommendation_classification(
+            messages
+        )
+        recommendation = self._get_recommendation(recommendation_classification)
 
-        messages[-1]["content"] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        if recommendation == []:
+            yield {"type": "token", "content": NO_RECOMMENDATION_MESSAGE}
+            yield {"type": "memory", "content": {"agent": "recommendation_agent"}}
+            return
 
-        for chunk in self.llm.stream(input_messages):
-            if chunk.content:
-                yield {"type": "token", "content": chunk.content}
+        input_messages = self._response_input_messages(messages, recommendation)
+        with stage("recommendation_llm"):
+            async for token in self.completions.astream(input_messages):
+                yield {"type": "token", "content": token}
         yield {"type": "memory", "content": {"agent": "recommendation_agent"}}
 
     def postprocess_recommendation(self, content: str) -> AgentMessage:
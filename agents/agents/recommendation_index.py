@@ -0,0 +1,199 @@
+import csv
+import json
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+APRIORI_CACHE_SIZE = int(os.getenv("APRIORI_CACHE_SIZE", 4096))
+
+# Most recommendations any one category may contribute to a result.
+MAX_PER_CATEGORY = 2
+
+_UNKNOWN = frozenset([None])
+
+# One apriori rule: negated confidence, then the recommended product and its
+# category ids.
+RULE_DTYPE = np.dtype([("score", "<f8"), ("product", "<i4"), ("category", "<i4")])
+
+
+class AprioriIndex:
+    """Association rules compiled for fast basket recommendations.
+
+    Products and categories are interned to integer ids, and every rule is a
+    ``(-confidence, product_id, category_id)`` row of one ``RULE_DTYPE``
+    table, with each product's rules stored as a contiguous run already
+    sorted by confidence. ``rules`` maps a product id to its run. The table
+    may be a memory-mapped snapshot (see ``agents.data_snapshot``) shared by
+    every worker on the host.
+
+    A basket's candidates are a merge of its products' runs, scanned only
+    until ``k`` products have been picked. Results are memoized per
+    canonical basket, a frozenset of product ids, in a bounded LRU.
+    """
+
+    def __init__(
+        self,
+        names: List[str],
+        categories: List[str],
+        product_category: List[int],
+        table: np.ndarray,
+        rules: Dict[int, Tuple[int, int]],
+        cache_size: int = APRIORI_CACHE_SIZE,
+    ):
+        self.names = names
+        self.categories = categories
+        self.product_category = product_category
+        self.table = table
+        self.rules = rules
+        self._product_ids = {name.lower(): i for i, name in enumerate(names)}
+        self._basket_ids = {
+            key: product
+            for key, product in self._product_ids.items()
+            if product in self.rules
+        }
+        self._recommend = lru_cache(maxsize=cache_size)(self._compute)
+
+    @classmethod
+    def from_rules(
+        cls, rules: Dict[str, List[Dict]], cache_size: int = APRIORI_CACHE_SIZE
+    ) -> "AprioriIndex":
+        """Compile ``{product: [rule, ...]}`` as written by the mining script."""
+        names: List[str] = []
+        categories: List[str] = []
+        product_category: List[int] = []
+        product_ids: Dict[str, int] = {}
+        category_ids: Dict[str, int] = {}
+
+        def intern(product: str, category):
+            key = product.lower()
+            if key not in product_ids:
+                product_ids[key] = len(names)
+                names.append(product)
+                product_category.append(-1)
+            if category is not None:
+                if category not in category_ids:
+                    category_ids[category] = len(categories)
+                    categories.append(category)
+                product_category[product_ids[key]] = category_ids[category]
+
+        # Consequents first, so ids carry the spelling used in the output.
+        for consequents in rules.values():
+            for rule in consequents:
+                intern(rule["product"], rule["product_category"])
+        for product in rules:
+            intern(product, None)
+
+        rows: List[Tuple[float, int, int]] = []
+        spans: Dict[int, Tuple[int, int]] = {}
+        for product, consequents in rules.items():
+            compiled = [
+                (
+                    -rule["confidence"],
+                    product_ids[rule["product"].lower()],
+                    category_ids[rule["product_category"]],
+                )
+                for rule in consequents
+            ]
+            # Stable sort keeps file order among equal confidences.
+            compiled.sort(key=lambda rule: rule[0])
+            spans[product_ids[product.lower()]] = (len(rows), len(rows) + len(compiled))
+            rows.extend(compiled)
+
+        table = np.array(rows, dtype=RULE_DTYPE)
+        return cls(names, categories, product_category, table, spans, cache_size)
+
+    @classmethod
+    def from_json(cls, path: str, cache_size: int = APRIORI_CACHE_SIZE):
+        with open(path, "r") as f:
+            return cls.from_rules(json.load(f), cache_size)
+
+    def basket(self, products: Iterable[str]) -> frozenset:
+        """Canonical basket: the ids of the products that have rules."""
+        get = self._basket_ids.get
+        basket = frozenset([get(product.lower()) for product in products])
+        return basket - _UNKNOWN if None in basket else basket
+
+    def recommend(self, products: Iterable[str], k: int = 5) -> List[str]:
+        """Up to ``k`` products, by confidence, at most two per category."""
+        return list(self._recommend(self.basket(products), k))
+
+    def _compute(self, basket: frozenset, k: int) -> Tuple[str, ...]:
+        # Rows come out of the table as (score, product, category) tuples.
+        if len(basket) == 1:
+            (product,) = basket
+            start, end = self.rules[product]
+            candidates = self.table[start:end].tolist()
+        else:
+            candidates = []
+            for product in basket:
+                start, end = self.rules[product]
+                candidates.extend(self.table[start:end].tolist())
+            # Timsort detects the pre-sorted runs and merges them in C, which
+            # beats heapq.merge for rule lists this short.
+            candidates.sort()
+
+        picked = []
+        seen = set()
+        per_category = [0] * len(self.categories)
+        for _, product, category in candidates:
+            if product in seen or per_category[category] >= MAX_PER_CATEGORY:
+                continue
+            seen.add(product)
+            per_category[category] += 1
+            picked.append(self.names[product])
+            if len(picked) >= k:
+                break
+        return tuple(picked)
+
+    def cache_info(self):
+        return self._recommend.cache_info()
+
+
+class PopularityIndex:
+    """Products ranked by number of transactions, overall and per category.
+
+    The CSV is compiled once into ranked tuples, so a lookup is a slice of
+    the first ``k`` entries (or a merge of a few category rankings).
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, str]]):
+        rows = [
+            (
+                row["product"],
+                row["product_category"],
+                int(row["number_of_transactions"]),
+            )
+            for row in rows
+        ]
+        # File order, for prompts that list every product and category.
+        self.products: Tuple[str, ...] = tuple(row[0] for row in rows)
+        self.categories: Tuple[str, ...] = tuple(dict.fromkeys(row[1] for row in rows))
+
+        ranked = sorted(rows, key=lambda row: -row[2])
+        self.ranking: Tuple[str, ...] = tuple(row[0] for row in ranked)
+        self._transactions = {row[0]: row[2] for row in rows}
+        self.category_rankings: Dict[str, Tuple[str, ...]] = {
+            category: tuple(row[0] for row in ranked if row[1] == category)
+            for category in self.categories
+        }
+
+    @classmethod
+    def from_csv(cls, path: str) -> "PopularityIndex":
+        with open(path, "r", newline="") as f:
+            return cls(csv.DictReader(f))
+
+    def top(self, categories: Optional[Iterable[str]] = None, k: int = 5) -> List[str]:
+        if not categories:
+            return list(self.ranking[:k])
+        rankings = [
+            self.category_rankings[category]
+            for category in dict.fromkeys(categories)
+            if category in self.category_rankings
+        ]
+        if len(rankings) <= 1:
+            return list(rankings[0][:k]) if rankings else []
+        candidates = [product for ranking in rankings for product in ranking[:k]]
+        candidates.sort(key=lambda product: -self._transactions[product])
+        return candidates[:k]
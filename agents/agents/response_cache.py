@@ -0,0 +1,394 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from .decision_cache import DecisionCache, fingerprint, model_name, shared_backend
+
+# Concurrent identical model calls share one request.
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "on") == "on"
+# Answers of agents that declare them cacheable are kept for a while.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "on") == "on"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1000))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 300))
+
+
+def prompt_key(input_messages: List[Dict[str, Any]]) -> str:
+    """Digest of the exact messages sent to the model."""
+    return fingerprint(json.dumps(input_messages, sort_keys=True, ensure_ascii=False))
+
+
+class _Flight:
+    """One call in flight: the chunks it has produced so far, then its result.
+
+    A sync stream has no producer of its own: its ``source`` iterator is
+    advanced by whichever waiter first needs a chunk nobody has produced
+    yet, so a single caller runs it inline, and a caller that leaves hands
+    the stream over to the others. Async calls run on ``task``; their
+    waiters are coroutines on the task's loop.
+    """
+
+    def __init__(self, source: Optional[Iterator[Any]] = None):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Future] = None
+        # Callers attached to the flight; guarded by the SingleFlight lock.
+        self.waiters = 0
+        self.on_done: Callable[[], None] = lambda: None
+        self._source = source
+        self._driving = False
+        self._cond = threading.Condition()
+        self._events: List[asyncio.Event] = []
+
+    def push(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._notify()
+
+    def finish(self, value=None, error: Optional[BaseException] = None):
+        with self._cond:
+            self.done = True
+            self.value = value
+            self.error = error
+            self._notify()
+        self.on_done()
+
+    def _notify(self):
+        self._cond.notify_all()
+        for event in self._events:
+            event.set()
+
+    def _outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def close(self):
+        """Stop a stream nobody waits for; what it produced is discarded."""
+        close = getattr(self._source, "close", None)
+        if close is not None:
+            # No waiter is left, so none is advancing the source.
+            close()
+        if self.task is not None:
+            self.task.cancel()
+
+    def iter_chunks(self) -> Iterator[Any]:
+        seen = 0
+        while True:
+            with self._cond:
+                while seen == len(self.chunks) and not self.done and self._driving:
+                    self._cond.wait()
+                chunks = self.chunks[seen:]
+                done = self.done
+                drive = not chunks and not done
+                if drive:
+                    self._driving = True
+            if drive:
+                self._advance()
+                continue
+            seen += len(chunks)
+            yield from chunks
+            if done:
+                self._outcome()
+                return
+
+    def _advance(self):
+        try:
+            chunk = next(self._source)
+        except StopIteration:
+            self.finish()
+        except BaseException as e:
+            self.finish(error=e)
+        else:
+            self.push(chunk)
+        finally:
+            with self._cond:
+                self._driving = False
+                self._cond.notify_all()
+
+    def result(self):
+        with self._cond:
+            while not self.done:
+                self._cond.wait()
+        return self._outcome()
+
+    async def aiter_chunks(self) -> AsyncIterator[Any]:
+        event = asyncio.Event()
+        self._events.append(event)
+        try:
+            seen = 0
+            while True:
+                chunks = self.chunks[seen:]
+                done = self.done
+                if not chunks and not done:
+                    event.clear()
+                    await event.wait()
+                    continue
+                seen += len(chunks)
+                for chunk in chunks:
+                    yield chunk
+                if done:
+                    self._outcome()
+                    return
+        finally:
+            self._events.remove(event)
+
+
+class SingleFlight:
+    """Shares one call among concurrent callers that ask for the same key.
+
+    The first caller for a key starts the call; callers that arrive while
+    it is in flight wait for its result instead of repeating it, and get
+    its exception if it fails. Streams are fanned out: every caller gets
+    every chunk, including those produced before it joined. The call is
+    stopped when the last of its callers goes away, such as a turn the
+    guard rejected or a client that disconnected.
+    """
+
+    def __init__(self, enabled: bool = REQUEST_COALESCING):
+        self.enabled = enabled
+        self._flights: Dict[tuple, _Flight] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def _join(self, key: tuple, make: Callable[[], _Flight]):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.shared += 1
+                flight.waiters += 1
+                return flight, False
+            flight = self._flights[key] = make()
+            flight.waiters = 1
+            flight.on_done = lambda: self._discard(key, flight)
+            self.calls += 1
+            return flight, True
+
+    def _discard(self, key: tuple, flight: _Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _leave(self, key: tuple, flight: _Flight):
+        with self._lock:
+            flight.waiters -= 1
+            if flight.waiters or flight.done:
+                return
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.close()
+
+    def do(self, key: str, fn: Callable[[], Any]):
+        if not self.enabled:
+            return fn()
+        flight, leader = self._join(("do", key), _Flight)
+        if not leader:
+            return flight.result()
+        try:
+            value = fn()
+        except BaseException as e:
+            flight.finish(error=e)
+            raise
+        flight.finish(value)
+        return value
+
+    async def ado(self, key: str, fn: Callable[[], Any]):
+        """Like ``do`` for a coroutine function."""
+        if not self.enabled:
+            return await fn()
+        # A task belongs to its loop, so each loop has its own flights.
+        key = ("ado", id(asyncio.get_running_loop()), key)
+        flight, leader = self._join(key, _Flight)
+        if leader:
+            flight.task = asyncio.ensure_future(fn())
+            flight.task.add_done_callback(lambda task: self._discard(key, flight))
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(key, flight)
+
+    def stream(self, key: str, fn: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """Chunks of ``fn()``, produced once for every concurrent caller."""
+        if not self.enabled:
+            yield from fn()
+            return
+        key = ("stream", key)
+        flight, _ = self._join(key, lambda: _Flight(iter(fn())))
+        try:
+            yield from flight.iter_chunks()
+        finally:
+            self._leave(key, flight)
+
+    async def astream(
+        self, key: str, fn: Callable[[], AsyncIterator[Any]]
+    ) -> AsyncIterator[Any]:
+        """Like ``stream`` for an async iterator."""
+        if not self.enabled:
+            async for chunk in fn():
+                yield chunk
+            return
+        key = ("astream", id(asyncio.get_running_loop()), key)
+        flight, leader = self._join(key, _Flight)
+        if leader:
+            flight.task = asyncio.ensure_future(self._aproduce(flight, fn))
+        try:
+            async for chunk in flight.aiter_chunks():
+                yield chunk
+        finally:
+            self._leave(key, flight)
+
+    async def _aproduce(self, flight: _Flight, fn):
+        source = fn()
+        try:
+            async for chunk in source:
+                flight.push(chunk)
+        except BaseException as e:
+            flight.finish(error=e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            flight.finish()
+        finally:
+            await source.aclose()
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "shared": self.shared}
+
+
+class SharedCompletions:
+    """An agent's plain-text model calls, coalesced and optionally cached.
+
+    Calls are keyed on the exact messages sent to the model, so only
+    requests with the same effective input share an answer. Concurrent ones
+    share one call through ``SingleFlight``; when the agent is
+    ``cacheable`` the answer is also kept for ``RESPONSE_CACHE_TTL``
+    seconds in a ``DecisionCache`` scoped to the model and system prompt.
+    ``data_version``, when given, returns a digest of the data answers are
+    built from (such as a retrieval index); it is part of every key, so
+    answers do not outlive that data.
+    """
+
+    def __init__(
+        self,
+        llm,
+        namespace: str,
+        system_prompt: str,
+        cacheable: bool,
+        data_version: Optional[Callable[[], str]] = None,
+    ):
+        self.llm = llm
+        self.data_version = data_version
+        self.flights = SingleFlight()
+        self.cache = None
+        if cacheable and RESPONSE_CACHE_ENABLED:
+            self.cache = DecisionCache(
+                namespace,
+                fingerprint(model_name(llm), system_prompt),
+                max_entries=RESPONSE_CACHE_SIZE,
+                ttl=RESPONSE_CACHE_TTL,
+                backend=shared_backend(),
+            )
+
+    def _key(self, input_messages: List[Dict[str, Any]]) -> str:
+        key = prompt_key(input_messages)
+        if self.data_version is not None:
+            key = fingerprint(self.data_version(), key)
+        return key
+
+    def _cached(self, key: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        value = self.cache.get(key)
+        return None if value is None else value["content"]
+
+    async def _acached(self, key: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        value = await self.cache.aget(key)
+        return None if value is None else value["content"]
+
+    # Answers are stored before the flight lands, so no caller misses both.
+
+    def _store(self, key: str, content: str):
+        if self.cache is not None:
+            self.cache.set(key, {"content": content})
+
+    async def _astore(self, key: str, content: str):
+        if self.cache is not None:
+            await self.cache.aset(key, {"content": content})
+
+    def invoke(self, input_messages: List[Dict[str, Any]]) -> str:
+        key = self._key(input_messages)
+        content = self._cached(key)
+        if content is not None:
+            return content
+
+        def call():
+            content = self.llm.invoke(input_messages).content
+            self._store(key, content)
+            return content
+
+        return self.flights.do(key, call)
+
+    async def ainvoke(self, input_messages: List[Dict[str, Any]]) -> str:
+        key = self._key(input_messages)
+        content = await self._acached(key)
+        if content is not None:
+            return content
+
+        async def call():
+            content = (await self.llm.ainvoke(input_messages)).content
+            await self._astore(key, content)
+            return content
+
+        return await self.flights.ado(key, call)
+
+    def stream(self, input_messages: List[Dict[str, Any]]) -> Iterator[str]:
+        """Text chunks of the answer; a cached answer comes as one chunk."""
+        key = self._key(input_messages)
+        content = self._cached(key)
+        if content is not None:
+            yield content
+            return
+
+        def chunks():
+            parts = []
+            stream = self.llm.stream(input_messages)
+            try:
+                for chunk in stream:
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield chunk.content
+            finally:
+                # Also when the stream is stopped early, which closes the
+                # HTTP response; a partial answer is not stored.
+                stream.close()
+            self._store(key, "".join(parts))
+
+        yield from self.flights.stream(key, chunks)
+
+    async def astream(self, input_messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        key = self._key(input_messages)
+        content = await self._acached(key)
+        if content is not None:
+            yield content
+            return
+
+        async def chunks():
+            parts = []
+            stream = self.llm.astream(input_messages)
+            try:
+                async for chunk in stream:
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield chunk.content
+            finally:
+                await stream.aclose()
+            await self._astore(key, "".join(parts))
+
+        async for chunk in self.flights.astream(key, chunks):
+            yield chunk
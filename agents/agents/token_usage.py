@@ -0,0 +1,93 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+
+class TokenUsage(BaseCallbackHandler):
+    """Prompt, cached and completion tokens summed over chat model calls.
+
+    While installed with ``track_token_usage`` it is attached to every
+    LangChain chat model call made in the same context (including asyncio
+    tasks started from it), so structured-output and streaming calls are
+    counted without the agents passing callbacks around.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, usage_metadata: Optional[Dict[str, Any]]):
+        """Count one call from a LangChain ``usage_metadata`` dict."""
+        if not usage_metadata:
+            return
+        details = usage_metadata.get("input_token_details") or {}
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage_metadata.get("input_tokens", 0)
+            self.cached_tokens += details.get("cache_read", 0)
+            self.completion_tokens += usage_metadata.get("output_tokens", 0)
+
+    def merge(self, other: "TokenUsage"):
+        with self._lock:
+            self.calls += other.calls
+            self.prompt_tokens += other.prompt_tokens
+            self.cached_tokens += other.cached_tokens
+            self.completion_tokens += other.completion_tokens
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                if isinstance(generation, ChatGeneration) and isinstance(
+                    generation.message, AIMessage
+                ):
+                    self.add(generation.message.usage_metadata)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache_hit_rate": round(
+                self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                4,
+            ),
+        }
+
+
+_current_usage: ContextVar[Optional[TokenUsage]] = ContextVar(
+    "token_usage", default=None
+)
+register_configure_hook(_current_usage, inheritable=True)
+
+# Running totals over every tracked request in this process.
+TOTAL_USAGE = TokenUsage()
+
+
+@contextmanager
+def track_token_usage() -> Iterator[TokenUsage]:
+    """Collect the token usage of all model calls made inside the block."""
+    usage = TokenUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+        TOTAL_USAGE.merge(usage)
+
+
+def record_usage(usage_metadata: Optional[Dict[str, Any]]):
+    """Count a call made outside LangChain's callbacks, e.g. by the fakes."""
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.add(usage_metadata)
@@ -29,6 +29,7 @@ class OrderTakingMemory(TypedDict, total=False):
     agent: str
     step_number: str
     order: List[OrderItem]
+    total: float
     asked_recommendation_before: bool
 
 
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import pathlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+PRODUCTS_DIR = pathlib.Path(__file__).parent.parent / "products"
+SNAPSHOT_PATH = os.getenv(
+    "VECTOR_INDEX_PATH",
+    str(pathlib.Path(__file__).parent.parent / "data" / "details_index"),
+)
+
+# Field holding the retrievable text in each collection.
+TEXT_FIELDS = {"products": "text_for_embedding", "about": "content"}
+
+
+def documents_digest(documents: Dict[str, List[Dict[str, Any]]]) -> str:
+    """Digest of the indexed texts and the embedding model.
+
+    It is taken over the documents actually indexed, so an index whose
+    digest differs from that of the documents now in MongoDB is stale and
+    gets rebuilt, however the database was re-seeded.
+    """
+    digest = hashlib.sha256()
+    digest.update((os.getenv("EMBEDDING_MODEL") or "").encode("utf-8"))
+    for collection, text_field in TEXT_FIELDS.items():
+        digest.update(b"\0" + collection.encode("utf-8"))
+        for doc in documents.get(collection, []):
+            digest.update(b"\0" + doc.get(text_field, "").encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def mongo_digest(db) -> str:
+    """``documents_digest`` of the collections in MongoDB, without embeddings."""
+    return documents_digest(
+        {
+            collection: list(
+                db[collection].find({}, {"_id": 0, text_field: 1}).sort("_id", 1)
+            )
+            for collection, text_field in TEXT_FIELDS.items()
+        }
+    )
+
+
+def _matrix_path(path: str, digest: str) -> str:
+    # Named after the digest, so a rebuild never rewrites a file that live
+    # indexes (here or in other workers) have memory-mapped, and the .json,
+    # written last, always points at a matching matrix.
+    return f"{path}.{digest}.npy"
+
+
+def _write_atomic(path: str, write):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def product_text(product: Dict[str, Any]) -> str:
+    """Text embedded for a product, as written by the seed script."""
+    return (
+        f"{product['name']} - {product['category']}: "
+        f"{product['description']} "
+        f"Ingredients: {', '.join(product['ingredients'])}. "
+        f"Price: ${product['price']:.2f}. Rating: {product['rating']}."
+    )
+
+
+class VectorIndex:
+    """In-memory cosine-similarity index over the details collections.
+
+    All embeddings live in one contiguous, L2-normalized float32 matrix with
+    each collection occupying a contiguous block of rows, so every query is a
+    single matrix-vector product followed by a top-k per block.
+    """
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        texts: List[str],
+        ranges: Dict[str, List[int]],
+        digest: str,
+    ):
+        self.matrix = matrix
+        self.texts = texts
+        self.ranges = ranges
+        self.digest = digest
+
+    @classmethod
+    def from_documents(
+        cls, documents: Dict[str, List[Dict[str, Any]]], digest: Optional[str] = None
+    ) -> "VectorIndex":
+        """Build from ``{collection: [doc, ...]}`` docs carrying an ``embedding``."""
+        if digest is None:
+            digest = documents_digest(documents)
+        vectors = []
+        texts = []
+        ranges = {}
+        for collection, text_field in TEXT_FIELDS.items():
+            start = len(texts)
+            for doc in documents.get(collection, []):
+                vectors.append(doc["embedding"])
+                texts.append(doc.get(text_field, ""))
+            ranges[collection] = [start, len(texts)]
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.maximum(norms, 1e-12)
+        return cls(np.ascontiguousarray(matrix), texts, ranges, digest)
+
+    @classmethod
+    def from_mongo(cls, db) -> "VectorIndex":
+        documents = {
+            collection: list(
+                db[collection]
+                .find({}, {"_id": 0, "embedding": 1, text_field: 1})
+                .sort("_id", 1)
+            )
+            for collection, text_field in TEXT_FIELDS.items()
+        }
+        return cls.from_documents(documents)
+
+    @classmethod
+    def from_seed_files(cls, embeddings) -> "VectorIndex":
+        """Build from the seed data with ``embeddings``, without MongoDB.
+
+        Used for offline runs with fake embeddings; the snapshot is not saved.
+        """
+        with open(PRODUCTS_DIR / "products.jsonl", "r") as f:
+            products = [json.loads(line) for line in f if line.strip()]
+        with open(PRODUCTS_DIR / "version_coffee_about_us.txt", "r") as f:
+            about = f.read().strip()
+
+        texts = [product_text(product) for product in products]
+        vectors = embeddings.embed_documents(texts + [about])
+        documents = {
+            "products": [
+                {"text_for_embedding": text, "embedding": vector}
+                for text, vector in zip(texts, vectors)
+            ],
+            "about": [{"content": about, "embedding": vectors[-1]}],
+        }
+        return cls.from_documents(documents)
+
+    def save(self, path: str = SNAPSHOT_PATH):
+        matrix_path = _matrix_path(path, self.digest)
+        meta = {"digest": self.digest, "ranges": self.ranges, "texts": self.texts}
+        _write_atomic(matrix_path, lambda f: np.save(f, self.matrix))
+        _write_atomic(path + ".json", lambda f: f.write(json.dumps(meta).encode()))
+        # Matrices of older digests; indexes still mapping them keep their
+        # pages until they are dropped.
+        prefix = os.path.basename(path) + "."
+        directory = os.path.dirname(path) or "."
+        for name in os.listdir(directory):
+            stale = os.path.join(directory, name)
+            if (
+                name.startswith(prefix)
+                and name.endswith(".npy")
+                and stale != matrix_path
+            ):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, path: str = SNAPSHOT_PATH) -> "VectorIndex":
+        """Load a snapshot, memory-mapping the embedding matrix."""
+        with open(path + ".json", "r") as f:
+            meta = json.load(f)
+        matrix = np.load(_matrix_path(path, meta["digest"]), mmap_mode="r")
+        return cls(matrix, meta["texts"], meta["ranges"], meta["digest"])
+
+    @classmethod
+    def load_or_build(
+        cls, db, path: str = SNAPSHOT_PATH, digest: Optional[str] = None
+    ) -> "VectorIndex":
+        """Use the snapshot when it matches MongoDB's documents, else rebuild it."""
+        digest = digest or mongo_digest(db)
+        try:
+            index = cls.load(path)
+            if index.digest == digest:
+                return index
+        except FileNotFoundError:
+            pass
+        index = cls.from_mongo(db)
+        index.save(path)
+        return index
+
+    def search(
+        self, query_vector: List[float], limits: Dict[str, int]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Top-k documents per collection, shaped like ``$vectorSearch`` results."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        # Not in place: the caller's array may be float32 already.
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.matrix @ query
+
+        results = {}
+        for collection, k in limits.items():
+            start, end = self.ranges[collection]
+            block = scores[start:end]
+            k = min(k, len(block))
+            if k == 0:
+                results[collection] = []
+                continue
+            top = np.argpartition(-block, k - 1)[:k]
+            top = top[np.argsort(-block[top])]
+            text_field = TEXT_FIELDS[collection]
+            results[collection] = [
+                {text_field: self.texts[start + i], "score": float(block[i])}
+                for i in top
+            ]
+        return results
@@ -0,0 +1,314 @@
+"""
+Run a JSONL file of conversations through the agent pipeline.
+
+Usage:
+    python batch_runner.py conversations.jsonl -o results.jsonl
+        [--concurrency 8] [--rate-limit chat=10] [--rate-limit embeddings=50]
+        [--pipeline-mode fused] [--fake] [--fake-latency 0.05]
+
+Each input line is a conversation: ``{"id": ..., "turns": [...]}`` replays
+the user turns in order, each a string or a message object, feeding every
+response back into the history (after an optional ``messages`` history);
+``{"id": ..., "messages": [...]}`` runs only the last message of an
+existing history. Lines without an ``id`` are
+numbered from 0.
+
+Each output line holds one conversation's ``id``, its ``turns`` (the
+input, the agent that answered under ``route``, the response ``content``
+and ``memory``, ``usage`` and per-stage ``timings`` in milliseconds) and
+an ``error``, if any. Lines are written as conversations finish, so they
+are not in input order. Rerunning with the same output file skips the conversations it
+already holds without an error, so an interrupted run resumes.
+
+``--rate-limit`` caps requests per second to a provider: ``chat`` for
+model calls and ``embeddings`` for embedding calls. ``--fake`` runs fully
+offline: fake chat and embedding models, and an in-memory vector index in
+place of MongoDB.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Optional, Set
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_openai import ChatOpenAI
+
+from agent_controller import AgentController
+from agents.embedding_cache import EMBEDDING_CACHE_ENABLED, CachedEmbeddings
+from agents.fakes import FakeChatModel, FakeEmbeddings
+from agents.llm_clients import async_http_client, embeddings_model, http_client
+from agents.metrics import track_stages
+from agents.token_usage import track_token_usage
+from agents.vector_index import VectorIndex
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 64))
+# Per-provider requests per second, e.g. "chat=10,embeddings=50".
+BATCH_RATE_LIMITS = os.getenv("BATCH_RATE_LIMITS", "")
+
+PROVIDERS = ("chat", "embeddings")
+
+_WORKER_DONE = object()
+
+
+def parse_rate_limits(specs: Iterable[str]) -> Dict[str, float]:
+    """``["chat=10", "embeddings=50"]`` -> ``{"chat": 10.0, ...}``."""
+    limits = {}
+    for spec in specs:
+        for part in spec.split(","):
+            if not part.strip():
+                continue
+            provider, _, rate = part.partition("=")
+            provider = provider.strip()
+            if provider not in PROVIDERS:
+                raise ValueError(f"Unknown provider {provider!r} in rate limit")
+            limits[provider] = float(rate)
+    return limits
+
+
+def rate_limiter(requests_per_second: float) -> InMemoryRateLimiter:
+    return InMemoryRateLimiter(
+        requests_per_second=requests_per_second,
+        check_every_n_seconds=min(0.1, 1 / requests_per_second),
+        max_bucket_size=max(1.0, requests_per_second),
+    )
+
+
+class RateLimitedEmbeddings:
+    """Embeddings wrapper waiting on a rate limiter before every call."""
+
+    def __init__(self, embeddings, limiter: InMemoryRateLimiter):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", None)
+        self.limiter = limiter
+
+    def embed_query(self, text: str):
+        self.limiter.acquire()
+        return self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts):
+        self.limiter.acquire()
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_query(self, text: str):
+        await self.limiter.aacquire()
+        return await self.embeddings.aembed_query(text)
+
+    async def aembed_documents(self, texts):
+        await self.limiter.aacquire()
+        return await self.embeddings.aembed_documents(texts)
+
+
+def build_controller(
+    rate_limits: Optional[Dict[str, float]] = None,
+    pipeline_mode: Optional[str] = None,
+    fake: bool = False,
+    fake_latency: float = 0.0,
+) -> AgentController:
+    """Controller whose model and embedding calls obey ``rate_limits``."""
+    rate_limits = rate_limits or {}
+    chat_limiter = None
+    if "chat" in rate_limits:
+        chat_limiter = rate_limiter(rate_limits["chat"])
+
+    if fake:
+        llm = FakeChatModel(latency=fake_latency, rate_limiter=chat_limiter)
+        embeddings = FakeEmbeddings(latency=fake_latency / 10)
+        vector_index = VectorIndex.from_seed_files(FakeEmbeddings())
+    else:
+        # Its own rate limiter, but the service's connection pool.
+        llm = ChatOpenAI(
+            model=os.getenv("MODEL_NAME", "gpt-4o-mini"),
+            stream_usage=True,
+            rate_limiter=chat_limiter,
+            http_client=http_client(),
+            http_async_client=async_http_client(),
+        )
+        embeddings = embeddings_model()
+        vector_index = None
+
+    if "embeddings" in rate_limits:
+        embeddings = RateLimitedEmbeddings(
+            embeddings, rate_limiter(rate_limits["embeddings"])
+        )
+    if not fake and EMBEDDING_CACHE_ENABLED:
+        # Outside the limiter, so cache hits are not rate limited.
+        embeddings = CachedEmbeddings(embeddings)
+    return AgentController(llm, pipeline_mode, embeddings, vector_index)
+
+
+def read_conversations(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    for number, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        record.setdefault("id", number)
+        yield record
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids of conversations in an earlier output file that finished cleanly.
+
+    A line cut off by an interruption is truncated away, so new results
+    can be appended after it.
+    """
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        if result.get("error") is None:
+            done.add(str(result["id"]))
+    return done
+
+
+class BatchRunner:
+    """Runs conversations through a controller, ``concurrency`` at a time."""
+
+    def __init__(
+        self, controller: AgentController, concurrency: int = BATCH_CONCURRENCY
+    ):
+        self.controller = controller
+        self.concurrency = max(1, concurrency)
+
+    async def run_conversation(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        if "turns" in record:
+            messages = list(record.get("messages") or [])
+            turns = record["turns"]
+        else:
+            messages = list(record["messages"][:-1])
+            turns = record["messages"][-1:]
+
+        results = []
+        start = time.perf_counter()
+        error = None
+        for turn in turns:
+            if isinstance(turn, str):
+                turn = {"role": "user", "content": turn}
+            messages.append(turn)
+            try:
+                with track_token_usage() as usage, track_stages() as timings:
+                    response = await self.controller.aget_response(messages)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                break
+            messages.append(response)
+            memory = response.get("memory") or {}
+            results.append(
+                {
+                    "input": turn["content"],
+                    "route": memory.get("agent"),
+                    "content": response["content"],
+                    "memory": memory,
+                    "usage": usage.as_dict(),
+                    "timings": timings.as_dict(total=timings.elapsed()),
+                }
+            )
+        return {
+            "id": record.get("id"),
+            "turns": results,
+            "timings": {"total": round((time.perf_counter() - start) * 1000, 1)},
+            "error": error,
+        }
+
+    async def run(
+        self, records: Iterable[Dict[str, Any]], skip: Set[str] = frozenset()
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Results in completion order, skipping ids in ``skip``."""
+        pending = (record for record in records if str(record.get("id")) not in skip)
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            try:
+                # Workers share one iterator, so input is read lazily and
+                # never more than ``concurrency`` conversations are in flight.
+                for record in pending:
+                    try:
+                        result = await self.run_conversation(record)
+                    except Exception as e:
+                        # A malformed record fails alone; the worker moves on.
+                        result = {
+                            "id": record.get("id"),
+                            "turns": [],
+                            "error": f"{type(e).__name__}: {e}",
+                        }
+                    results.put_nowait(result)
+            finally:
+                results.put_nowait(_WORKER_DONE)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            remaining = len(workers)
+            while remaining:
+                result = await results.get()
+                if result is _WORKER_DONE:
+                    remaining -= 1
+                    continue
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def run_file(args):
+    controller = build_controller(
+        parse_rate_limits(args.rate_limit or [BATCH_RATE_LIMITS]),
+        args.pipeline_mode,
+        args.fake,
+        args.fake_latency,
+    )
+    runner = BatchRunner(controller, args.concurrency)
+    skip = completed_ids(args.output)
+    if skip:
+        print(f"Resuming: {len(skip)} conversations already done")
+
+    finished = failed = 0
+    start = time.perf_counter()
+    with open(args.input, "r") as f, open(args.output, "a") as out:
+        async for result in runner.run(read_conversations(f), skip):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            finished += 1
+            failed += result["error"] is not None
+    elapsed = time.perf_counter() - start
+    print(
+        f"{finished} conversations in {elapsed:.1f}s "
+        f"({finished / elapsed if elapsed else 0:.1f}/s), {failed} failed"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("input")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument(
+        "--rate-limit",
+        action="append",
+        help="provider=requests per second; defaults to BATCH_RATE_LIMITS",
+    )
+    parser.add_argument("--pipeline-mode")
+    parser.add_argument("--fake", action="store_true")
+    parser.add_argument(
+        "--fake-latency",
+        type=float,
+        default=0.0,
+        help="seconds per fake model call",
+    )
+    asyncio.run(run_file(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Compare apriori basket recommendations against the original list-based code.
+
+Usage:
+    python benchmarks/apriori_index.py [--baskets 10000] [--max-size 4] [--seed 0]
+
+Draws random baskets of 1 to ``--max-size`` products from the rule file and
+times the original implementation (extend, re-sort, linear membership
+check), the compiled index with its cache disabled, and the index with its
+LRU warm. Each variant gets one untimed pass over the baskets first. Also counts how many of the original results recommend a product
+twice, and checks the index never does.
+"""
+
+import argparse
+import json
+import pathlib
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agents.recommendation_index import AprioriIndex  # noqa: E402
+
+RULES_PATH = (
+    pathlib.Path(__file__).parent.parent / "data" / "apriori_recommendations.json"
+)
+
+
+def legacy_recommendation(rules_lower, products, k=5):
+    """``get_apriori_recommendation`` as it was before the index."""
+    recommendation_list = []
+    for product in products:
+        key = product.lower()
+        if key in rules_lower:
+            recommendation_list.extend(rules_lower[key])
+    recommendation_list.sort(key=lambda x: x["confidence"], reverse=True)
+
+    recommendations = []
+    recommendation_per_category = {}
+    for recommendation in recommendation_list:
+        if recommendation in recommendations:
+            continue
+        product_category = recommendation["product_category"]
+        if product_category not in recommendation_per_category:
+            recommendation_per_category[product_category] = []
+        if len(recommendation_per_category[product_category]) >= 2:
+            continue
+        recommendations.append(recommendation["product"])
+        recommendation_per_category[product_category].append(recommendation["product"])
+        if len(recommendations) >= k:
+            break
+    return recommendations[:k]
+
+
+def time_calls(fn, baskets):
+    for basket in baskets:
+        fn(basket)
+    timings = []
+    for basket in baskets:
+        start = time.perf_counter()
+        fn(basket)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return (
+        statistics.mean(timings) * 1e6,
+        timings[int(len(timings) * 0.99) - 1] * 1e6,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--baskets", type=int, default=10000)
+    parser.add_argument("--max-size", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(RULES_PATH, "r") as f:
+        rules = json.load(f)
+    rules_lower = {product.lower(): value for product, value in rules.items()}
+    products = list(rules)
+
+    rng = random.Random(args.seed)
+    baskets = [
+        rng.sample(products, rng.randint(1, min(args.max_size, len(products))))
+        for _ in range(args.baskets)
+    ]
+
+    start = time.perf_counter()
+    index = AprioriIndex.from_rules(rules)
+    build_ms = (time.perf_counter() - start) * 1000
+    uncached = AprioriIndex.from_rules(rules, cache_size=0)
+
+    legacy_results = [legacy_recommendation(rules_lower, b) for b in baskets]
+    index_results = [index.recommend(b) for b in baskets]
+    duplicated = sum(len(set(map(str.lower, r))) < len(r) for r in legacy_results)
+    assert all(len(set(r)) == len(r) for r in index_results)
+    changed = sum(a != b for a, b in zip(legacy_results, index_results))
+
+    rows = [
+        ("original", lambda b: legacy_recommendation(rules_lower, b)),
+        ("index, no cache", uncached.recommend),
+        ("index, warm cache", index.recommend),
+    ]
+    print(f"index build: {build_ms:.2f} ms for {len(rules)} products")
+    print(f"{'':<18} {'mean µs':>8} {'p99 µs':>8}")
+    for name, fn in rows:
+        mean_us, p99_us = time_calls(fn, baskets)
+        print(f"{name:<18} {mean_us:>8.2f} {p99_us:>8.2f}")
+    print(
+        f"original results with a duplicate product: {duplicated}/{len(baskets)}; "
+        f"results that differ after the fix: {changed}/{len(baskets)}"
+    )
+    print(f"cache: {index.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
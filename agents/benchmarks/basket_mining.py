@@ -0,0 +1,184 @@
+"""
+Benchmark the recommendation mining pipeline on synthetic transactions.
+
+Usage:
+    python benchmarks/basket_mining.py [--transactions 10000000] [--workers N]
+        [--file-transactions 1000000] [--days 7]
+
+Two parts:
+
+* counting: ``--transactions`` baskets of 1-4 products, drawn by the
+  popularity in ``data/popularity_recommendation.csv``, are generated chunk
+  by chunk inside the worker processes and fed to the vectorized counter.
+  Runs once with one process and once with ``--workers``.
+* files: ``--file-transactions`` baskets are written as ``--days`` daily CSV
+  logs and mined end to end (CSV parsing included). The last day is then
+  added incrementally to the counts of the other days, and the result is
+  checked against the full run. The written data files are loaded with the
+  RecommendationAgent indexes to confirm the format.
+"""
+
+import argparse
+import csv
+import os
+import pathlib
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agents.basket_mining import CHUNK_ROWS, BasketCounts, count_files  # noqa: E402
+from agents.recommendation_index import AprioriIndex, PopularityIndex  # noqa: E402
+
+POPULARITY_PATH = (
+    pathlib.Path(__file__).parent.parent / "data" / "popularity_recommendation.csv"
+)
+CHUNK_TRANSACTIONS = 200_000
+
+
+def load_products():
+    with open(POPULARITY_PATH, "r", newline="") as f:
+        rows = list(csv.DictReader(f))
+    weights = np.array([int(row["number_of_transactions"]) for row in rows], float)
+    return (
+        [row["product"] for row in rows],
+        [row["product_category"] for row in rows],
+        weights / weights.sum(),
+    )
+
+
+def synthetic_chunk(seed, transactions, weights):
+    """One anchor product by popularity plus 0-3 companions from its affinities."""
+    # The affinities are fixed across chunks so they form real associations.
+    affinity = np.random.default_rng(0).dirichlet(
+        np.full(len(weights), 0.3), len(weights)
+    )
+    cdf = np.cumsum(affinity, axis=1)
+
+    rng = np.random.default_rng(seed)
+    companions = rng.integers(0, 4, transactions)
+    anchors = rng.choice(len(weights), size=transactions, p=weights)
+    owners = np.repeat(np.arange(transactions), companions)
+    draws = rng.random(len(owners))
+    picked = (draws[:, None] > cdf[anchors[owners]]).sum(axis=1)
+    picked = np.minimum(picked, len(weights) - 1)
+    txn = np.concatenate([np.arange(transactions), owners])
+    products = np.concatenate([anchors, picked])
+    order = np.argsort(txn, kind="stable")
+    return txn[order], products[order]
+
+
+def count_synthetic(task):
+    first_seed, chunks, transactions_per_chunk = task
+    names, categories, weights = load_products()
+    counts = BasketCounts()
+    for name, category in zip(names, categories):
+        counts.product_id(name, category)
+    for seed in range(first_seed, first_seed + chunks):
+        txn, products = synthetic_chunk(seed, transactions_per_chunk, weights)
+        counts.add_baskets(txn, products)
+    return counts
+
+
+def run_counting(transactions, workers):
+    chunks = max(transactions // CHUNK_TRANSACTIONS, 1)
+    per_worker = -(-chunks // workers)
+    tasks = [
+        (seed, min(per_worker, chunks - seed), CHUNK_TRANSACTIONS)
+        for seed in range(0, chunks, per_worker)
+    ]
+    start = time.perf_counter()
+    counts = BasketCounts()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial in executor.map(count_synthetic, tasks):
+                counts.merge(partial)
+    else:
+        for task in tasks:
+            counts.merge(count_synthetic(task))
+    return counts, time.perf_counter() - start
+
+
+def write_logs(directory, transactions, days):
+    names, categories, weights = load_products()
+    paths = []
+    per_day = transactions // days
+    for day in range(days):
+        path = os.path.join(directory, f"transactions_{day:02d}.csv")
+        txn, products = synthetic_chunk(10_000 + day, per_day, weights)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["transaction_id", "product", "product_category"])
+            writer.writerows(
+                (f"{day}-{t}", names[p], categories[p]) for t, p in zip(txn, products)
+            )
+        paths.append(path)
+    return paths
+
+
+def same_counts(a, b):
+    order = [b.products.index(product) for product in a.products]
+    return (
+        a.transactions == b.transactions
+        and np.array_equal(a.item_counts, b.item_counts[order])
+        and np.array_equal(a.pair_counts, b.pair_counts[np.ix_(order, order)])
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--transactions", type=int, default=10_000_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--file-transactions", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"counting {args.transactions:,} synthetic transactions")
+    for workers in sorted({1, args.workers}):
+        counts, elapsed = run_counting(args.transactions, workers)
+        print(
+            f"  {workers} process(es): {elapsed:6.1f}s, "
+            f"{counts.transactions / elapsed:,.0f} transactions/s"
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_logs(directory, args.file_transactions, args.days)
+        size_mb = sum(os.path.getsize(path) for path in paths) / 1e6
+        print(f"mining {args.file_transactions:,} transactions from {size_mb:.0f} MB")
+
+        start = time.perf_counter()
+        full = count_files(paths, workers=args.workers, chunk_rows=CHUNK_ROWS)
+        elapsed = time.perf_counter() - start
+        print(
+            f"  full run: {elapsed:6.1f}s, {full.transactions / elapsed:,.0f} "
+            "transactions/s"
+        )
+
+        state = os.path.join(directory, "state")
+        count_files(paths[:-1], workers=args.workers).save(state)
+        start = time.perf_counter()
+        incremental = count_files(paths, BasketCounts.load(state), workers=args.workers)
+        elapsed = time.perf_counter() - start
+        print(
+            f"  incremental update with one new day: {elapsed:6.1f}s, "
+            f"matches full run: {same_counts(full, incremental)}"
+        )
+
+        apriori_path = os.path.join(directory, "apriori_recommendations.json")
+        popularity_path = os.path.join(directory, "popularity_recommendation.csv")
+        full.write_apriori_recommendations(apriori_path, min_lift=1.0)
+        full.write_popularity(popularity_path)
+        index = AprioriIndex.from_json(apriori_path)
+        ranking = PopularityIndex.from_csv(popularity_path)
+        print(
+            f"  outputs load: {len(index.rules)} products with rules, "
+            f"top sellers {ranking.top(k=3)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
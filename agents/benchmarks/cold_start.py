@@ -0,0 +1,179 @@
+"""
+Measure the agents service's import time and time to first response.
+
+Usage:
+    python benchmarks/cold_start.py [--repeats 3] [--modes eager background]
+        [--out report.json]
+
+Import time is the time to ``import main`` (the web app) and to import the
+whole agent pipeline (``agent_controller``), each in a fresh interpreter.
+Startup runs ``python main.py`` once per repeat for each ``AGENT_STARTUP``
+mode and records, from process start, the first answer from ``/health``
+(the port is bound), from ``/ready`` and from ``/chat``.
+
+The model API is the local fake from ``llm_client_overhead.py``. Its guard
+verdict rejects the turn, so the chat makes one model call over HTTP.
+Retrieval is set to MongoDB, which is not contacted for a rejected turn,
+so no database is needed.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+AGENTS_DIR = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(AGENTS_DIR))
+
+import httpx  # noqa: E402
+
+from agents.guard_agent import GuardDecision  # noqa: E402
+from agents.guard_prefilter import NOT_ALLOWED  # noqa: E402
+from benchmarks.llm_client_overhead import FakeOpenAIServer  # noqa: E402
+
+REJECTION = GuardDecision(
+    chain_of_thought="Unrelated to the shop.",
+    decision=NOT_ALLOWED,
+    message="Sorry, I can only help with Version Coffee.",
+).model_dump_json()
+MESSAGE = {"role": "user", "content": "What is the capital of France?"}
+POLL_INTERVAL = 0.05
+
+
+def service_env(base_url, **overrides):
+    env = dict(os.environ)
+    env.update(
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY=env.get("OPENAI_API_KEY", "benchmark"),
+        EMBEDDING_MODEL=env.get("EMBEDDING_MODEL", "text-embedding-3-small"),
+        DETAILS_RETRIEVAL="mongo",
+        GUARD_PREFILTER="off",
+        DECISION_CACHE="off",
+        PROFILE_SAMPLE_RATE="0",
+    )
+    env.update(overrides)
+    return env
+
+
+def import_seconds(module, env, repeats):
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=AGENTS_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(client, url, start, deadline):
+    """Seconds from ``start`` until ``url`` answers 200."""
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(url).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        time.sleep(POLL_INTERVAL)
+    raise TimeoutError(f"{url} did not become available")
+
+
+def startup_run(mode, env, timeout):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = {**env, "PORT": str(port), "AGENT_STARTUP": mode}
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=AGENTS_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = start + timeout
+    result = {}
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            result["health_s"] = wait_for(client, f"{base}/health", start, deadline)
+
+            def poll_ready():
+                result["ready_s"] = wait_for(client, f"{base}/ready", start, deadline)
+
+            ready = threading.Thread(target=poll_ready)
+            ready.start()
+            response = client.post(f"{base}/chat", json={"messages": [MESSAGE]})
+            result["first_chat_s"] = time.perf_counter() - start
+            result["chat_status"] = response.status_code
+            ready.join()
+    finally:
+        process.terminate()
+        process.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--modes", nargs="+", default=["eager", "background"], help="AGENT_STARTUP"
+    )
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--out", help="also write the report to this file")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(handshake=0, latency=0.005, content=REJECTION)
+    env = service_env(server.start())
+
+    report = {
+        "imports_s": {
+            module: import_seconds(module, env, args.repeats)
+            for module in ("main", "agent_controller")
+        },
+        "startup": {},
+    }
+    for module, seconds in report["imports_s"].items():
+        print(f"import {module:<17} {seconds * 1000:8.1f} ms")
+
+    for mode in args.modes:
+        runs = [startup_run(mode, env, args.timeout) for _ in range(args.repeats)]
+        summary = {
+            key: statistics.median(run[key] for run in runs)
+            for key in ("health_s", "ready_s", "first_chat_s")
+        }
+        summary["chat_status"] = [run["chat_status"] for run in runs]
+        report["startup"][mode] = summary
+        print(
+            f"{mode:<10} /health {summary['health_s'] * 1000:7.0f} ms  "
+            f"/ready {summary['ready_s'] * 1000:7.0f} ms  "
+            f"first /chat {summary['first_chat_s'] * 1000:7.0f} ms"
+        )
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Show prompt size and latency per turn as a conversation grows.
+
+Usage:
+    python benchmarks/context_window.py [--lengths 10 50 200 1000]
+        [--prefill-us 20] [--repeat 5]
+
+For conversations of each length (in messages), runs the classification,
+details and order taking agents on the last user message with fake models
+and a fake in-memory vector index, once with their context policies and
+once with the unbounded history they used to send. Prompt tokens come from
+the per-request usage tracking; latency is wall time with the fake model
+charging ``--prefill-us`` microseconds per prompt token; the simulated
+provider cache is cleared before every call. Each configuration runs
+``--repeat`` times, so the conversation summary is cached after the first.
+The last assistant turn comes from the details agent, so the classification
+call is not skipped as mid-order, while the order still has to be read from
+further back in the history.
+"""
+
+import argparse
+import pathlib
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agents.catalog import Catalog  # noqa: E402
+from agents.classification_agent import ClassificationAgent  # noqa: E402
+from agents.context_policy import ContextPolicy, SummaryCache  # noqa: E402
+from agents.details_agent import DetailsAgent  # noqa: E402
+from agents.fakes import FakeChatModel, FakeEmbeddings  # noqa: E402
+from agents.order_taking_agent import OrderTakingAgent  # noqa: E402
+from agents.token_usage import track_token_usage  # noqa: E402
+from agents.vector_index import VectorIndex  # noqa: E402
+
+UNBOUNDED = 10**9
+
+
+def conversation(rng, products, length):
+    messages = []
+    order = []
+    for turn in range(length // 2):
+        product = rng.choice(products)
+        agent = "order_taking_agent" if turn % 2 else "details_agent"
+        messages.append(
+            {
+                "role": "user",
+                "content": f"Tell me more about the {product['name']}, and what "
+                "goes well with it?",
+            }
+        )
+        order.append({"item": product["name"], "quantity": 1, "price": 0.0})
+        messages.append(
+            {
+                "role": "assistant",
+                "content": product["description"],
+                "memory": {
+                    "agent": agent,
+                    "step_number": "3",
+                    "order": order[-5:],
+                    "asked_recommendation_before": True,
+                },
+            }
+        )
+    if messages and messages[-1]["memory"]["agent"] == "order_taking_agent":
+        messages[-1]["memory"] = {"agent": "details_agent"}
+    messages.append({"role": "user", "content": "Add a latte to my order please."})
+    return messages
+
+
+def vector_index(embeddings, products):
+    documents = {
+        "products": [
+            {
+                "text_for_embedding": product["description"],
+                "embedding": embeddings.embed_query(product["description"]),
+            }
+            for product in products
+        ],
+        "about": [
+            {"content": "Version Coffee", "embedding": embeddings.embed_query("x")}
+        ],
+    }
+    return VectorIndex.from_documents(documents, "benchmark")
+
+
+def build_agents(llm, index, bounded):
+    def policy(agent):
+        if bounded:
+            return ContextPolicy.for_agent(agent, llm, cache=SummaryCache())
+        return ContextPolicy(UNBOUNDED, UNBOUNDED, llm=llm)
+
+    classification = ClassificationAgent(llm, context_policy=policy("classification"))
+    classification.router = None
+    classification.decision_cache = None
+    return {
+        "classification": classification,
+        "details": DetailsAgent(
+            llm,
+            FakeEmbeddings(),
+            vector_index=index,
+            context_policy=policy("details_agent"),
+        ),
+        "order taking": OrderTakingAgent(
+            None, llm, context_policy=policy("order_taking_agent")
+        ),
+    }
+
+
+def run(llm, agent, messages, repeat):
+    timings = []
+    prompt_tokens = 0
+    for _ in range(repeat):
+        llm.prefix_cache.clear()
+        with track_token_usage() as usage:
+            start = time.perf_counter()
+            agent.get_response(messages)
+            timings.append(time.perf_counter() - start)
+        prompt_tokens = usage.prompt_tokens
+    return prompt_tokens, statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 200, 1000])
+    parser.add_argument("--prefill-us", type=float, default=20.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    products = Catalog().products
+    index = vector_index(FakeEmbeddings(), products)
+    # Recommendations were already given in these conversations, so the
+    # order taking agent needs no recommendation agent.
+    structured = {
+        "ClassificationDecision": {
+            "chain_of_thought": "",
+            "decision": "order_taking_agent",
+            "message": "",
+        }
+    }
+
+    print(
+        f"{'agent':<14} {'messages':>8} {'tokens before':>13} {'tokens after':>12} "
+        f"{'ms before':>9} {'ms after':>8}"
+    )
+    for length in args.lengths:
+        messages = conversation(random.Random(length), products, length)
+        results = {}
+        for bounded in (False, True):
+            llm = FakeChatModel(
+                structured=structured, prompt_token_latency=args.prefill_us / 1e6
+            )
+            for name, agent in build_agents(llm, index, bounded).items():
+                results[name, bounded] = run(llm, agent, messages, args.repeat)
+        for name in ("classification", "details", "order taking"):
+            (before_tokens, before_ms), (after_tokens, after_ms) = (
+                results[name, False],
+                results[name, True],
+            )
+            print(
+                f"{name:<14} {len(messages):>8} {before_tokens:>13} "
+                f"{after_tokens:>12} {before_ms:>9.1f} {after_ms:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
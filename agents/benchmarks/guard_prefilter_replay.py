@@ -0,0 +1,107 @@
+"""
+Replay a corpus of guard decisions through the local guard pre-filter.
+
+Usage:
+    python benchmarks/guard_prefilter_replay.py corpus.jsonl [--live]
+
+Each corpus line is a JSON object with the user message under ``content``
+(or a ``messages`` list whose last entry is the user turn) and the LLM's
+verdict under ``decision``. Optional ``latency_ms`` records the LLM call
+time for that turn. With ``--live``, lines without a ``decision`` are
+labelled by calling the guard LLM.
+
+Reports the fast-path hit rate, agreement with the LLM on the hits and the
+estimated guard latency saved.
+"""
+
+import argparse
+import json
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agents.guard_agent import MENU_ITEMS, GuardAgent  # noqa: E402
+from agents.guard_prefilter import GuardPrefilter  # noqa: E402
+
+
+def load_corpus(path):
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "content" not in record:
+                record["content"] = record["messages"][-1]["content"]
+            records.append(record)
+    return records
+
+
+def label_live(records):
+    guard_agent = GuardAgent(prefilter_mode="off")
+    for record in records:
+        if record.get("decision"):
+            continue
+        start = time.perf_counter()
+        response = guard_agent.get_response(
+            [{"role": "user", "content": record["content"]}]
+        )
+        record["latency_ms"] = (time.perf_counter() - start) * 1000
+        record["decision"] = response["memory"]["decision"]
+
+
+def replay(records, prefilter, default_latency_ms):
+    disagreements = []
+    saved_ms = 0.0
+    for record in records:
+        verdict = prefilter.check(record["content"])
+        if verdict is None:
+            continue
+        prefilter.record_agreement(verdict, record["decision"])
+        if verdict != record["decision"]:
+            disagreements.append(
+                {
+                    "content": record["content"],
+                    "prefilter": verdict,
+                    "llm": record["decision"],
+                }
+            )
+        saved_ms += record.get("latency_ms", default_latency_ms)
+
+    report = prefilter.stats()
+    hits = prefilter.hits
+    report["agreement_rate"] = prefilter.agreements / hits if hits else 0.0
+    report["estimated_saved_ms"] = saved_ms
+    report["estimated_saved_ms_per_turn"] = saved_ms / len(records) if records else 0
+    report["disagreement_examples"] = disagreements[:20]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("corpus")
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument(
+        "--llm-latency-ms",
+        type=float,
+        default=800.0,
+        help="guard LLM latency assumed for lines without latency_ms",
+    )
+    args = parser.parse_args()
+
+    records = load_corpus(args.corpus)
+    if args.live:
+        label_live(records)
+    records = [record for record in records if record.get("decision")]
+
+    prefilter = GuardPrefilter.from_catalog(MENU_ITEMS)
+    report = replay(records, prefilter, args.llm_latency_ms)
+    report["records"] = len(records)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Replay a corpus through the fused guard+routing call and the two separate calls.
+
+Usage:
+    python benchmarks/guard_routing_agreement.py corpus.jsonl [--out report.json]
+
+Each corpus line is a JSON object with a ``messages`` list whose last entry
+is the user turn (or just the user message under ``content``). Lines may
+carry the two-call pipeline's decisions under ``guard`` ("allowed" or "not
+allowed") and ``route``; missing ones are produced by calling the guard and,
+for allowed turns, the classification LLM. Files written through
+``ROUTER_LOG_PATH`` can be used as they are: their ``decision`` is taken as
+the route. The fused call is always made live, with ``MODEL_NAME``.
+
+Only the LLM calls are compared: the pre-filter, local router, sticky
+routing and decision caches are shared by both pipelines. Reports guard
+agreement (split into turns only the fused call allows or rejects), route
+agreement on turns both allow, and LLM calls, tokens and latency per turn
+for each pipeline.
+"""
+
+import argparse
+import json
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agents.classification_agent import ClassificationAgent  # noqa: E402
+from agents.guard_agent import GuardAgent  # noqa: E402
+from agents.guard_prefilter import ALLOWED, NOT_ALLOWED  # noqa: E402
+from agents.guard_routing_agent import GuardRoutingAgent  # noqa: E402
+from agents.token_usage import track_token_usage  # noqa: E402
+
+
+def load_corpus(path):
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "messages" not in record:
+                record["messages"] = [{"role": "user", "content": record["content"]}]
+            if "route" not in record and "decision" in record:
+                record["route"] = record["decision"]
+            records.append(record)
+    return records
+
+
+def timed(fn, messages):
+    with track_token_usage() as usage:
+        start = time.perf_counter()
+        result = fn(messages)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    return result, usage, elapsed_ms
+
+
+class PipelineStats:
+    def __init__(self):
+        self.turns = 0
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_ms = []
+
+    def add(self, usage, elapsed_ms):
+        self.calls += usage.calls
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        self.latency_ms.append(elapsed_ms)
+
+    def as_dict(self):
+        turns = self.turns or 1
+        return {
+            "turns": self.turns,
+            "llm_calls_per_turn": self.calls / turns,
+            "prompt_tokens_per_turn": self.prompt_tokens / turns,
+            "completion_tokens_per_turn": self.completion_tokens / turns,
+            "latency_ms_per_turn": sum(self.latency_ms) / turns,
+            "p50_call_ms": (
+                statistics.median(self.latency_ms) if self.latency_ms else 0.0
+            ),
+        }
+
+
+def two_call_decisions(record, guard_agent, classification_agent, stats):
+    """Fill in the two-call pipeline's labels, calling the LLMs if needed."""
+    messages = record["messages"]
+    ran = False
+    if "guard" not in record:
+        result, usage, elapsed_ms = timed(guard_agent._llm_decision, messages)
+        record["guard"] = result.decision
+        stats.add(usage, elapsed_ms)
+        ran = True
+    if record["guard"] == ALLOWED and "route" not in record:
+        result, usage, elapsed_ms = timed(classification_agent._llm_decision, messages)
+        record["route"] = result.decision
+        stats.add(usage, elapsed_ms)
+        ran = True
+    if ran:
+        stats.turns += 1
+
+
+def replay(records, guard_routing_agent, two_call_stats):
+    fused_stats = PipelineStats()
+    counts = {
+        "guard_agreements": 0,
+        "fused_only_allowed": 0,
+        "fused_only_rejected": 0,
+        "both_allowed": 0,
+        "route_agreements": 0,
+    }
+    routes = {}
+    disagreements = []
+    for record in records:
+        two_call_decisions(
+            record,
+            guard_routing_agent.guard_agent,
+            guard_routing_agent.classification_agent,
+            two_call_stats,
+        )
+        result, usage, elapsed_ms = timed(
+            guard_routing_agent._llm_decision, record["messages"]
+        )
+        fused_stats.turns += 1
+        fused_stats.add(usage, elapsed_ms)
+
+        fused_guard = ALLOWED if result.allowed else NOT_ALLOWED
+        if fused_guard == record["guard"]:
+            counts["guard_agreements"] += 1
+        elif result.allowed:
+            counts["fused_only_allowed"] += 1
+        else:
+            counts["fused_only_rejected"] += 1
+
+        route_agrees = True
+        if fused_guard == ALLOWED and record["guard"] == ALLOWED:
+            counts["both_allowed"] += 1
+            pair = f"{record['route']} -> {result.route}"
+            routes[pair] = routes.get(pair, 0) + 1
+            route_agrees = result.route == record["route"]
+            counts["route_agreements"] += route_agrees
+
+        if fused_guard != record["guard"] or not route_agrees:
+            disagreements.append(
+                {
+                    "content": record["messages"][-1]["content"],
+                    "two_call": [record["guard"], record.get("route")],
+                    "fused": [fused_guard, result.route if result.allowed else None],
+                }
+            )
+
+    report = dict(counts)
+    report["records"] = len(records)
+    report["guard_agreement_rate"] = (
+        counts["guard_agreements"] / len(records) if records else 0.0
+    )
+    report["route_agreement_rate"] = (
+        counts["route_agreements"] / counts["both_allowed"]
+        if counts["both_allowed"]
+        else 0.0
+    )
+    report["routes"] = dict(sorted(routes.items()))
+    report["two_call"] = two_call_stats.as_dict()
+    report["fused"] = fused_stats.as_dict()
+    report["disagreement_examples"] = disagreements[:20]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("corpus")
+    parser.add_argument("--out", help="also write the report to this file")
+    args = parser.parse_args()
+
+    records = load_corpus(args.corpus)
+    guard_agent = GuardAgent(prefilter_mode="off")
+    classification_agent = ClassificationAgent()
+    guard_routing_agent = GuardRoutingAgent(guard_agent, classification_agent)
+
+    report = replay(records, guard_routing_agent, PipelineStats())
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Measure per-call client overhead against a fake OpenAI HTTP backend.
+
+Usage:
+    python benchmarks/llm_client_overhead.py [--calls 200] [--handshake-ms 60]
+        [--latency-ms 5] [--idle 6] [--out report.json]
+
+Compares the previous client setup (the default ``ChatOpenAI`` connection
+pool, with the structured-output wrapper rebuilt on every call) with the
+shared pool from ``agents.llm_clients`` and a wrapper built once. Both
+make the guard's structured call over real HTTP to a local server that
+speaks enough of the OpenAI API for it. The server waits
+``--handshake-ms`` on every new connection, standing in for the DNS, TCP
+and TLS round trips to the real API, and ``--latency-ms`` per request.
+
+Reports the cost of building the wrapper, the first call after startup
+(cold for the default pool, after ``awarm_up`` for the shared one),
+steady-state calls, calls after ``--idle`` seconds without traffic, and
+the connections each setup opened.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from langchain_openai import ChatOpenAI  # noqa: E402
+
+from agents import llm_clients  # noqa: E402
+from agents.guard_agent import GuardDecision  # noqa: E402
+
+MESSAGES = [
+    {"role": "system", "content": "Decide whether the message is allowed."},
+    {"role": "user", "content": "Can I get a latte?"},
+]
+DECISION = GuardDecision(
+    chain_of_thought="A menu order.", decision="allowed", message=""
+).model_dump_json()
+USAGE = {"prompt_tokens": 40, "completion_tokens": 20, "total_tokens": 60}
+
+
+class FakeOpenAIServer:
+    """Keep-alive HTTP/1.1 server answering every chat completion with ``content``.
+
+    Every new connection waits ``handshake`` seconds before it is served;
+    each request then waits ``latency`` seconds.
+    """
+
+    def __init__(self, handshake: float, latency: float, content: str = DECISION):
+        self.handshake = handshake
+        self.latency = latency
+        self.content = content
+        self.connections = 0
+        self.requests = 0
+        self.port = None
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=asyncio.run, args=(self._serve(),), daemon=True).start()
+        self._ready.wait()
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        await asyncio.sleep(self.handshake)
+        try:
+            while True:
+                head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+                request_line, *header_lines = head.split("\r\n")
+                path = request_line.split(" ")[1]
+                headers = {}
+                for line in header_lines:
+                    if line:
+                        name, _, value = line.partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                payload = json.dumps(self._response(path, body)).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n" % len(payload) + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _response(self, path, body):
+        if path.endswith("/models"):
+            return {"object": "list", "data": []}
+        request = json.loads(body)
+        message = {"role": "assistant", "content": self.content, "refusal": None}
+        if request.get("tools"):
+            message["content"] = None
+            message["tool_calls"] = [
+                {
+                    "id": "call_1",
+                    "type": "function",
+                    "function": {
+                        "name": request["tools"][0]["function"]["name"],
+                        "arguments": self.content,
+                    },
+                }
+            ]
+        return {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request["model"],
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": USAGE,
+        }
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def wrapper_build_ms(llm, repeats=200):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        llm.with_structured_output(GuardDecision)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+async def run_setup(name, server, call, warm_up, args):
+    connections = server.connections
+    report = {}
+
+    report["warm_up_ms"] = (await warm_up()) * 1000 if warm_up else 0.0
+    start = time.perf_counter()
+    await call()
+    report["first_call_ms"] = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for _ in range(args.calls):
+        start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - start)
+    report["steady"] = summarize(latencies)
+
+    after_idle = []
+    for _ in range(args.idle_repeats):
+        await asyncio.sleep(args.idle)
+        start = time.perf_counter()
+        await call()
+        after_idle.append((time.perf_counter() - start) * 1000)
+    report["after_idle_ms"] = after_idle
+    report["connections_opened"] = server.connections - connections
+    print(
+        f"{name:<8} first {report['first_call_ms']:7.1f} ms  "
+        f"steady p50 {report['steady']['p50_ms']:6.2f} ms  "
+        f"after idle {', '.join(f'{ms:.1f}' for ms in after_idle)} ms  "
+        f"connections {report['connections_opened']}"
+    )
+    return report
+
+
+async def run(args):
+    server = FakeOpenAIServer(args.handshake_ms / 1000, args.latency_ms / 1000)
+    os.environ["OPENAI_BASE_URL"] = server.start()
+    model = os.getenv("MODEL_NAME", "gpt-4o-mini")
+
+    # Previous setup: the default client pool, the wrapper built per call.
+    before_llm = ChatOpenAI(model=model)
+
+    async def before_call():
+        await before_llm.with_structured_output(GuardDecision).ainvoke(MESSAGES)
+
+    # Shared pool, warmed at startup, and a wrapper built once.
+    after_llm = llm_clients.chat_model()
+    structured_llm = after_llm.with_structured_output(GuardDecision)
+
+    async def after_call():
+        await structured_llm.ainvoke(MESSAGES)
+
+    async def warm_up():
+        start = time.perf_counter()
+        await llm_clients.awarm_up(after_llm)
+        return time.perf_counter() - start
+
+    report = {
+        "settings": {
+            "calls": args.calls,
+            "handshake_ms": args.handshake_ms,
+            "latency_ms": args.latency_ms,
+            "idle_s": args.idle,
+            "keepalive_expiry_s": llm_clients.LLM_KEEPALIVE_EXPIRY,
+            "warmup_connections": llm_clients.LLM_WARMUP_CONNECTIONS,
+        },
+        "wrapper_build_ms": wrapper_build_ms(after_llm),
+        "before": await run_setup("before", server, before_call, None, args),
+        "after": await run_setup("after", server, after_call, warm_up, args),
+    }
+    saved = report["before"]["steady"]["mean_ms"] - report["after"]["steady"]["mean_ms"]
+    report["steady_saving_ms_per_call"] = saved
+    print(
+        f"wrapper build {report['wrapper_build_ms']:.3f} ms; "
+        f"steady-state saving {saved:.3f} ms per call"
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument(
+        "--handshake-ms", type=float, default=60, help="delay per new connection"
+    )
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument(
+        "--idle",
+        type=float,
+        default=6,
+        help="seconds without traffic; httpx drops idle connections after 5",
+    )
+    parser.add_argument("--idle-repeats", type=int, default=2)
+    parser.add_argument("--out", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Measure the cost of preparing agent inputs for one order turn.
+
+Usage:
+    python benchmarks/message_copies.py [--turns 10 100 500] [--repeat 200]
+
+An order turn with a recommendation follow-up builds the input messages of
+the guard, classification, order taking and order recommendation prompts.
+The "deepcopy" column replays the per-agent ``deepcopy(messages)`` the
+agents used to do in front of each of those builders; "view" is the
+current code, which shares the history and overlays only the last message.
+
+Reports the median latency and the peak bytes allocated per turn.
+"""
+
+import argparse
+import pathlib
+import statistics
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agents.classification_agent import ClassificationAgent  # noqa: E402
+from agents.fakes import FakeChatModel  # noqa: E402
+from agents.guard_agent import GuardAgent  # noqa: E402
+from agents.order_taking_agent import OrderTakingAgent  # noqa: E402
+from agents.recommendation_agent import RecommendationAgent  # noqa: E402
+
+DATA_DIR = pathlib.Path(__file__).parent.parent / "data"
+
+
+def make_conversation(turns):
+    order = []
+    messages = []
+    for turn in range(turns):
+        order = order + [{"item": "Latte", "quantity": turn + 1, "price": 4.75}]
+        messages.append({"role": "user", "content": f"Add a latte please ({turn})"})
+        messages.append(
+            {
+                "role": "assistant",
+                "content": "Sure, I've added a latte. Anything else?",
+                "memory": {
+                    "agent": "order_taking_agent",
+                    "step_number": "3",
+                    "order": order[-5:],
+                    "asked_recommendation_before": True,
+                },
+            }
+        )
+    messages.append({"role": "user", "content": "And a croissant"})
+    return messages
+
+
+def make_agents():
+    llm = FakeChatModel()
+    recommendation_agent = RecommendationAgent(
+        str(DATA_DIR / "apriori_recommendations.json"),
+        str(DATA_DIR / "popularity_recommendation.csv"),
+        llm,
+    )
+    return (
+        GuardAgent(llm, prefilter_mode="off"),
+        ClassificationAgent(llm),
+        OrderTakingAgent(recommendation_agent, llm),
+        recommendation_agent,
+    )
+
+
+def order_turn(agents, messages, copy):
+    guard, classification, order_taking, recommendation = agents
+    prepare = deepcopy if copy else (lambda m: m)
+    guard._build_input_messages(prepare(messages))
+    classification._build_input_messages(prepare(messages))
+    _, order_messages, _ = order_taking._build_input_messages(prepare(messages))
+    recommendation._order_recommendation_input_messages(
+        prepare(order_messages), ["Croissant", "Cappuccino"]
+    )
+
+
+def measure(agents, messages, copy, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        order_turn(agents, messages, copy)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    order_turn(agents, messages, copy)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings) * 1e6, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    agents = make_agents()
+    print(
+        f"{'turns':>6} {'deepcopy µs':>12} {'view µs':>9} {'speedup':>8} "
+        f"{'deepcopy KiB':>13} {'view KiB':>9}"
+    )
+    for turns in args.turns:
+        messages = make_conversation(turns)
+        copy_us, copy_bytes = measure(agents, messages, True, args.repeat)
+        view_us, view_bytes = measure(agents, messages, False, args.repeat)
+        print(
+            f"{turns:>6} {copy_us:>12.1f} {view_us:>9.1f} "
+            f"{copy_us / view_us:>7.1f}x "
+            f"{copy_bytes / 1024:>13.1f} {view_bytes / 1024:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compare the order taking model's output size: full order vs operations.
+
+Usage:
+    python benchmarks/order_operations.py [--turns 10] [--token-ms 15] [--seed 0]
+
+Builds an order over ``--turns`` turns (mostly additions, some quantity
+changes and removals) and, for each turn, the structured output the model
+has to generate: the old ``OrderTakingDecision`` re-emits the whole order
+with prices, the current one only the operations of that turn. Output
+tokens are estimated at four characters each; ``--token-ms`` converts them
+to decode time. Also times applying the operations with the local order
+engine, which now produces the prices and totals.
+"""
+
+import argparse
+import json
+import pathlib
+import random
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agents.catalog import Catalog  # noqa: E402
+from agents.fakes import estimate_tokens  # noqa: E402
+from agents.order_state import OrderOperation, OrderState  # noqa: E402
+
+RESPONSE = "Got it! Would you like anything else?"
+
+
+def turn_operations(rng, catalog, state, turn):
+    if turn > 2 and state.quantities and rng.random() < 0.3:
+        name = rng.choice(list(state.quantities))
+        if rng.random() < 0.5:
+            return [OrderOperation(action="remove", item=name, quantity=0)]
+        return [
+            OrderOperation(action="set_quantity", item=name, quantity=rng.randint(2, 4))
+        ]
+    product = rng.choice(catalog.products)
+    # Lowercase and pluralised, the way users and models write names.
+    return [
+        OrderOperation(
+            action="add",
+            item=product["name"].lower() + "s",
+            quantity=rng.randint(1, 3),
+        )
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--token-ms", type=float, default=15.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    rng = random.Random(args.seed)
+    state = OrderState(catalog)
+    rows = []
+    apply_us = []
+    for turn in range(1, args.turns + 1):
+        operations = turn_operations(rng, catalog, state, turn)
+        start = time.perf_counter()
+        assert not state.apply(operations)
+        apply_us.append((time.perf_counter() - start) * 1e6)
+
+        before = json.dumps(
+            {"step_number": "3", "response": RESPONSE, "order": state.lines()}
+        )
+        after = json.dumps(
+            {
+                "step_number": "3",
+                "response": RESPONSE,
+                "operations": [operation.model_dump() for operation in operations],
+            }
+        )
+        rows.append((turn, len(state.quantities), before, after))
+
+    print(f"{'turn':>4} {'lines':>5} {'before tok':>10} {'after tok':>9}")
+    for turn, lines, before, after in rows:
+        print(
+            f"{turn:>4} {lines:>5} {estimate_tokens(before):>10} "
+            f"{estimate_tokens(after):>9}"
+        )
+    before_total = sum(estimate_tokens(before) for _, _, before, _ in rows)
+    after_total = sum(estimate_tokens(after) for _, _, _, after in rows)
+    print(
+        f"output tokens per turn: {before_total / len(rows):.0f} -> "
+        f"{after_total / len(rows):.0f} "
+        f"({1 - after_total / before_total:.0%} fewer, about "
+        f"{(before_total - after_total) / len(rows) * args.token_ms:.0f} ms "
+        "less decode per turn)"
+    )
+    print(
+        f"engine: {sum(apply_us) / len(apply_us):.1f} µs per turn; "
+        f"final order {state.describe()}, total ${state.total():.2f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Measure RecommendationAgent import, construction and popular-item lookups.
+
+Usage:
+    python benchmarks/popularity_rankings.py [--repeat 10000] [--imports 5]
+
+"before" replays the pandas implementation the agent used to have
+(``read_csv`` at construction, ``isin`` + ``sort_values`` per call); "after"
+is the current code with precomputed rankings. Import times are measured in
+fresh interpreters: the agent module as it is now, and the same import plus
+``import pandas``, which the old module paid on top. Needs pandas installed
+for the "before" column only.
+"""
+
+import argparse
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+AGENTS_DIR = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(AGENTS_DIR))
+
+from agents.fakes import FakeChatModel  # noqa: E402
+from agents.recommendation_agent import RecommendationAgent  # noqa: E402
+
+APRIORI_PATH = str(AGENTS_DIR / "data" / "apriori_recommendations.json")
+POPULARITY_PATH = str(AGENTS_DIR / "data" / "popularity_recommendation.csv")
+
+QUERIES = [None, ["Coffee"], ["Bakery"], ["Coffee", "Flavours"], ["Tea"]]
+
+
+def import_seconds(statement, runs):
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"{statement}; print(time.perf_counter() - start)"
+    )
+    timings = [
+        float(
+            subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=AGENTS_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        )
+        for _ in range(runs)
+    ]
+    return statistics.median(timings)
+
+
+class LegacyPopularity:
+    """The DataFrame-backed construction and lookup the agent used to do."""
+
+    def __init__(self, pd):
+        with open(APRIORI_PATH, "r") as f:
+            raw = json.load(f)
+        self._apriori_lower = {k.lower(): v for k, v in raw.items()}
+        self.popular_recommendations = pd.read_csv(POPULARITY_PATH)
+        self.products = self.popular_recommendations["product"].tolist()
+        self.product_categories = list(
+            set(self.popular_recommendations["product_category"].tolist())
+        )
+
+    def get_popular_recommendations(self, product_categories=None, k=5):
+        recommendation_df = self.popular_recommendations
+        if isinstance(product_categories, str):
+            product_categories = [product_categories]
+        if product_categories:
+            recommendation_df = recommendation_df[
+                recommendation_df["product_category"].isin(product_categories)
+            ]
+        recommendation_df = recommendation_df.sort_values(
+            "number_of_transactions", ascending=False
+        )
+        if recommendation_df.shape[0] == 0:
+            return []
+        return recommendation_df["product"].tolist()[:k]
+
+
+def time_us(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=10000)
+    parser.add_argument("--imports", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+
+    llm = FakeChatModel()
+    agent = RecommendationAgent(APRIORI_PATH, POPULARITY_PATH, llm)
+    legacy = LegacyPopularity(pd) if pd is not None else None
+
+    module = "import agents.recommendation_agent"
+    after_import = import_seconds(module, args.imports)
+    pandas_loaded = subprocess.run(
+        [sys.executable, "-c", f"{module}, sys; print('pandas' in sys.modules)"],
+        cwd=AGENTS_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+    rows = [("import (ms)", None, after_import * 1000)]
+    if pd is not None:
+        before_import = import_seconds(module + "; import pandas", args.imports)
+        rows[0] = ("import (ms)", before_import * 1000, after_import * 1000)
+
+    construct_repeat = max(args.repeat // 100, 10)
+    rows.append(
+        (
+            "construct (µs)",
+            (
+                time_us(lambda: LegacyPopularity(pd), construct_repeat)
+                if pd is not None
+                else None
+            ),
+            time_us(
+                lambda: RecommendationAgent(APRIORI_PATH, POPULARITY_PATH, llm),
+                construct_repeat,
+            ),
+        )
+    )
+    for query in QUERIES:
+        if legacy is not None:
+            assert legacy.get_popular_recommendations(
+                query
+            ) == agent.get_popular_recommendations(query), query
+        rows.append(
+            (
+                f"top-5 {query or 'all'} (µs)",
+                (
+                    time_us(
+                        lambda: legacy.get_popular_recommendations(query), args.repeat
+                    )
+                    if legacy is not None
+                    else None
+                ),
+                time_us(lambda: agent.get_popular_recommendations(query), args.repeat),
+            )
+        )
+
+    print(f"pandas imported by the agent module: {pandas_loaded}")
+    print(f"{'':<34} {'before':>10} {'after':>10}")
+    for name, before, after in rows:
+        before = f"{before:>10.2f}" if before is not None else f"{'n/a':>10}"
+        print(f"{name:<34} {before} {after:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Compare how much of each prompt a provider prefix cache can serve.
+
+Usage:
+    python benchmarks/prompt_cache.py [--conversations 50] [--turns 20] [--seed 0]
+
+Replays synthetic conversations through the details and order taking
+agents' prompt builders, once with the layout they used to have (retrieved
+context and question in the system prompt, order state prepended to the
+user message) and once with the current one (static system prompt, history,
+then per-request context at the tail). Each layout gets its own simulated
+prefix cache with OpenAI's rules (1024-token minimum, 128-token steps, four
+characters per token). Uncached prompt tokens are what the provider has to
+prefill, so they stand in for time to first token. Prompts under 1024
+tokens are never cached, so short conversations show no hits either way.
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agents.catalog import Catalog  # noqa: E402
+from agents.details_agent import DetailsAgent  # noqa: E402
+from agents.fakes import (  # noqa: E402
+    FakeChatModel,
+    FakeEmbeddings,
+    FakePrefixCache,
+    estimate_tokens,
+    prompt_text,
+)
+from agents.message_view import with_last_content  # noqa: E402
+from agents.order_taking_agent import OrderTakingAgent  # noqa: E402
+
+ABOUT_PATH = (
+    pathlib.Path(__file__).parent.parent / "products" / "version_coffee_about_us.txt"
+)
+
+QUESTIONS = [
+    "What pastries do you have that go well with a latte?",
+    "Is the almond croissant made in house?",
+    "What are your opening hours on weekends?",
+    "Do you deliver, and how long does it take?",
+    "Which of your drinks has the most caffeine?",
+    "Tell me about the ingredients in the ginger scone.",
+]
+ORDERS = [
+    "I'd like a cappuccino please.",
+    "Add a chocolate croissant.",
+    "Actually make that two cappuccinos.",
+    "And a hazelnut syrup in one of them.",
+    "That's all, thanks.",
+]
+
+
+def product_text(product):
+    return (
+        f"{product['name']} - {product['category']}: "
+        f"{product['description']} "
+        f"Ingredients: {', '.join(product['ingredients'])}. "
+        f"Price: ${product['price']:.2f}. Rating: {product['rating']}."
+    )
+
+
+def legacy_details_prompt(messages, product_results, about_results):
+    """``DetailsAgent._build_input_messages`` before the tail layout."""
+    source_knowledge = "\n".join(
+        [doc.get("text_for_embedding", "") for doc in product_results]
+        + [doc.get("content", "") for doc in about_results]
+    )
+    system_prompt = f"""
+        You are an assistant for Version Coffee coffee shop.
+        Answer based on this context:
+
+        Context: {source_knowledge}
+        Question: {messages[-1]["content"]}
+        """
+    messages = with_last_content(messages, system_prompt)
+    return [{"role": "system", "content": system_prompt}] + list(messages)[1:]
+
+
+def legacy_order_prompt(system_prompt, messages):
+    """``OrderTakingAgent._build_input_messages`` before the tail layout."""
+    status = ""
+    for message in reversed(messages):
+        memory = message.get("memory") or {}
+        if message["role"] == "assistant" and memory.get("agent") == (
+            "order_taking_agent"
+        ):
+            status = f"""
+                step number: {memory["step_number"]}
+                order: {memory["order"]}
+                """
+            break
+    if status:
+        messages = with_last_content(messages, status + "\n" + messages[-1]["content"])
+    return [{"role": "system", "content": system_prompt}] + list(messages)
+
+
+def details_turns(rng, products, about, turns):
+    messages = []
+    for _ in range(turns):
+        messages.append({"role": "user", "content": rng.choice(QUESTIONS)})
+        retrieved = [
+            {"text_for_embedding": product_text(product)}
+            for product in rng.sample(products, 5)
+        ]
+        yield list(messages), retrieved, [{"content": about}]
+        messages.append(
+            {
+                "role": "assistant",
+                "content": rng.choice(products)["description"],
+                "memory": {"agent": "details_agent"},
+            }
+        )
+
+
+def order_turns(rng, products, turns):
+    messages = []
+    order = []
+    for step in range(turns):
+        messages.append({"role": "user", "content": ORDERS[step % len(ORDERS)]})
+        yield list(messages)
+        product = rng.choice(products)
+        order.append(
+            {"item": product["name"], "quantity": 1, "price": product["price"]}
+        )
+        messages.append(
+            {
+                "role": "assistant",
+                "content": f"Added {product['name']}. Anything else?",
+                "memory": {
+                    "agent": "order_taking_agent",
+                    "step_number": str(min(step + 1, 3)),
+                    "order": list(order),
+                },
+            }
+        )
+
+
+def measure(prompts):
+    cache = FakePrefixCache()
+    prompt_tokens = cached_tokens = 0
+    for prompt in prompts:
+        text = prompt_text(prompt)
+        prompt_tokens += estimate_tokens(text)
+        cached_tokens += cache.lookup(text)
+    return prompt_tokens, cached_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    products = Catalog().products
+    about = ABOUT_PATH.read_text()
+    llm = FakeChatModel()
+    # A non-None index keeps the agent from loading one; retrieval is
+    # replaced by the sampled documents below.
+    details_agent = DetailsAgent(llm, FakeEmbeddings(), vector_index=object())
+    order_agent = OrderTakingAgent(recommendation_agent=None, llm=llm)
+
+    rng = random.Random(args.seed)
+    details = [
+        turn
+        for _ in range(args.conversations)
+        for turn in details_turns(rng, products, about, args.turns)
+    ]
+    orders = [
+        turn
+        for _ in range(args.conversations)
+        for turn in order_turns(rng, products, args.turns)
+    ]
+
+    rows = [
+        ("details, before", measure(legacy_details_prompt(*turn) for turn in details)),
+        (
+            "details, after",
+            measure(details_agent._build_input_messages(*turn) for turn in details),
+        ),
+        (
+            "order taking, before",
+            measure(legacy_order_prompt(order_agent.system_prompt, m) for m in orders),
+        ),
+        (
+            "order taking, after",
+            measure(order_agent._build_input_messages(m)[0] for m in orders),
+        ),
+    ]
+
+    print(f"{args.conversations} conversations x {args.turns} turns, per call:")
+    print(f"{'':<22} {'prompt':>8} {'cached':>8} {'uncached':>9} {'hit rate':>9}")
+    calls = args.conversations * args.turns
+    for name, (prompt_tokens, cached_tokens) in rows:
+        print(
+            f"{name:<22} {prompt_tokens / calls:>8.0f} {cached_tokens / calls:>8.0f} "
+            f"{(prompt_tokens - cached_tokens) / calls:>9.0f} "
+            f"{cached_tokens / prompt_tokens:>9.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
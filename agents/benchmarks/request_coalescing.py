@@ -0,0 +1,152 @@
+"""
+Measure model calls and latency for bursts of identical turns.
+
+Usage:
+    python benchmarks/request_coalescing.py [--burst 20] [--bursts 3]
+        [--latency-ms 300] [--token-ms 10] [--out report.json]
+
+Sends ``--bursts`` rounds of ``--burst`` concurrent copies of the same
+opening question ("What's popular?", a details question) to the
+controller, half as ``/chat`` turns and half as streams, against a fake
+model that waits ``--latency-ms`` before the first token and ``--token-ms``
+per streamed chunk. Runs three setups: every request makes its own calls
+(decision caches off, as under a burst of cold keys), identical in-flight
+calls coalesced, and coalescing plus the response cache. Reports the model
+calls made and the p50/p95 latency of each setup.
+"""
+
+import argparse
+import asyncio
+import json
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agent_controller import AgentController  # noqa: E402
+from agents.fakes import FakeChatModel, FakeEmbeddings  # noqa: E402
+from agents.vector_index import VectorIndex  # noqa: E402
+
+QUESTIONS = {
+    "recommendation_agent": "What's popular?",
+    "details_agent": "What are your opening hours on weekends?",
+}
+
+
+def route(messages):
+    question = messages[-1]["content"]
+    agent = next(agent for agent, text in QUESTIONS.items() if text == question)
+    return {"chain_of_thought": "", "decision": agent, "message": ""}
+
+
+def build(setup, llm, vector_index):
+    controller = AgentController(
+        llm=llm, embeddings=FakeEmbeddings(), vector_index=vector_index
+    )
+    recommendation = controller.recommendation_agent
+    flights = [
+        controller.guard_agent.flights,
+        controller.classification_agent.flights,
+        controller.guard_routing_agent.flights,
+        recommendation.classification_flights,
+    ]
+    completions = [
+        agent.completions
+        for agent in controller.agent_dict.values()
+        if hasattr(agent, "completions")
+    ]
+    flights += [c.flights for c in completions]
+    for agent in (controller.guard_agent, controller.classification_agent):
+        agent.decision_cache = None
+    controller.guard_agent.prefilter = None
+    for flight in flights:
+        flight.enabled = setup != "uncoalesced"
+    if setup != "cached":
+        for c in completions:
+            c.cache = None
+    return controller
+
+
+async def turn(controller, messages, stream):
+    start = time.perf_counter()
+    if stream:
+        async for _ in controller.aget_stream(messages):
+            pass
+    else:
+        await controller.aget_response(messages)
+    return time.perf_counter() - start
+
+
+async def run_setup(setup, args, vector_index):
+    llm = FakeChatModel(
+        structured={"ClassificationDecision": route},
+        latency=args.latency_ms / 1000,
+        token_latency=args.token_ms / 1000,
+    )
+    controller = build(setup, llm, vector_index)
+    latencies = {}
+    for agent, question in QUESTIONS.items():
+        messages = [{"role": "user", "content": question}]
+        route_latencies = []
+        for _ in range(args.bursts):
+            route_latencies += await asyncio.gather(
+                *(turn(controller, messages, i % 2 == 1) for i in range(args.burst))
+            )
+        route_latencies.sort()
+        latencies[agent] = {
+            "p50_ms": statistics.median(route_latencies) * 1000,
+            "p95_ms": route_latencies[int(len(route_latencies) * 0.95)] * 1000,
+        }
+    stats = controller.cache_stats()
+    result = {
+        "model_calls": len(llm.calls),
+        "coalesced_calls": stats["coalesced_calls"]["hits"],
+        "response_cache_hits": stats["responses"]["hits"],
+        "latency": latencies,
+    }
+    print(
+        f"{setup:<12} model calls {result['model_calls']:5d}  "
+        + "  ".join(
+            f"{agent.split('_')[0]} p50 {lat['p50_ms']:5.0f} ms "
+            f"p95 {lat['p95_ms']:5.0f} ms"
+            for agent, lat in latencies.items()
+        )
+    )
+    return result
+
+
+async def run(args):
+    vector_index = VectorIndex.from_seed_files(FakeEmbeddings())
+    report = {
+        "settings": {
+            "burst": args.burst,
+            "bursts": args.bursts,
+            "latency_ms": args.latency_ms,
+            "token_ms": args.token_ms,
+        }
+    }
+    for setup in ("uncoalesced", "coalesced", "cached"):
+        report[setup] = await run_setup(setup, args, vector_index)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--burst", type=int, default=20)
+    parser.add_argument("--bursts", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--out", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+Load and latency benchmark of the agents service with fake backends.
+
+Usage:
+    python benchmarks/service_load.py [--out results.json] [--compare old.json]
+        [--routes details order] [--concurrency 1 4 16 64] [--requests 64]
+        [--stream-requests 20] [--llm-latency 0.05] [--tokens-per-sec 100]
+        [--response-tokens 40] [--embedding-latency 0.02]
+        [--pipeline-mode sequential]
+
+Serves ``main.app`` with uvicorn on a local port and drives it over HTTP.
+The controller behind it uses a fake chat model (fixed latency before the
+first token, then ``--tokens-per-sec``; structured outputs chosen from the
+message text), fake embeddings and an in-memory vector index in place of
+MongoDB, so results are deterministic and need no network or API key.
+
+For every route (guard reject, details, recommendation, order, and an
+order that is followed by a recommendation) it measures:
+
+- ``/chat/stream``, one request at a time: time to first token, total time,
+  streamed tokens per second and the latency of each pipeline stage (guard,
+  classification, retrieval, agent);
+- ``/chat`` at each ``--concurrency`` level: throughput and p50/p95/p99.
+
+Results are printed and written as JSON with ``--out``; ``--compare``
+prints the change of every latency percentile against an earlier file.
+The client runs in the same process as the server, so absolute numbers
+include its overhead; compare results taken on the same machine.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+# Decisions and answers must not be cached or shared between requests, and
+# main's own controller must not try to load the MongoDB index at import.
+os.environ.setdefault("DECISION_CACHE", "off")
+os.environ.setdefault("RESPONSE_CACHE", "off")
+os.environ.setdefault("REQUEST_COALESCING", "off")
+os.environ.setdefault("DETAILS_RETRIEVAL", "mongo")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("EMBEDDING_MODEL", "benchmark")
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+import main as service  # noqa: E402
+from agent_controller import AgentController  # noqa: E402
+from agents.fakes import FakeChatModel, FakeEmbeddings  # noqa: E402
+from agents.vector_index import VectorIndex  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+
+
+def user(content):
+    return {"role": "user", "content": content}
+
+
+ROUTES = {
+    "guard_reject": [user("Can you help me with my math homework?")],
+    "details": [user("What are your opening hours on weekends?")],
+    "recommendation": [user("What would you recommend with my coffee?")],
+    "order": [
+        user("I'd like a latte"),
+        {
+            "role": "assistant",
+            "content": "Added a Latte. Anything else?",
+            "memory": {
+                "agent": "order_taking_agent",
+                "step_number": "2",
+                "order": [{"item": "Latte", "quantity": 1, "price": 4.75}],
+                "asked_recommendation_before": True,
+            },
+        },
+        user("Add a croissant please"),
+    ],
+    "order_recommendation": [user("I'd like a latte")],
+}
+
+
+def _last(messages):
+    return messages[-1]["content"].lower()
+
+
+def _route(messages):
+    text = _last(messages)
+    if "recommend" in text:
+        return "recommendation_agent"
+    if "latte" in text or "croissant" in text:
+        return "order_taking_agent"
+    return "details_agent"
+
+
+def _allowed(messages):
+    return "homework" not in _last(messages)
+
+
+def structured_responses():
+    def guard(messages):
+        allowed = _allowed(messages)
+        return {
+            "chain_of_thought": "",
+            "decision": "allowed" if allowed else "not allowed",
+            "message": "" if allowed else "Sorry, I can only help with coffee.",
+        }
+
+    def classification(messages):
+        return {"chain_of_thought": "", "decision": _route(messages), "message": ""}
+
+    def guard_routing(messages):
+        return {
+            "chain_of_thought": "",
+            "allowed": _allowed(messages),
+            "rejection_message": "Sorry, I can only help with coffee.",
+            "route": _route(messages),
+        }
+
+    def order(messages):
+        item = "Croissant" if "croissant" in _last(messages) else "Latte"
+        return {
+            "step_number": "2",
+            "response": f"Added a {item}. Anything else?",
+            "operations": [{"action": "add", "item": item, "quantity": 1}],
+        }
+
+    return {
+        "GuardDecision": guard,
+        "ClassificationDecision": classification,
+        "GuardRoutingDecision": guard_routing,
+        "OrderTakingDecision": order,
+    }
+
+
+class StageTimer:
+    """Wraps agent methods to record how long each pipeline stage takes."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def reset(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, obj, method, stage):
+        fn = getattr(obj, method)
+
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+
+        setattr(obj, method, timed)
+
+    def wrap_stream(self, obj, method, stage):
+        fn = getattr(obj, method)
+
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            async for event in fn(*args, **kwargs):
+                yield event
+            self.samples[stage].append(time.perf_counter() - start)
+
+        setattr(obj, method, timed)
+
+    def instrument(self, controller):
+        self.wrap(controller.guard_agent, "aget_response", "guard")
+        self.wrap(controller.classification_agent, "aget_response", "classification")
+        self.wrap(controller.guard_routing_agent, "adecide", "guard_routing")
+        details = controller.agent_dict["details_agent"]
+        self.wrap(details, "_aretrieve", "retrieval")
+        for agent in controller.agent_dict.values():
+            self.wrap(agent, "aget_response", "agent")
+            self.wrap_stream(agent, "aget_stream", "agent")
+
+
+def build_controller(args):
+    llm = FakeChatModel(
+        text=" ".join(["coffee"] * args.response_tokens),
+        structured=structured_responses(),
+        latency=args.llm_latency,
+        token_latency=1 / args.tokens_per_sec,
+        chunk_size=4,
+    )
+    embeddings = FakeEmbeddings(latency=args.embedding_latency)
+    return AgentController(
+        llm,
+        args.pipeline_mode,
+        embeddings,
+        VectorIndex.from_seed_files(FakeEmbeddings()),
+    )
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port):
+    config = uvicorn.Config(
+        service.app, host="127.0.0.1", port=port, log_level="warning", loop="asyncio"
+    )
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread
+
+
+def percentiles(samples, scale=1000.0):
+    if not samples:
+        return {f"p{p}": None for p in PERCENTILES}
+    values = np.percentile(np.asarray(samples) * scale, PERCENTILES)
+    return {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, values)}
+
+
+async def stream_once(client, messages):
+    start = time.perf_counter()
+    first = last = None
+    tokens = 0
+    async with client.stream(
+        "POST", "/chat/stream", json={"messages": messages}
+    ) as response:
+        async for line in response.aiter_lines():
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            event = json.loads(line[len("data: ") :])
+            if event["type"] == "error":
+                raise RuntimeError(event["content"])
+            if event["type"] == "token":
+                last = time.perf_counter()
+                first = first or last
+                tokens += 1
+    end = time.perf_counter()
+    return {
+        "ttft": (first or end) - start,
+        "total": end - start,
+        "tokens": tokens,
+        "decode": (last - first) if first is not None else 0.0,
+    }
+
+
+async def bench_stream(client, timer, messages, requests):
+    timer.reset()
+    runs = [await stream_once(client, messages) for _ in range(requests)]
+    rates = [run["tokens"] / run["decode"] for run in runs if run["decode"] > 0]
+    return {
+        "requests": requests,
+        "ttft_ms": percentiles([run["ttft"] for run in runs]),
+        "total_ms": percentiles([run["total"] for run in runs]),
+        "tokens": int(np.median([run["tokens"] for run in runs])),
+        "tokens_per_sec": round(float(np.median(rates)), 1) if rates else None,
+        "stages_ms": {
+            stage: percentiles(samples) for stage, samples in timer.samples.items()
+        },
+    }
+
+
+async def bench_chat(client, messages, concurrency, requests):
+    latencies = []
+    errors = 0
+    queue = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in queue:
+            start = time.perf_counter()
+            response = await client.post("/chat", json={"messages": messages})
+            if response.status_code != 200:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+async def run(args, port, timer):
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=120
+    ) as client:
+        results = {"stream": {}, "chat": {}}
+        for route in args.routes:
+            messages = ROUTES[route]
+            # One warm-up turn so first-request setup is not measured.
+            await stream_once(client, messages)
+            results["stream"][route] = await bench_stream(
+                client, timer, messages, args.stream_requests
+            )
+            results["chat"][route] = [
+                await bench_chat(client, messages, level, max(args.requests, level * 4))
+                for level in args.concurrency
+            ]
+        return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=pathlib.Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(
+        f"{'route':<21} {'ttft p50':>8} {'ttft p95':>8} {'total p50':>9} "
+        f"{'tok/s':>6}  stages p50 (ms)"
+    )
+    for route, stream in results["stream"].items():
+        stages = ", ".join(
+            f"{stage} {values['p50']:.1f}"
+            for stage, values in sorted(stream["stages_ms"].items())
+        )
+        print(
+            f"{route:<21} {stream['ttft_ms']['p50']:>8.1f} "
+            f"{stream['ttft_ms']['p95']:>8.1f} {stream['total_ms']['p50']:>9.1f} "
+            f"{stream['tokens_per_sec'] or 0:>6.0f}  {stages}"
+        )
+    print()
+    print(
+        f"{'route':<21} {'conc':>4} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} "
+        f"{'errors':>6}"
+    )
+    for route, levels in results["chat"].items():
+        for level in levels:
+            latency = level["latency_ms"]
+            print(
+                f"{route:<21} {level['concurrency']:>4} "
+                f"{level['throughput_rps']:>7.1f} {latency['p50']:>8.1f} "
+                f"{latency['p95']:>8.1f} {latency['p99']:>8.1f} {level['errors']:>6}"
+            )
+
+
+def _flatten(results):
+    """``{"chat.details.c16.p95": value, ...}`` for every latency percentile."""
+    flat = {}
+    for route, stream in results["stream"].items():
+        for metric in ("ttft_ms", "total_ms"):
+            for name, value in stream[metric].items():
+                flat[f"stream.{route}.{metric}.{name}"] = value
+    for route, levels in results["chat"].items():
+        for level in levels:
+            for name, value in level["latency_ms"].items():
+                flat[f"chat.{route}.c{level['concurrency']}.{name}"] = value
+    return flat
+
+
+def print_comparison(baseline, results):
+    before = _flatten(baseline)
+    after = _flatten(results)
+    print(f"\nchange against {baseline.get('commit') or 'baseline'}:")
+    for key, value in after.items():
+        old = before.get(key)
+        if old and value is not None:
+            print(f"  {key:<44} {old:>9.1f} -> {value:>9.1f} ({value / old - 1:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--out")
+    parser.add_argument("--compare")
+    parser.add_argument(
+        "--routes", nargs="+", choices=list(ROUTES), default=list(ROUTES)
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--stream-requests", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-sec", type=float, default=100.0)
+    parser.add_argument("--response-tokens", type=int, default=40)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--pipeline-mode")
+    args = parser.parse_args()
+
+    controller = build_controller(args)
+    timer = StageTimer()
+    timer.instrument(controller)
+    service.agent_controller = controller
+
+    port = free_port()
+    server, thread = start_server(port)
+    try:
+        results = asyncio.run(run(args, port, timer))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    report = {
+        "commit": git_commit(),
+        "settings": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("out", "compare")
+        },
+        **results,
+    }
+    print_results(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Measure how throughput and memory scale with the number of service workers.
+
+Usage:
+    python benchmarks/worker_scaling.py [--workers 1 2 4] [--seconds 10]
+        [--clients 4] [--concurrency 16] [--out report.json]
+
+Starts ``python main.py`` with ``AGENT_WORKERS`` set to each count, drives
+it with ``--clients`` load processes of ``--concurrency`` requests each for
+``--seconds`` after a warm-up, and reports requests per second, latency
+and the scaling efficiency against one worker (throughput divided by
+``workers`` times the single-worker throughput). Memory is read from
+``/proc`` for every worker: rss counts shared pages in full, pss splits
+them between the processes mapping them, so the pss total is what the
+workers cost together.
+
+Each turn is rejected by the guard, one model call to the local fake from
+``llm_client_overhead.py``, which runs in its own process so the load
+generator and the fake do not compete with each other for a GIL. Scaling
+needs at least as many free cores as workers plus the load processes.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+AGENTS_DIR = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(AGENTS_DIR))
+
+import httpx  # noqa: E402
+
+from benchmarks.cold_start import (  # noqa: E402
+    MESSAGE,
+    REJECTION,
+    free_port,
+    service_env,
+    wait_for,
+)
+from benchmarks.llm_client_overhead import FakeOpenAIServer  # noqa: E402
+from workers import memory_usage  # noqa: E402
+
+
+def run_fake_server(latency, ports):
+    server = FakeOpenAIServer(handshake=0, latency=latency, content=REJECTION)
+    ports.put(server.start())
+    while True:
+        time.sleep(3600)
+
+
+async def drive(url, seconds, concurrency):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+
+        async def loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.post(url, json={"messages": [MESSAGE]})
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def load_process(url, seconds, concurrency, results):
+    results.put(asyncio.run(drive(url, seconds, concurrency)))
+
+
+def generate_load(url, seconds, clients, concurrency):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=load_process, args=(url, seconds, concurrency, results)
+        )
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        client_latencies, client_errors = results.get()
+        latencies.extend(client_latencies)
+        errors += client_errors
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    return latencies, errors, elapsed
+
+
+def worker_pids(parent):
+    """The service's worker processes: its children, or itself if it has none."""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The command name may hold spaces; ppid follows its ")".
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent:
+            children.append(int(entry))
+    return sorted(children) or [parent]
+
+
+def run(workers, env, args):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = {**env, "PORT": str(port), "AGENT_WORKERS": str(workers)}
+    process = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=AGENTS_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.perf_counter() + args.timeout
+        with httpx.Client(timeout=args.timeout) as client:
+            # Requests land on any worker; enough answers that all are likely up.
+            for _ in range(4 * workers):
+                wait_for(client, f"{base}/ready", time.perf_counter(), deadline)
+
+        url = f"{base}/chat"
+        generate_load(url, args.warmup, args.clients, args.concurrency)
+        latencies, errors, elapsed = generate_load(
+            url, args.seconds, args.clients, args.concurrency
+        )
+
+        memory = [memory_usage(pid) for pid in worker_pids(process.pid)]
+        parent = memory_usage(process.pid) if workers > 1 else {}
+    finally:
+        process.terminate()
+        process.wait()
+
+    latencies.sort()
+    mib = 1024 * 1024
+    result = {
+        "requests_per_s": len(latencies) / elapsed,
+        "errors": errors,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "worker_rss_mib": [usage.get("rss", 0) / mib for usage in memory],
+        "worker_pss_mib": [usage.get("pss", 0) / mib for usage in memory],
+        "total_pss_mib": sum(usage.get("pss", 0) for usage in (*memory, parent)) / mib,
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    cores = os.cpu_count() or 1
+    default_workers = [n for n in (1, 2, 4, 8, 16) if n <= max(cores // 2, 1)]
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--clients", type=int, default=max(cores // 2, 1))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--latency-ms", type=float, default=0, help="fake model latency per call"
+    )
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--out", help="also write the report to this file")
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    fake = multiprocessing.Process(
+        target=run_fake_server, args=(args.latency_ms / 1000, ports), daemon=True
+    )
+    fake.start()
+    # Several workers refuse to start with per-process sessions.
+    sessions = tempfile.NamedTemporaryFile(suffix=".sqlite")
+    env = service_env(
+        ports.get(),
+        AGENT_STARTUP="eager",
+        LLM_WARMUP_CONNECTIONS="0",
+        SESSION_STORE="sqlite",
+        SESSION_STORE_PATH=sessions.name,
+    )
+
+    report = {
+        "settings": {
+            "cpu_count": cores,
+            "seconds": args.seconds,
+            "clients": args.clients,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+        },
+        "runs": {},
+    }
+    baseline = None
+    for workers in args.workers:
+        result = run(workers, env, args)
+        if baseline is None:
+            baseline = result["requests_per_s"] / workers
+        result["efficiency"] = result["requests_per_s"] / (baseline * workers)
+        report["runs"][workers] = result
+        print(
+            f"{workers:>2} workers {result['requests_per_s']:8.1f} req/s  "
+            f"efficiency {result['efficiency']:5.2f}  "
+            f"p50 {result['p50_ms']:6.1f} ms  "
+            f"rss/worker {statistics.fmean(result['worker_rss_mib']):6.1f} MiB  "
+            f"pss/worker {statistics.fmean(result['worker_pss_mib']):6.1f} MiB  "
+            f"pss total {result['total_pss_mib']:6.1f} MiB"
+        )
+    fake.terminate()
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,104 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from agent_controller import AgentController
+from session_store import SESSION_STORE, SessionStore
+from agents.metrics import (
+    ERRORS,
+    REGISTRY,
+    REQUEST_SECONDS,
+    TIME_TO_FIRST_TOKEN_SECONDS,
+    track_stages,
+)
+from profiling import maybe_profile
+from workers import memory_usage
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 import os
 import json
+import threading
 import uvicorn
+import weakref
+
+# The agent pipeline (langchain, pymongo, numpy, the data files) is imported
+# and built by load_controller(), not at import, so the port binds quickly.
 
 PORT = int(os.getenv("PORT", 8000))
+# "eager" builds the agents and warms their connections before serving;
+# "background" serves /health at once and builds them after the port is
+# bound. Turns that arrive first wait for the build.
+AGENT_STARTUP = os.getenv("AGENT_STARTUP", "eager")
+# Worker processes for ``python main.py``; more than one forks them from a
+# parent that has preloaded the pipeline and the shared data (workers.py).
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", 1))
+
+logger = logging.getLogger(__name__)
+
+agent_controller = None
+_controller_lock = threading.Lock()
+# Set while start_pipeline() builds and warms the controller.
+_starting = False
+
+
+def load_controller():
+    """Import the agent pipeline and build the controller, once."""
+    global agent_controller
+    with _controller_lock:
+        if agent_controller is None:
+            from agent_controller import AgentController
+
+            agent_controller = AgentController()
+    return agent_controller
+
+
+async def get_controller():
+    if agent_controller is None:
+        # Off the event loop, so /health and /ready answer during the build.
+        await asyncio.to_thread(load_controller)
+    return agent_controller
+
+
+def track_token_usage():
+    # agents.token_usage imports langchain_core, so it loads with the pipeline.
+    from agents.token_usage import track_token_usage
+
+    return track_token_usage()
+
+
+async def start_pipeline():
+    global _starting
+    _starting = True
+    try:
+        controller = await get_controller()
+        # Connections and TLS sessions are set up before traffic arrives, so
+        # the first turn after a deploy does not pay for them.
+        await controller.awarm_up()
+    finally:
+        _starting = False
+
+
+async def start_pipeline_in_background():
+    try:
+        await start_pipeline()
+    except Exception:
+        # Not ready; the next turn retries the build.
+        logger.exception("Agent pipeline failed to start")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if AGENT_STARTUP == "background":
+        startup = asyncio.create_task(start_pipeline_in_background())
+    else:
+        startup = None
+        await start_pipeline()
+    yield
+    if startup is not None:
+        startup.cancel()
 
-app = FastAPI(title="Version Coffee Agents")
+
+app = FastAPI(title="Version Coffee Agents", lifespan=lifespan)
 
 # CORS — allow the Node.js API and frontend to call this service
 origins = [os.getenv("API_URL", "http://localhost:3000")]
@@ -26,7 +115,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-agent_controller = AgentController()
+session_store = SessionStore()
+# Turns of one session served by this process run one at a time, so each
+# sees the one before. Across workers, the store's compare-and-set keeps
+# concurrent turns from overwriting each other.
+session_locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+# Rate-limited controller for /chat/batch, built on first use when
+# BATCH_RATE_LIMITS is set so batch jobs cannot starve live traffic.
+_batch_controller = None
+
+
+def usage_metrics():
+    if agent_controller is None:
+        return
+    from agents.token_usage import TOTAL_USAGE
+
+    usage = TOTAL_USAGE.as_dict()
+    yield (
+        "agents_llm_calls_total",
+        "counter",
+        "Chat model calls",
+        {},
+        usage["calls"],
+    )
+    for kind in ("prompt", "cached", "completion"):
+        yield (
+            "agents_tokens_total",
+            "counter",
+            "Tokens of all chat model calls, by kind",
+            {"kind": kind},
+            usage[f"{kind}_tokens"],
+        )
+
+
+def cache_metrics():
+    if agent_controller is None:
+        return
+    for cache, stats in agent_controller.cache_stats().items():
+        for result, value in stats.items():
+            yield (
+                "agents_cache_lookups_total",
+                "counter",
+                "Cache and fast path lookups, by cache and result",
+                {"cache": cache, "result": result},
+                value,
+            )
+
+
+def process_metrics():
+    for kind, value in memory_usage().items():
+        yield (
+            "agents_process_memory_bytes",
+            "gauge",
+            "Resident memory of the worker that answered, by kind",
+            {"pid": os.getpid(), "kind": kind},
+            value,
+        )
+
+
+REGISTRY.register_collector(usage_metrics)
+REGISTRY.register_collector(cache_metrics)
+REGISTRY.register_collector(process_metrics)
 
 
 class Message(BaseModel):
@@ -36,49 +185,285 @@ class Message(BaseModel):
 
 
 class ChatRequest(BaseModel):
-    messages: list[Message]
+    # Either the full history (stateless mode), or only the new user
+    # message plus the session id returned by an earlier turn (session mode).
+    # Session mode without a session id starts a new session.
+    messages: list[Message] | None = None
+    message: Message | None = None
+    session_id: str | None = None
 
 
 class ChatResponse(BaseModel):
     role: str
     content: str
     memory: dict
+    session_id: str | None = None
+    # Prompt, cached prompt and completion tokens of every model call made
+    # for this turn.
+    usage: dict | None = None
+
+
+def session_lock(session_id: str) -> asyncio.Lock:
+    lock = session_locks.get(session_id)
+    if lock is None:
+        lock = session_locks[session_id] = asyncio.Lock()
+    return lock
+
+
+async def load_session(session_id: str):
+    # The sqlite and redis backends block, so they run off the event loop.
+    session = await asyncio.to_thread(session_store.load, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return session
+
+
+async def batch_controller():
+    global _batch_controller
+    from batch_runner import BATCH_RATE_LIMITS, build_controller, parse_rate_limits
+
+    if not BATCH_RATE_LIMITS:
+        return await get_controller()
+    if _batch_controller is None:
+        _batch_controller = await asyncio.to_thread(
+            build_controller, parse_rate_limits([BATCH_RATE_LIMITS])
+        )
+    return _batch_controller
+
+
+def check_request(request: ChatRequest):
+    if (request.messages is None) == (request.message is None):
+        raise HTTPException(
+            status_code=422, detail="Send either 'messages' or 'message'"
+        )
+
+
+def usage_event(usage) -> str:
+    event = {"type": "usage", "content": usage.as_dict()}
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def timings_event(timings) -> str:
+    # Milliseconds per pipeline stage, to the first token and in total.
+    event = {"type": "timings", "content": timings.as_dict(total=timings.elapsed())}
+    return f"data: {json.dumps(event)}\n\n"
+
+
+async def timed_events(events, timings):
+    """Pass stream events through, recording the time to the first token."""
+    first_token = True
+    async for event in events:
+        if first_token and event["type"] == "token":
+            first_token = False
+            ttft = timings.elapsed()
+            TIME_TO_FIRST_TOKEN_SECONDS.observe(ttft)
+            timings.add("ttft", ttft)
+        yield event
 
 
 @app.get("/health")
 async def health():
+    """Liveness: the process is up and serving, possibly still starting."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: the agents are built and their connections warmed."""
+    if agent_controller is None or _starting:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready"}
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    await asyncio.to_thread(session_store.delete, session_id)
     return {"status": "ok"}
 
 
+@app.get("/sessions/stats")
+async def session_stats():
+    return await asyncio.to_thread(session_store.stats)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage latencies, routes, errors, tokens and caches."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/usage")
+async def usage():
+    """Token usage summed over every turn served by this process."""
+    from agents.token_usage import TOTAL_USAGE
+
+    return TOTAL_USAGE.as_dict()
+
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_response: Response):
+    check_request(request)
+    with track_stages() as timings, maybe_profile("chat"):
+        try:
+            if request.message is not None:
+                result = await chat_session(request)
+            else:
+                result = await chat_stateless(request)
+        finally:
+            elapsed = timings.elapsed()
+            REQUEST_SECONDS.observe(elapsed, endpoint="chat")
+    http_response.headers["Server-Timing"] = timings.server_timing(total=elapsed)
+    return result
+
+
+async def chat_stateless(request: ChatRequest):
     try:
+        controller = await get_controller()
         messages = [msg.model_dump() for msg in request.messages]
-        response = agent_controller.get_response(messages)
-        return response
+        with track_token_usage() as usage:
+            response = await controller.aget_response(messages)
+        return {**response, "usage": usage.as_dict()}
     except Exception as e:
+        ERRORS.inc(stage="chat")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
-    def event_generator():
+async def chat_session(request: ChatRequest):
+    message = request.message.model_dump()
+    session_id = request.session_id or await asyncio.to_thread(session_store.create)
+    async with session_lock(session_id):
+        session = await load_session(session_id)
+        messages = session_store.history(session, message)
         try:
-            messages = [msg.model_dump() for msg in request.messages]
-            for event in agent_controller.get_stream(messages):
-                data = json.dumps(event)
-                yield f"data: {data}\n\n"
-            yield "data: [DONE]\n\n"
+            controller = await get_controller()
+            with track_token_usage() as usage:
+                response = await controller.aget_response(messages)
         except Exception as e:
-            error = json.dumps({"type": "error", "content": str(e)})
-            yield f"data: {error}\n\n"
+            ERRORS.inc(stage="chat")
+            raise HTTPException(status_code=500, detail=str(e))
+        await asyncio.to_thread(
+            session_store.record_turn, session_id, session, message, response
+        )
+    return {**response, "session_id": session_id, "usage": usage.as_dict()}
+
+
+@app.post("/chat/batch")
+async def chat_batch(request: Request, concurrency: int | None = None):
+    """Run a JSONL body of conversations; results stream back as JSONL.
+
+    Results arrive in completion order, one line per conversation (see
+    ``batch_runner.py`` for the formats). A client that is cut off resumes
+    by resending the conversations whose ids it has not received.
+    """
+    from batch_runner import (
+        BATCH_CONCURRENCY,
+        BATCH_MAX_CONCURRENCY,
+        BatchRunner,
+        read_conversations,
+    )
+
+    body = (await request.body()).decode("utf-8")
+    try:
+        records = list(read_conversations(body.splitlines()))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid JSONL: {e}")
+    concurrency = min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    runner = BatchRunner(await batch_controller(), concurrency)
+
+    async def results():
+        async for result in runner.run(records):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    check_request(request)
+    if request.message is not None:
+        message = request.message.model_dump()
+        session_id = request.session_id or await asyncio.to_thread(session_store.create)
+        # Fail fast with a 404 before the event stream starts.
+        await load_session(session_id)
+
+    async def event_generator():
+        with track_stages() as timings, maybe_profile("chat_stream"):
+            try:
+                controller = await get_controller()
+                messages = [msg.model_dump() for msg in request.messages]
+                with track_token_usage() as usage:
+                    async for event in timed_events(
+                        controller.aget_stream(messages), timings
+                    ):
+                        data = json.dumps(event)
+                        yield f"data: {data}\n\n"
+                yield usage_event(usage)
+                yield timings_event(timings)
+                yield "data: [DONE]\n\n"
+            except Exception as e:
+                ERRORS.inc(stage="chat_stream")
+                error = json.dumps({"type": "error", "content": str(e)})
+                yield f"data: {error}\n\n"
+            finally:
+                REQUEST_SECONDS.observe(timings.elapsed(), endpoint="chat_stream")
+
+    async def session_event_generator():
+        async with session_lock(session_id):
+            with track_stages() as timings, maybe_profile("chat_stream"):
+                try:
+                    session = await load_session(session_id)
+                    event = {"type": "session", "content": session_id}
+                    yield f"data: {json.dumps(event)}\n\n"
+                    messages = session_store.history(session, message)
+                    controller = await get_controller()
+                    tokens = []
+                    with track_token_usage() as usage:
+                        async for event in timed_events(
+                            controller.aget_stream(messages), timings
+                        ):
+                            if event["type"] == "token":
+                                tokens.append(event["content"])
+                            elif event["type"] == "memory":
+                                response = {
+                                    "content": "".join(tokens),
+                                    "memory": event["content"],
+                                }
+                                await asyncio.to_thread(
+                                    session_store.record_turn,
+                                    session_id,
+                                    session,
+                                    message,
+                                    response,
+                                )
+                            data = json.dumps(event)
+                            yield f"data: {data}\n\n"
+                    yield usage_event(usage)
+                    yield timings_event(timings)
+                    yield "data: [DONE]\n\n"
+                except Exception as e:
+                    ERRORS.inc(stage="chat_stream")
+                    error = json.dumps({"type": "error", "content": str(e)})
+                    yield f"data: {error}\n\n"
+                finally:
+                    REQUEST_SECONDS.observe(timings.elapsed(), endpoint="chat_stream")
 
     return StreamingResponse(
-        event_generator(),
+        event_generator() if request.message is None else session_event_generator(),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
+    if AGENT_WORKERS > 1:
+        from workers import serve
+
+        if SESSION_STORE == "memory":
+            # Turns of a session would land on workers that never saw it.
+            raise SystemExit(
+                "SESSION_STORE=memory keeps sessions per worker; "
+                "use sqlite or redis with AGENT_WORKERS > 1"
+            )
+        raise SystemExit(serve("main:app", "0.0.0.0", PORT, AGENT_WORKERS))
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=PORT)
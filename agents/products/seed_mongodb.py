@@ -5,9 +5,13 @@ Usage:
     python products/seed_mongodb.py
 
 Requires env vars: MONGODB_URI, EMBEDDING_MODEL, OPENAI_API_KEY
+
+Embeddings are cached in EMBEDDING_CACHE_PATH (default
+data/embedding_cache.sqlite), so re-seeding only embeds text that changed.
 """
 
 import os
+import sys
 import json
 import dotenv
 from pymongo import MongoClient
@@ -16,10 +20,20 @@ from langchain_openai import OpenAIEmbeddings
 dotenv.load_dotenv()
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+
+from agents.vector_index import VectorIndex, product_text  # noqa: E402
+from agents.embedding_cache import CachedEmbeddings  # noqa: E402
 
 client = MongoClient(os.getenv("MONGODB_URI"))
 db = client["test"]
-embeddings = OpenAIEmbeddings(model=os.getenv("EMBEDDING_MODEL"))
+embeddings = CachedEmbeddings(
+    OpenAIEmbeddings(model=os.getenv("EMBEDDING_MODEL")),
+    path=os.getenv(
+        "EMBEDDING_CACHE_PATH",
+        os.path.join(os.path.dirname(SCRIPT_DIR), "data", "embedding_cache.sqlite"),
+    ),
+)
 
 
 def seed_products():
@@ -36,15 +50,7 @@ def seed_products():
             products.append(json.loads(line))
 
     # Build text for embedding per product
-    texts = []
-    for p in products:
-        text = (
-            f"{p['name']} - {p['category']}: "
-            f"{p['description']} "
-            f"Ingredients: {', '.join(p['ingredients'])}. "
-            f"Price: ${p['price']:.2f}. Rating: {p['rating']}."
-        )
-        texts.append(text)
+    texts = [product_text(p) for p in products]
 
     print(f"Generating embeddings for {len(products)} products...")
     vectors = embeddings.embed_documents(texts)
@@ -60,6 +66,7 @@ def seed_products():
     print("Dropped test.products collection.")
     collection.insert_many(products)
     print(f"Inserted {len(products)} products into test.products.")
+    return products
 
 
 def seed_about():
@@ -85,15 +92,31 @@ def seed_about():
     print("Dropped test.about collection.")
     collection.insert_one(doc)
     print("Inserted 1 document into test.about.")
+    return doc
+
+
+def save_vector_index(products, about):
+    """Write the in-memory retrieval snapshot used by DetailsAgent."""
+    index = VectorIndex.from_documents({"products": products, "about": [about]})
+    index.save()
+    print("Saved in-memory vector index snapshot.")
 
 
 def main():
     print("=== Seeding test.products ===")
-    seed_products()
+    products = seed_products()
     print()
     print("=== Seeding test.about ===")
-    seed_about()
+    about = seed_about()
+    print()
+    print("=== Saving vector index snapshot ===")
+    save_vector_index(products, about)
     print()
+    stats = embeddings.stats()
+    print(
+        f"Embedding cache: {stats['hits'] + stats['disk_hits']} reused, "
+        f"{stats['misses']} generated."
+    )
     print("All done!")
 
 
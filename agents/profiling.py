@@ -0,0 +1,116 @@
+"""
+Sampling profiler for slow requests.
+
+A sampled fraction of requests (``PROFILE_SAMPLE_RATE``) runs under a
+background thread that records the stacks of every thread in the process
+every ``PROFILE_INTERVAL_MS``. When such a request takes at least
+``PROFILE_SLOW_MS``, the stacks are written to ``PROFILE_DIR`` in the
+collapsed ("folded") format read by flamegraph.pl and speedscope.
+
+Requests share the event loop and the pipeline threads, so a profile also
+holds whatever else the process was doing at the time.
+"""
+
+import collections
+import itertools
+import logging
+import os
+import pathlib
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests profiled; 0 turns profiling off.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 1000))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR",
+    os.path.join(pathlib.Path(__file__).parent.resolve(), "data/profiles"),
+)
+
+# One profile at a time keeps the sampling overhead bounded.
+_profiling = threading.Lock()
+_sequence = itertools.count()
+
+
+class SamplingProfiler:
+    """Counts the stacks of all threads, sampled from a background thread."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.samples = 0
+        self.stacks: collections.Counter = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        names = {}
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    filename = os.path.basename(code.co_filename)
+                    frames.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def maybe_profile(name: str):
+    """Profile the block for a sampled fraction of calls; keep it if slow."""
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        yield
+        return
+    if not _profiling.acquire(blocking=False):
+        yield
+        return
+
+    profiler = SamplingProfiler()
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        _profiling.release()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms >= PROFILE_SLOW_MS and profiler.samples:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            path = os.path.join(
+                PROFILE_DIR, f"{name}-{stamp}-{os.getpid()}-{next(_sequence)}.folded"
+            )
+            profiler.write(path)
+            logger.warning(
+                "Slow %s request took %.0f ms; profile written to %s",
+                name,
+                elapsed_ms,
+                path,
+            )
@@ -0,0 +1,97 @@
+"""
+Mine the recommendation data files from transaction logs.
+
+Usage:
+    python scripts/mine_recommendations.py logs/*.csv [--state data/basket_counts]
+        [--workers 4] [--min-support 0.001] [--min-confidence 0.1] [--min-lift 1.0]
+        [--rules-out rules.csv] [--rebuild]
+
+Each log is a CSV of line items with ``transaction_id`` and ``product``
+columns and optionally ``product_category`` (otherwise the catalog category
+is used); rows of one transaction must be contiguous. Counts are kept in the
+``--state`` snapshot, so re-running over a directory of daily logs only reads
+the days not counted yet. Writes ``data/apriori_recommendations.json`` and
+``data/popularity_recommendation.csv`` in the format RecommendationAgent
+loads, and optionally every product and category rule with support,
+confidence and lift.
+"""
+
+import argparse
+import os
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agents.basket_mining import (  # noqa: E402
+    CHUNK_ROWS,
+    SPLIT_BYTES,
+    BasketCounts,
+    count_files,
+)
+from agents.catalog import Catalog  # noqa: E402
+
+DATA_DIR = pathlib.Path(__file__).parent.parent / "data"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("logs", nargs="+")
+    parser.add_argument("--state", default=str(DATA_DIR / "basket_counts"))
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--split-bytes", type=int, default=SPLIT_BYTES)
+    parser.add_argument("--min-support", type=float, default=0.001)
+    parser.add_argument("--min-confidence", type=float, default=0.1)
+    parser.add_argument("--min-lift", type=float, default=1.0)
+    parser.add_argument(
+        "--apriori-out", default=str(DATA_DIR / "apriori_recommendations.json")
+    )
+    parser.add_argument(
+        "--popularity-out", default=str(DATA_DIR / "popularity_recommendation.csv")
+    )
+    parser.add_argument("--rules-out")
+    args = parser.parse_args()
+
+    counts = None
+    if not args.rebuild and os.path.exists(args.state + ".json"):
+        counts = BasketCounts.load(args.state)
+    before = counts.transactions if counts else 0
+
+    categories = {
+        product["name"]: product["category"] for product in Catalog().products
+    }
+    start = time.perf_counter()
+    counts = count_files(
+        [os.path.abspath(path) for path in args.logs],
+        counts,
+        workers=args.workers,
+        chunk_rows=args.chunk_rows,
+        split_bytes=args.split_bytes,
+        categories=categories,
+    )
+    elapsed = time.perf_counter() - start
+    counts.save(args.state)
+
+    counts.write_apriori_recommendations(
+        args.apriori_out,
+        min_support=args.min_support,
+        min_confidence=args.min_confidence,
+        min_lift=args.min_lift,
+    )
+    counts.write_popularity(args.popularity_out)
+    if args.rules_out:
+        counts.write_rules(args.rules_out, args.min_support)
+
+    added = counts.transactions - before
+    print(
+        f"Counted {added} new transactions in {elapsed:.1f}s "
+        f"({counts.transactions} total, {len(counts.products)} products)"
+    )
+    print(f"Wrote {args.apriori_out} and {args.popularity_out}")
+
+
+if __name__ == "__main__":
+    main()
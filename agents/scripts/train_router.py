@@ -0,0 +1,77 @@
+"""
+Train the local classification router from logged LLM routing decisions.
+
+Usage:
+    python scripts/train_router.py router_log.jsonl [--output data/router_model.json]
+
+The log is the JSONL written by ClassificationAgent when ROUTER_LOG_PATH is
+set: one ``{"messages": [...], "decision": agent}`` object per turn. A fifth
+of the records is held out to report accuracy and how many turns the router
+would answer at the configured confidence threshold; the saved model is then
+trained on every record.
+"""
+
+import argparse
+import json
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from agents.classification_agent import (  # noqa: E402
+    ROUTER_CONFIDENCE_THRESHOLD,
+    ROUTER_MODEL_PATH,
+)
+from agents.local_router import LocalRouter  # noqa: E402
+
+
+def load_records(path):
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def evaluate(router, records, threshold):
+    answered = 0
+    correct = 0
+    correct_answered = 0
+    for record in records:
+        agent, confidence = router.predict(record["messages"])
+        correct += agent == record["decision"]
+        if confidence >= threshold:
+            answered += 1
+            correct_answered += agent == record["decision"]
+    total = len(records)
+    return {
+        "holdout_records": total,
+        "accuracy": correct / total if total else 0.0,
+        "coverage": answered / total if total else 0.0,
+        "accuracy_when_answered": correct_answered / answered if answered else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("log")
+    parser.add_argument("--output", default=ROUTER_MODEL_PATH)
+    parser.add_argument("--threshold", type=float, default=ROUTER_CONFIDENCE_THRESHOLD)
+    args = parser.parse_args()
+
+    records = load_records(args.log)
+    train = [record for i, record in enumerate(records) if i % 5]
+    holdout = [record for i, record in enumerate(records) if not i % 5]
+
+    report = evaluate(LocalRouter.train(train), holdout, args.threshold)
+    report["threshold"] = args.threshold
+    print(json.dumps(report, indent=2))
+
+    LocalRouter.train(records).save(args.output)
+    print(f"Saved router trained on {len(records)} records to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# "memory" keeps sessions in this process, "sqlite" in a local file shared by
+# every worker on the host, "redis" in any Redis-compatible server.
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_TTL = float(os.getenv("SESSION_TTL", 1800))
+SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", 10000))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", 100))
+SESSION_STORE_PATH = os.getenv(
+    "SESSION_STORE_PATH",
+    str(pathlib.Path(__file__).parent / "data" / "sessions.sqlite"),
+)
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+
+
+def _is_order_message(message: Dict[str, Any]) -> bool:
+    agent = (message.get("memory") or {}).get("agent")
+    return message["role"] == "assistant" and agent == "order_taking_agent"
+
+
+class MemorySessionBackend:
+    """Bounded LRU of sessions with a sliding TTL.
+
+    Every read or write moves a session to the end, so the front always
+    holds the least recently used one and expired sessions are dropped from
+    the front as new ones are written.
+    """
+
+    def __init__(self, max_entries: int = SESSION_STORE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: str, ttl: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            session, expires = entry
+            if expires < now:
+                del self._entries[session_id]
+                return None
+            self._entries[session_id] = (session, now + ttl)
+            self._entries.move_to_end(session_id)
+            return session
+
+    def set(self, session_id: str, session: Dict[str, Any], ttl: float):
+        with self._lock:
+            self._set(session_id, session, ttl, time.time())
+
+    def compare_and_set(
+        self, session_id: str, version: int, session: Dict[str, Any], ttl: float
+    ) -> bool:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if (
+                entry is not None
+                and entry[1] >= now
+                and entry[0].get("version", 0) != version
+            ):
+                return False
+            self._set(session_id, session, ttl, now)
+        return True
+
+    def _set(self, session_id: str, session: Dict[str, Any], ttl: float, now: float):
+        self._entries[session_id] = (session, now + ttl)
+        self._entries.move_to_end(session_id)
+        while self._entries:
+            _, expires = next(iter(self._entries.values()))
+            if expires >= now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteSessionBackend:
+    """Sessions in a local SQLite file, shared by every worker on the host."""
+
+    # Expired and excess rows are swept every this many writes.
+    SWEEP_EVERY = 100
+
+    def __init__(
+        self, path: str = SESSION_STORE_PATH, max_entries: int = SESSION_STORE_SIZE
+    ):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.evictions = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, value TEXT, expires REAL, "
+                "version INTEGER DEFAULT 0)"
+            )
+            columns = [
+                row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")
+            ]
+            if "version" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE sessions ADD COLUMN version INTEGER DEFAULT 0"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)"
+            )
+
+    def get(self, session_id: str, ttl: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires, version FROM sessions WHERE id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None or row[1] < now:
+                return None
+            self._conn.execute(
+                "UPDATE sessions SET expires = ? WHERE id = ?", (now + ttl, session_id)
+            )
+        return {**json.loads(row[0]), "version": row[2]}
+
+    def set(self, session_id: str, session: Dict[str, Any], ttl: float):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                (
+                    session_id,
+                    json.dumps(session),
+                    now + ttl,
+                    session.get("version", 0),
+                ),
+            )
+            self._written(now)
+
+    def compare_and_set(
+        self, session_id: str, version: int, session: Dict[str, Any], ttl: float
+    ) -> bool:
+        now = time.time()
+        with self._lock, self._conn:
+            # The UPDATE takes the database's write lock, so no other worker
+            # can write the session between it and the INSERT.
+            updated = self._conn.execute(
+                "UPDATE sessions SET value = ?, expires = ?, version = ? "
+                "WHERE id = ? AND (version = ? OR expires < ?)",
+                (
+                    json.dumps(session),
+                    now + ttl,
+                    session["version"],
+                    session_id,
+                    version,
+                    now,
+                ),
+            ).rowcount
+            if not updated:
+                updated = self._conn.execute(
+                    "INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?)",
+                    (session_id, json.dumps(session), now + ttl, session["version"]),
+                ).rowcount
+            if updated:
+                self._written(now)
+        return bool(updated)
+
+    def _written(self, now: float):
+        self._writes += 1
+        if self._writes % self.SWEEP_EVERY == 0:
+            self._sweep(now)
+
+    def _sweep(self, now: float):
+        removed = self._conn.execute(
+            "DELETE FROM sessions WHERE expires < ?", (now,)
+        ).rowcount
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        if count > self.max_entries:
+            removed += self._conn.execute(
+                "DELETE FROM sessions WHERE id IN "
+                "(SELECT id FROM sessions ORDER BY expires LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        self.evictions += removed
+
+    def delete(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class RedisSessionBackend:
+    """Sessions in a Redis-compatible server; expiry is Redis' own TTL.
+
+    The memory bound is the server's ``maxmemory`` with an LRU eviction
+    policy. Needs the optional ``redis`` package.
+    """
+
+    def __init__(self, url: str = SESSION_REDIS_URL, prefix: str = "session:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError(
+                "SESSION_STORE=redis needs the redis package: pip install redis"
+            ) from e
+        self.prefix = prefix
+        self.evictions = 0
+        self._client = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def get(self, session_id: str, ttl: float) -> Optional[Dict[str, Any]]:
+        key = self.prefix + session_id
+        value = self._client.getex(key, ex=int(ttl))
+        return None if value is None else json.loads(value)
+
+    def set(self, session_id: str, session: Dict[str, Any], ttl: float):
+        self._client.set(self.prefix + session_id, json.dumps(session), ex=int(ttl))
+
+    def compare_and_set(
+        self, session_id: str, version: int, session: Dict[str, Any], ttl: float
+    ) -> bool:
+        key = self.prefix + session_id
+        with self._client.pipeline() as pipe:
+            try:
+                # The transaction fails if another worker writes the key
+                # after WATCH.
+                pipe.watch(key)
+                current = pipe.get(key)
+                stored = None if current is None else json.loads(current)
+                if stored is not None and stored.get("version", 0) != version:
+                    return False
+                pipe.multi()
+                pipe.set(key, json.dumps(session), ex=int(ttl))
+                pipe.execute()
+            except self._watch_error:
+                return False
+        return True
+
+    def delete(self, session_id: str):
+        self._client.delete(self.prefix + session_id)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(self.prefix + "*"))
+
+
+def make_backend(kind: str = SESSION_STORE):
+    if kind == "memory":
+        return MemorySessionBackend()
+    if kind == "sqlite":
+        return SqliteSessionBackend()
+    if kind == "redis":
+        return RedisSessionBackend()
+    raise ValueError(f"Unknown SESSION_STORE {kind!r}")
+
+
+class SessionStore:
+    """Server-side conversation history, keyed by session id.
+
+    A session is ``{"messages": [...], "version": n}``. History is capped at
+    ``max_messages``; the latest order-taking reply, which carries the
+    current order state, is kept at the front when older turns are dropped,
+    so the order agent still finds the order after trimming.
+
+    Turns are written with a compare-and-set on ``version``. When another
+    worker recorded a turn for the session in the meantime, the turn is
+    applied again on top of the stored session instead of overwriting it.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        ttl: float = SESSION_TTL,
+        max_messages: int = SESSION_MAX_MESSAGES,
+    ):
+        self.backend = backend if backend is not None else make_backend()
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    def create(self) -> str:
+        session_id = uuid.uuid4().hex
+        self.backend.set(session_id, {"messages": [], "version": 0}, self.ttl)
+        return session_id
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.backend.get(session_id, self.ttl)
+
+    def history(
+        self, session: Dict[str, Any], message: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Messages to hand to the agents for ``message`` in ``session``."""
+        return session["messages"] + [message]
+
+    def record_turn(
+        self,
+        session_id: str,
+        session: Dict[str, Any],
+        message: Dict[str, Any],
+        response: Dict[str, Any],
+    ):
+        reply = {
+            "role": "assistant",
+            "content": response["content"],
+            "memory": response["memory"],
+        }
+        while True:
+            version = session.get("version", 0)
+            updated = self._apply_turn(session, message, reply)
+            if self.backend.compare_and_set(session_id, version, updated, self.ttl):
+                return
+            session = self.load(session_id) or {"messages": []}
+
+    def _apply_turn(
+        self,
+        session: Dict[str, Any],
+        message: Dict[str, Any],
+        reply: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        messages = session["messages"] + [message, reply]
+        if len(messages) > self.max_messages:
+            kept = messages[-self.max_messages :]
+            if not any(map(_is_order_message, kept)):
+                order_message = next(
+                    (m for m in reversed(messages) if _is_order_message(m)), None
+                )
+                if order_message is not None:
+                    kept = [order_message] + kept[1:]
+            messages = kept
+
+        return {"messages": messages, "version": session.get("version", 0) + 1}
+
+    def delete(self, session_id: str):
+        self.backend.delete(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "sessions": len(self.backend),
+            "evictions": self.backend.evictions,
+            "ttl": self.ttl,
+            "max_messages": self.max_messages,
+        }
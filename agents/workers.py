@@ -0,0 +1,152 @@
+"""
+Pre-forking launcher that serves the agents app from several processes.
+
+The parent binds the port, imports the agent pipeline and loads the shared
+data snapshot, then forks ``AGENT_WORKERS`` uvicorn workers that accept on
+the same socket. Imported modules and the snapshot are shared between the
+workers copy-on-write, and the snapshot's rule table is a memory-mapped
+file, so each extra worker costs only what it allocates itself. Workers
+build their own controller, model clients and database connections in the
+app's lifespan, since those hold threads and sockets that do not survive a
+fork. A worker that exits is replaced until the parent is told to stop.
+"""
+
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Dict, Union
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before replacing a worker that exited.
+RESTART_DELAY = 1.0
+# Exit status of a worker whose app failed to start. Replacing it would
+# fail the same way, so the launcher stops instead.
+WORKER_BOOT_ERROR = 3
+
+# /proc/<pid>/smaps_rollup fields reported by memory_usage().
+_MEMORY_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared",
+    "Shared_Dirty": "shared",
+    "Private_Clean": "private",
+    "Private_Dirty": "private",
+}
+
+
+def memory_usage(pid: Union[int, str] = "self") -> Dict[str, int]:
+    """Resident memory of a process in bytes: rss, pss, shared and private.
+
+    ``pss`` (proportional set size) splits each shared page between the
+    processes mapping it, so the workers' ``pss`` add up to what they use
+    together. Empty where ``/proc`` is unavailable.
+    """
+    usage: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                kind = _MEMORY_FIELDS.get(name)
+                if kind is not None:
+                    usage[kind] = usage.get(kind, 0) + int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return usage
+
+
+def preload():
+    """Import the pipeline and load the read-only data before forking."""
+    import agent_controller  # noqa: F401
+    from agents.data_snapshot import shared_snapshot
+
+    shared_snapshot()
+    # Keep the collector off the preloaded objects, so a collection in a
+    # worker does not write to (and so copy) the pages they share.
+    gc.collect()
+    gc.freeze()
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    # Connections queue here until the workers start accepting.
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app: str, sock: socket.socket, **config) -> int:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(app, **config))
+    server.run(sockets=[sock])
+    return 0 if server.started else WORKER_BOOT_ERROR
+
+
+def serve(app: str, host: str, port: int, workers: int, **config):
+    """Run ``app`` (an import string such as ``"main:app"``) in ``workers``
+    forked processes, restarting any that exit, until SIGTERM or SIGINT.
+
+    Returns the launcher's exit status: 1 if a worker failed to start.
+    """
+    sock = bind(host, port)
+    preload()
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = _run_worker(app, sock, **config)
+            except BaseException:
+                logger.exception("Worker %d failed", os.getpid())
+            finally:
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    logger.info("Serving on %s:%d with %d workers", host, port, workers)
+
+    exit_code = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if stopping:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        if code == WORKER_BOOT_ERROR:
+            logger.error("Worker %d failed to start, shutting down", pid)
+            exit_code = 1
+            stop(None, None)
+            continue
+        logger.warning("Worker %d exited with %d, restarting", pid, code)
+        time.sleep(RESTART_DELAY)
+        if not stopping:
+            spawn()
+    sock.close()
+    return exit_code
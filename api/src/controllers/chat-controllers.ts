@@ -9,7 +9,7 @@ export const createChatCompletion = async (
   res: Response,
   next: NextFunction,
 ) => {
-  const { messages } = req.body;
+  const { messages, message, session_id } = req.body;
   if (!res.locals.user) {
     return res.status(401).json({ message: "Unauthorized, not authenticated" });
   }
@@ -18,7 +18,7 @@ export const createChatCompletion = async (
     const agentResponse = await fetch(`${AGENTS_URL}/chat`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ messages }),
+      body: JSON.stringify({ messages, message, session_id }),
     });
 
     if (!agentResponse.ok) {
@@ -40,7 +40,7 @@ export const createChatCompletionStream = async (
   res: Response,
   next: NextFunction,
 ) => {
-  const { messages } = req.body;
+  const { messages, message, session_id } = req.body;
   if (!res.locals.user) {
     return res.status(401).json({ message: "Unauthorized, not authenticated" });
   }
@@ -49,7 +49,7 @@ export const createChatCompletionStream = async (
     const agentResponse = await fetch(`${AGENTS_URL}/chat/stream`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ messages }),
+      body: JSON.stringify({ messages, message, session_id }),
     });
 
     if (!agentResponse.ok) {